@@ -0,0 +1,101 @@
+"""
+HNSW ef vs latency and recall, and what a latency budget buys.
+
+First sweeps the controller's ef levels (HNSW_EF_LEVELS) with plain dense
+searches and reports recall@k vs exact search and p50/p99 latency per ef;
+the observed latencies train an EfController the way the apps do. Then, for
+each --budgets value, lets the controller choose ef per query (learning as
+it goes) and reports the ef it settled on, recall, p50/p99 and the share of
+searches that finished within the budget.
+
+Usage:
+    uv run python benchmarks/adaptive_ef.py
+    uv run python benchmarks/adaptive_ef.py --queries 200 --budgets 2,5,10,20
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import SearchParams
+
+from shared.embeddings import init_embeddings, get_embeddings
+from shared.ef_controller import EfController
+
+EMBED_MODEL_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "models", "nomic-embed-text", "nomic-embed-text-v1.5.f16.gguf"
+)
+
+
+def search_ids(qdrant, collection, vector, k, params: SearchParams) -> tuple[list, float]:
+    t0 = time.perf_counter()
+    result = qdrant.query_points(
+        collection_name=collection, query=vector, limit=k, search_params=params, with_payload=False,
+    )
+    return [p.id for p in result.points], (time.perf_counter() - t0) * 1000
+
+
+def summarize(latencies: list[float]) -> tuple[float, float]:
+    latencies = sorted(latencies)
+    return statistics.median(latencies), latencies[max(0, int(len(latencies) * 0.99) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HNSW ef latency/recall and budgeted ef selection")
+    parser.add_argument("--collection", default="DocumentChunk_text")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--budgets", default="2,5,10,20,50", help="Comma-separated budget_ms values")
+    args = parser.parse_args()
+
+    qdrant = QdrantClient(url=os.environ["QDRANT_URL"], api_key=os.environ["QDRANT_API_KEY"])
+    init_embeddings(EMBED_MODEL_PATH)
+
+    points, _ = qdrant.scroll(collection_name=args.collection, limit=args.queries, with_payload=True, with_vectors=False)
+    vectors = get_embeddings([str((p.payload or {}).get("text", ""))[:300] for p in points])
+    print(f"{len(vectors)} queries against {args.collection}, recall@{args.k} vs exact search\n")
+
+    truth = [set(search_ids(qdrant, args.collection, v, args.k, SearchParams(exact=True))[0]) for v in vectors]
+    controller = EfController("benchmark")
+
+    print(f"{'hnsw_ef':>8} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for ef in controller.levels:
+        recalls, latencies = [], []
+        for vector, expected in zip(vectors, truth):
+            ids, ms = search_ids(qdrant, args.collection, vector, args.k, SearchParams(hnsw_ef=ef))
+            controller.record(ef, ms)
+            recalls.append(len(expected & set(ids)) / args.k)
+            latencies.append(ms)
+        p50, p99 = summarize(latencies)
+        print(f"{ef:>8} {statistics.mean(recalls):>7.3f} {p50:>8.1f} {p99:>8.1f}")
+
+    print(f"\n{'budget':>7} {'ef (most used)':>15} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8} {'in budget':>10}")
+    for budget in (float(b) for b in args.budgets.split(",")):
+        recalls, latencies, chosen = [], [], Counter()
+        for vector, expected in zip(vectors, truth):
+            params, hnsw = controller.choose(budget_ms=budget)
+            ids, ms = search_ids(qdrant, args.collection, vector, args.k, params)
+            controller.record(hnsw["hnsw_ef"], ms)
+            chosen[hnsw["hnsw_ef"]] += 1
+            recalls.append(len(expected & set(ids)) / args.k)
+            latencies.append(ms)
+        p50, p99 = summarize(latencies)
+        within = sum(ms <= budget for ms in latencies) / len(latencies)
+        print(
+            f"{budget:>7.1f} {chosen.most_common(1)[0][0]:>15} {statistics.mean(recalls):>7.3f} "
+            f"{p50:>8.1f} {p99:>8.1f} {within:>10.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
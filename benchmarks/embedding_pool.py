@@ -0,0 +1,97 @@
+"""
+Benchmark local embedding throughput vs pool size and threads per instance.
+
+Loads nomic-embed-text with each (EMBED_INSTANCES, EMBED_N_THREADS) combination
+that fits on this machine, fires concurrent single-query embeds through
+aget_embedding (micro-batching on, cache off) and reports queries/sec and
+latency percentiles.
+
+Usage:
+    uv run python benchmarks/embedding_pool.py
+    uv run python benchmarks/embedding_pool.py --instances 1,2,4,8 --threads 2,4,8 --queries 2000
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ["EMBED_MODE"] = "local"
+os.environ["EMBED_CACHE"] = "false"
+os.environ.pop("EMBED_STORE_PATH", None)
+
+import shared.embeddings as embeddings
+
+EMBED_MODEL_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "models", "nomic-embed-text", "nomic-embed-text-v1.5.f16.gguf"
+)
+
+QUERIES = [
+    "laptop purchases", "office chairs from vendor V001", "invoices over $10,000",
+    "monitor and keyboard bundles", "transactions in March", "printer toner supplies",
+    "network switches", "software licenses renewal", "standing desks", "USB-C docking stations",
+]
+
+
+async def run(n_queries: int, concurrency: int) -> list[float]:
+    latencies = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with sem:
+            t0 = time.perf_counter()
+            # Unique text per call so nothing is deduplicated
+            await embeddings.aget_embedding(f"{QUERIES[i % len(QUERIES)]} #{i}")
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    await asyncio.gather(*(one(i) for i in range(n_queries)))
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding pool throughput benchmark")
+    parser.add_argument("--instances", default="1,2,4", help="Comma-separated pool sizes")
+    parser.add_argument("--threads", default="1,2,4,8", help="Comma-separated threads per instance")
+    parser.add_argument("--queries", type=int, default=1000, help="Queries per configuration")
+    parser.add_argument("--concurrency", type=int, default=64, help="Concurrent in-flight queries")
+    parser.add_argument("--model", default=EMBED_MODEL_PATH, help="Path to the GGUF embedding model")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    print(f"{cores} cores, {args.queries} queries/config, concurrency {args.concurrency}\n")
+    print(f"{'instances':>9} {'threads':>7} {'q/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'avg batch':>9}")
+
+    for instances in [int(x) for x in args.instances.split(",")]:
+        for threads in [int(x) for x in args.threads.split(",")]:
+            if instances * threads > cores:
+                continue
+            os.environ["EMBED_INSTANCES"] = str(instances)
+            os.environ["EMBED_N_THREADS"] = str(threads)
+            embeddings._local_models = []
+            embeddings._local_model = None
+            embeddings._batcher = None
+            gc.collect()
+            embeddings.init_embeddings(args.model)
+
+            asyncio.run(run(min(50, args.queries), args.concurrency))  # warm-up
+            embeddings._batcher = None
+            t0 = time.perf_counter()
+            latencies = asyncio.run(run(args.queries, args.concurrency))
+            elapsed = time.perf_counter() - t0
+
+            latencies.sort()
+            p99 = latencies[int(len(latencies) * 0.99) - 1]
+            batch = embeddings.get_embedding_stats()["microbatch"]["avg_batch_size"]
+            print(
+                f"{instances:>9} {threads:>7} {args.queries / elapsed:>8.1f} "
+                f"{statistics.median(latencies):>8.1f} {p99:>8.1f} {batch:>9}"
+            )
+
+
+if __name__ == "__main__":
+    main()
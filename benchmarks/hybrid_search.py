@@ -0,0 +1,135 @@
+"""
+Hybrid (dense + BM25 sparse) vs dense retrieval: known-item recall and latency.
+
+Builds known-item queries from stored chunks and checks whether the source
+chunk is retrieved:
+    id   - an identifier from the chunk (e.g. "INV-2026-001"), the case
+           where dense embeddings are weakest
+    text - the first words of the chunk
+and compares these searches, as issued by /search:
+    dense   - plain dense query (use_fusion=false)
+    fusion  - two dense prefetches fused with RRF (the non-hybrid default)
+    sparse  - BM25 sparse vector only
+    hybrid  - dense + BM25 prefetches fused with RRF
+reporting recall@k, MRR and p50/p99 search latency.
+
+Build the sparse vectors and statistics first with
+cognee-pipeline/backfill_sparse.py.
+
+Usage:
+    uv run python benchmarks/hybrid_search.py
+    uv run python benchmarks/hybrid_search.py --collection DocumentChunk_text --queries 200 --k 10
+"""
+
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import Fusion, FusionQuery, Prefetch
+
+from shared.embeddings import init_embeddings, get_embeddings
+from shared.sparse import SPARSE_VECTOR_NAME, BM25Stats, default_stats_path
+
+EMBED_MODEL_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "models", "nomic-embed-text", "nomic-embed-text-v1.5.f16.gguf"
+)
+
+IDENTIFIER_RE = re.compile(r"\b[A-Z]{1,5}-?\d[A-Z0-9-]*\b")
+
+
+def known_items(qdrant: QdrantClient, collection: str, n: int) -> dict[str, list]:
+    """(query, source point id) pairs per query type."""
+    points, _ = qdrant.scroll(collection_name=collection, limit=n, with_payload=True, with_vectors=False)
+    items = {"id": [], "text": []}
+    for p in points:
+        text = str((p.payload or {}).get("text", ""))
+        if not text:
+            continue
+        identifiers = IDENTIFIER_RE.findall(text)
+        if identifiers:
+            items["id"].append((identifiers[0], p.id))
+        items["text"].append((" ".join(text.split()[:12]), p.id))
+    return items
+
+
+def search_ids(qdrant, collection, config, vector, sparse, k) -> tuple[list, float]:
+    if config == "dense":
+        kwargs = {"query": vector}
+    elif config == "fusion":
+        kwargs = {
+            "prefetch": [Prefetch(query=vector, limit=100), Prefetch(query=vector, limit=50)],
+            "query": FusionQuery(fusion=Fusion.RRF),
+        }
+    elif config == "sparse":
+        kwargs = {"query": sparse, "using": SPARSE_VECTOR_NAME}
+    else:
+        kwargs = {
+            "prefetch": [
+                Prefetch(query=vector, limit=100),
+                Prefetch(query=sparse, using=SPARSE_VECTOR_NAME, limit=100),
+            ],
+            "query": FusionQuery(fusion=Fusion.RRF),
+        }
+    t0 = time.perf_counter()
+    result = qdrant.query_points(collection_name=collection, limit=k, with_payload=False, **kwargs)
+    return [p.id for p in result.points], (time.perf_counter() - t0) * 1000
+
+
+def report(kind, config, ranks, latencies):
+    latencies.sort()
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+    recall = sum(1 for r in ranks if r is not None) / len(ranks)
+    mrr = sum(1 / r for r in ranks if r is not None) / len(ranks)
+    print(
+        f"{kind:>5} {config:>7} {len(ranks):>7} {recall:>9.3f} {mrr:>7.3f} "
+        f"{statistics.median(latencies):>8.1f} {p99:>8.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hybrid vs dense known-item retrieval benchmark")
+    parser.add_argument("--collection", default="DocumentChunk_text")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--stats-path", default=default_stats_path())
+    args = parser.parse_args()
+
+    qdrant = QdrantClient(url=os.environ["QDRANT_URL"], api_key=os.environ["QDRANT_API_KEY"])
+    sparse_config = qdrant.get_collection(args.collection).config.params.sparse_vectors or {}
+    stats = BM25Stats.load(args.stats_path)
+    if SPARSE_VECTOR_NAME not in sparse_config or stats is None:
+        print(f"ERROR: {args.collection} has no BM25 vectors or statistics; run cognee-pipeline/backfill_sparse.py")
+        sys.exit(1)
+    init_embeddings(EMBED_MODEL_PATH)
+
+    items = known_items(qdrant, args.collection, args.queries)
+    print(f"Known-item queries against {args.collection}, recall@{args.k} of the source chunk\n")
+    print(f"{'query':>5} {'config':>7} {'queries':>7} {'recall':>9} {'MRR':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for kind, pairs in items.items():
+        if not pairs:
+            print(f"{kind:>5} no queries of this kind in the sample")
+            continue
+        queries = [q for q, _ in pairs]
+        vectors = get_embeddings(queries)
+        sparse = [stats.query_vector(q) for q in queries]
+        for config in ("dense", "fusion", "sparse", "hybrid"):
+            ranks, latencies = [], []
+            for (_, source), vector, sparse_vector in zip(pairs, vectors, sparse):
+                ids, ms = search_ids(qdrant, args.collection, config, vector, sparse_vector, args.k)
+                ranks.append(ids.index(source) + 1 if source in ids else None)
+                latencies.append(ms)
+            report(kind, config, ranks, latencies)
+
+
+if __name__ == "__main__":
+    main()
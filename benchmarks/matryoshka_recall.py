@@ -0,0 +1,108 @@
+"""
+Recall vs latency for Matryoshka-truncated collections.
+
+For a sample of queries, compares these searches against exact (brute-force)
+full-dimension results:
+    full   - HNSW on the original 768-d collection
+    <dim>  - HNSW on "<collection>_<dim>" with truncated query vectors
+and reports recall@k, p50/p99 search latency and raw vector memory.
+
+Create the truncated collections first with cognee-pipeline/migrate_matryoshka.py.
+
+Usage:
+    uv run python benchmarks/matryoshka_recall.py --dims 256,512
+    uv run python benchmarks/matryoshka_recall.py --collection TextSummary_text --queries 200 --k 10
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.pop("EMBED_DIM", None)  # embed at full dimension, truncate per configuration below
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import SearchParams
+
+from shared.embeddings import init_embeddings, get_embeddings, truncate_embedding
+
+EMBED_MODEL_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "models", "nomic-embed-text", "nomic-embed-text-v1.5.f16.gguf"
+)
+
+
+def sample_queries(qdrant: QdrantClient, collection: str, n: int) -> list[str]:
+    """Use stored payload texts as realistic queries."""
+    points, _ = qdrant.scroll(collection_name=collection, limit=n, with_payload=True, with_vectors=False)
+    return [str((p.payload or {}).get("text", ""))[:300] for p in points if (p.payload or {}).get("text")]
+
+
+def search_ids(qdrant, collection, vector, k, exact=False) -> tuple[list, float]:
+    t0 = time.perf_counter()
+    result = qdrant.query_points(
+        collection_name=collection,
+        query=vector,
+        limit=k,
+        search_params=SearchParams(exact=exact),
+        with_payload=False,
+    )
+    return [p.id for p in result.points], (time.perf_counter() - t0) * 1000
+
+
+def report(name, dim, points, recalls, latencies):
+    latencies.sort()
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+    memory_mb = points * dim * 4 / 1024 / 1024
+    print(
+        f"{name:>8} {dim:>5} {statistics.mean(recalls):>9.3f} "
+        f"{statistics.median(latencies):>8.1f} {p99:>8.1f} {memory_mb:>10.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Matryoshka recall/latency benchmark")
+    parser.add_argument("--collection", default="DocumentChunk_text")
+    parser.add_argument("--dims", default="256,512", help="Comma-separated truncated dimensions")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    qdrant = QdrantClient(url=os.environ["QDRANT_URL"], api_key=os.environ["QDRANT_API_KEY"])
+    init_embeddings(EMBED_MODEL_PATH)
+
+    texts = sample_queries(qdrant, args.collection, args.queries)
+    vectors = get_embeddings(texts)
+    points = qdrant.get_collection(args.collection).points_count
+    print(f"{len(texts)} queries against {args.collection} ({points} points), recall@{args.k} vs exact 768-d\n")
+
+    truth = [set(search_ids(qdrant, args.collection, v, args.k, exact=True)[0]) for v in vectors]
+
+    print(f"{'config':>8} {'dim':>5} {'recall':>9} {'p50 ms':>8} {'p99 ms':>8} {'vectors MB':>10}")
+    recalls, latencies = [], []
+    for vector, expected in zip(vectors, truth):
+        ids, ms = search_ids(qdrant, args.collection, vector, args.k)
+        recalls.append(len(expected & set(ids)) / args.k)
+        latencies.append(ms)
+    report("full", 768, points, recalls, latencies)
+
+    for dim in [int(d) for d in args.dims.split(",")]:
+        target = f"{args.collection}_{dim}"
+        if not qdrant.collection_exists(target):
+            print(f"{'':>8} {dim:>5} missing {target}; run migrate_matryoshka.py --dim {dim}")
+            continue
+        recalls, latencies = [], []
+        for vector, expected in zip(vectors, truth):
+            ids, ms = search_ids(qdrant, target, truncate_embedding(vector, dim), args.k)
+            recalls.append(len(expected & set(ids)) / args.k)
+            latencies.append(ms)
+        report("trunc", dim, points, recalls, latencies)
+
+
+if __name__ == "__main__":
+    main()
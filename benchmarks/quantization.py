@@ -0,0 +1,113 @@
+"""
+Memory, latency and recall of quantized collections.
+
+Compares the original float32 collection with the "<collection>_scalar" and
+"<collection>_binary" copies, each searched with the request options the
+apps expose (default, quantization=ignore, quantization=rescore with
+--oversampling values), and reports:
+    RAM MB  - vector memory held in RAM (float32 originals, or the int8 /
+              1-bit quantized vectors; HNSW graph not included)
+    disk MB - float32 originals moved to disk
+    recall@k vs exact search on the original collection, p50/p99 latency
+
+Create the copies first:
+    cd cognee-pipeline
+    uv run python quantize_collections.py --mode scalar --copy --collections DocumentChunk_text
+    uv run python quantize_collections.py --mode binary --copy --collections DocumentChunk_text
+
+Usage:
+    uv run python benchmarks/quantization.py
+    uv run python benchmarks/quantization.py --queries 200 --oversampling 1,2,4
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import SearchParams
+
+from shared.embeddings import init_embeddings, get_embeddings
+from shared.quantization import search_params
+
+EMBED_MODEL_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "models", "nomic-embed-text", "nomic-embed-text-v1.5.f16.gguf"
+)
+
+# Bytes per dimension held in RAM for each mode
+RAM_BYTES_PER_DIM = {"none": 4, "scalar": 1, "binary": 1 / 8}
+
+
+def sample_queries(qdrant: QdrantClient, collection: str, n: int) -> list[str]:
+    """Use stored payload texts as realistic queries."""
+    points, _ = qdrant.scroll(collection_name=collection, limit=n, with_payload=True, with_vectors=False)
+    return [str((p.payload or {}).get("text", ""))[:300] for p in points if (p.payload or {}).get("text")]
+
+
+def vector_dim(qdrant: QdrantClient, collection: str) -> int:
+    vectors = qdrant.get_collection(collection).config.params.vectors
+    return next(iter(vectors.values())).size if isinstance(vectors, dict) else vectors.size
+
+
+def search_ids(qdrant, collection, vector, k, params: SearchParams | None) -> tuple[list, float]:
+    t0 = time.perf_counter()
+    result = qdrant.query_points(
+        collection_name=collection, query=vector, limit=k, search_params=params, with_payload=False,
+    )
+    return [p.id for p in result.points], (time.perf_counter() - t0) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantization memory/latency/recall benchmark")
+    parser.add_argument("--collection", default="DocumentChunk_text")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--oversampling", default="1,2,4", help="Comma-separated oversampling factors to rescore with")
+    args = parser.parse_args()
+
+    qdrant = QdrantClient(url=os.environ["QDRANT_URL"], api_key=os.environ["QDRANT_API_KEY"])
+    init_embeddings(EMBED_MODEL_PATH)
+
+    texts = sample_queries(qdrant, args.collection, args.queries)
+    vectors = get_embeddings(texts)
+    points = qdrant.get_collection(args.collection).points_count
+    dim = vector_dim(qdrant, args.collection)
+    print(f"{len(texts)} queries against {args.collection} ({points} points, {dim}-d), recall@{args.k} vs exact float32\n")
+
+    truth = [set(search_ids(qdrant, args.collection, v, args.k, SearchParams(exact=True))[0]) for v in vectors]
+
+    options = [("default", None), ("ignore", search_params("ignore"))]
+    options += [(f"rescore x{o}", search_params("rescore", float(o))) for o in args.oversampling.split(",")]
+
+    print(f"{'mode':>7} {'search':>12} {'RAM MB':>8} {'disk MB':>8} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for mode in ("none", "scalar", "binary"):
+        collection = args.collection if mode == "none" else f"{args.collection}_{mode}"
+        if not qdrant.collection_exists(collection):
+            print(f"{mode:>7} missing {collection}; run quantize_collections.py --mode {mode} --copy")
+            continue
+        ram_mb = points * dim * RAM_BYTES_PER_DIM[mode] / 1024 / 1024
+        disk_mb = 0 if mode == "none" else points * dim * 4 / 1024 / 1024
+        for name, params in (options[:1] if mode == "none" else options):
+            recalls, latencies = [], []
+            for vector, expected in zip(vectors, truth):
+                ids, ms = search_ids(qdrant, collection, vector, args.k, params)
+                recalls.append(len(expected & set(ids)) / args.k)
+                latencies.append(ms)
+            latencies.sort()
+            p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+            print(
+                f"{mode:>7} {name:>12} {ram_mb:>8.1f} {disk_mb:>8.1f} {statistics.mean(recalls):>7.3f} "
+                f"{statistics.median(latencies):>8.1f} {p99:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Filtered HNSW search latency at different selectivities.
+
+Builds amount-range filters that match roughly 1%, 5%, 20%, 50% and 100% of
+the records (from the distribution of invoice totals / transaction amounts)
+and compares, per selectivity:
+    filtered - query_points with the Range filter, served by the payload
+               index during the HNSW search (what the search endpoints do
+               for min_total/max_total)
+    client   - the old way: one large unfiltered search, filtered in Python
+reporting p50/p99 latency and how many of the k results each returns.
+
+Run cognee-pipeline/normalize_payloads.py first so the typed fields exist.
+
+Usage:
+    uv run python benchmarks/range_filter.py
+    uv run python benchmarks/range_filter.py --queries 50 --k 10 --client-limit 500
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import Filter
+
+from shared.embeddings import init_embeddings, get_embeddings
+from shared.records import record_conditions
+
+EMBED_MODEL_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "models", "nomic-embed-text", "nomic-embed-text-v1.5.f16.gguf"
+)
+
+SELECTIVITIES = [0.01, 0.05, 0.2, 0.5, 1.0]
+
+
+def record_amount(payload: dict):
+    return payload.get("total", payload.get("amount"))
+
+
+def amounts(qdrant: QdrantClient, collection: str) -> list[float]:
+    values, offset = [], None
+    while True:
+        points, offset = qdrant.scroll(
+            collection_name=collection, limit=1000, offset=offset,
+            with_payload=["total", "amount"], with_vectors=False,
+        )
+        values.extend(float(a) for p in points if (a := record_amount(p.payload or {})) is not None)
+        if offset is None or not points:
+            break
+    return sorted(values)
+
+
+def timed(fn) -> tuple[list, float]:
+    t0 = time.perf_counter()
+    points = fn()
+    return points, (time.perf_counter() - t0) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Filtered HNSW latency vs selectivity")
+    parser.add_argument("--collection", default="DocumentChunk_text")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--client-limit", type=int, default=500, help="Unfiltered results fetched for client-side filtering")
+    args = parser.parse_args()
+
+    qdrant = QdrantClient(url=os.environ["QDRANT_URL"], api_key=os.environ["QDRANT_API_KEY"])
+    values = amounts(qdrant, args.collection)
+    if not values:
+        print(f"ERROR: no typed total/amount fields in {args.collection}; run cognee-pipeline/normalize_payloads.py")
+        sys.exit(1)
+    init_embeddings(EMBED_MODEL_PATH)
+
+    points, _ = qdrant.scroll(collection_name=args.collection, limit=args.queries, with_payload=True, with_vectors=False)
+    vectors = get_embeddings([str((p.payload or {}).get("text", ""))[:300] for p in points])
+    total_points = qdrant.count(args.collection, exact=True).count
+    print(f"{len(vectors)} queries against {args.collection} ({len(values)} records), k={args.k}\n")
+
+    print(f"{'target':>7} {'actual':>7} {'method':>9} {'p50 ms':>8} {'p99 ms':>8} {'avg hits':>8}")
+    for selectivity in SELECTIVITIES:
+        # The cheapest records up to the target fraction
+        max_total = values[max(0, int(len(values) * selectivity) - 1)]
+        conditions = record_conditions(max_total=max_total)
+        query_filter = Filter(must=conditions)
+        matching = qdrant.count(args.collection, count_filter=query_filter, exact=True).count
+        for method in ("filtered", "client"):
+            latencies, hits = [], []
+            for vector in vectors:
+                if method == "filtered":
+                    result, ms = timed(lambda: qdrant.query_points(
+                        collection_name=args.collection, query=vector, query_filter=query_filter,
+                        limit=args.k, with_payload=True,
+                    ).points)
+                else:
+                    def client_filter():
+                        candidates = qdrant.query_points(
+                            collection_name=args.collection, query=vector,
+                            limit=args.client_limit, with_payload=True,
+                        ).points
+                        return [
+                            p for p in candidates
+                            if (a := record_amount(p.payload or {})) is not None and float(a) <= max_total
+                        ][:args.k]
+                    result, ms = timed(client_filter)
+                latencies.append(ms)
+                hits.append(len(result))
+            latencies.sort()
+            p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+            print(
+                f"{selectivity:>7.2f} {matching / total_points:>7.3f} {method:>9} "
+                f"{statistics.median(latencies):>8.1f} {p99:>8.1f} {statistics.mean(hits):>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
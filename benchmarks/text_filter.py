@@ -0,0 +1,107 @@
+"""
+Full-text filtered search vs post-filtering in Python.
+
+For terms of varying selectivity taken from the collection, compares:
+    indexed - query_points with a MatchText filter on "text", served by the
+              TEXT payload index during the vector search (what /search and
+              /filter do for "phrase" and +term)
+    post    - an unfiltered search for k * --overfetch candidates, filtered
+              in Python afterwards
+reporting p50/p99 latency and how many of the k results each returns (post
+filtering comes up short when few of the nearest candidates contain the term).
+
+Usage:
+    uv run python benchmarks/text_filter.py
+    uv run python benchmarks/text_filter.py --collection DocumentChunk_text --queries 50 --overfetch 10
+"""
+
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+from collections import Counter
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import FieldCondition, Filter, MatchText
+
+from shared.embeddings import init_embeddings, get_embeddings
+
+EMBED_MODEL_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "models", "nomic-embed-text", "nomic-embed-text-v1.5.f16.gguf"
+)
+
+
+def words(text: str) -> set[str]:
+    return set(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def sample_terms(texts: list[str], n_terms: int) -> list[tuple[str, float]]:
+    """Terms spread from rare to common, with the fraction of chunks containing them."""
+    df = Counter(w for t in texts for w in words(t) if len(w) > 3 and not w.isdigit())
+    ranked = sorted(df.items(), key=lambda kv: kv[1])
+    step = max(1, len(ranked) // n_terms)
+    return [(term, count / len(texts)) for term, count in ranked[::step][:n_terms]]
+
+
+def timed(fn) -> tuple[list, float]:
+    t0 = time.perf_counter()
+    points = fn()
+    return points, (time.perf_counter() - t0) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full-text filter vs Python post-filter benchmark")
+    parser.add_argument("--collection", default="DocumentChunk_text")
+    parser.add_argument("--queries", type=int, default=20, help="Query vectors per term")
+    parser.add_argument("--terms", type=int, default=6)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--overfetch", type=int, default=10, help="Candidates per result for post-filtering")
+    args = parser.parse_args()
+
+    qdrant = QdrantClient(url=os.environ["QDRANT_URL"], api_key=os.environ["QDRANT_API_KEY"])
+    init_embeddings(EMBED_MODEL_PATH)
+
+    points, _ = qdrant.scroll(collection_name=args.collection, limit=2000, with_payload=True, with_vectors=False)
+    texts = [str((p.payload or {}).get("text", "")) for p in points]
+    vectors = get_embeddings([t[:300] for t in texts[:args.queries]])
+    print(f"{len(vectors)} queries per term against {args.collection}, k={args.k}, post-filter over {args.k * args.overfetch}\n")
+
+    print(f"{'term':>16} {'selectivity':>11} {'method':>8} {'p50 ms':>8} {'p99 ms':>8} {'avg hits':>8}")
+    for term, selectivity in sample_terms(texts, args.terms):
+        text_filter = Filter(must=[FieldCondition(key="text", match=MatchText(text=term))])
+        for method in ("indexed", "post"):
+            latencies, hits = [], []
+            for vector in vectors:
+                if method == "indexed":
+                    result, ms = timed(lambda: qdrant.query_points(
+                        collection_name=args.collection, query=vector, query_filter=text_filter,
+                        limit=args.k, with_payload=True,
+                    ).points)
+                else:
+                    def post_filter():
+                        candidates = qdrant.query_points(
+                            collection_name=args.collection, query=vector,
+                            limit=args.k * args.overfetch, with_payload=True,
+                        ).points
+                        return [p for p in candidates if term in words(str((p.payload or {}).get("text", "")))][:args.k]
+                    result, ms = timed(post_filter)
+                latencies.append(ms)
+                hits.append(len(result))
+            latencies.sort()
+            p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+            print(
+                f"{term[:16]:>16} {selectivity:>11.3f} {method:>8} "
+                f"{statistics.median(latencies):>8.1f} {p99:>8.1f} {statistics.mean(hits):>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Backfill BM25 sparse vectors for hybrid search.
+
+Qdrant cannot add a vector to an existing collection, so the first run copies
+the collection into "<collection>_hybrid" with the same dense vectors plus a
+named sparse vector ("bm25") computed locally from each chunk's text (see
+shared/sparse.py). With --swap it then deletes the original and creates an
+alias with the original name pointing at the copy, so the apps and cognee
+keep using "DocumentChunk_text" unchanged. Qdrant cannot delete a collection
+and create an alias in one call (nor alias a name that is still a
+collection), so the original is only deleted once the copy holds every
+point; if the alias then cannot be created, the data is in the copy and
+re-running with --swap finishes the swap.
+
+Later runs are incremental: only points without a sparse vector (e.g. added
+by /add-knowledge) are indexed, and their terms are added to the IDF
+statistics. --rebuild-stats recounts the statistics from every point, e.g.
+after deletions.
+
+Usage:
+    cd cognee-pipeline
+    uv run python backfill_sparse.py                  # build DocumentChunk_text_hybrid
+    uv run python backfill_sparse.py --swap           # ...and swap it in under the original name
+    uv run python backfill_sparse.py                  # later: index new points only
+    uv run python backfill_sparse.py --rebuild-stats
+"""
+
+import os
+import sys
+import time
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    CreateAlias,
+    CreateAliasOperation,
+    PointStruct,
+    PointVectors,
+    SparseVectorParams,
+)
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from shared.sparse import SPARSE_VECTOR_NAME, BM25Stats, default_stats_path, tokenize
+
+QDRANT_URL = os.getenv("QDRANT_URL")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+
+
+def point_text(point) -> str:
+    return str((point.payload or {}).get("text", ""))
+
+
+def scroll_all(qdrant: QdrantClient, collection: str, batch_size: int, with_vectors=False):
+    offset = None
+    while True:
+        points, offset = qdrant.scroll(
+            collection_name=collection, limit=batch_size, offset=offset,
+            with_payload=True, with_vectors=with_vectors,
+        )
+        yield from points
+        if offset is None or not points:
+            break
+
+
+def has_sparse_vector(qdrant: QdrantClient, collection: str) -> bool:
+    sparse = qdrant.get_collection(collection).config.params.sparse_vectors or {}
+    return SPARSE_VECTOR_NAME in sparse
+
+
+def count_stats(qdrant: QdrantClient, collection: str, batch_size: int) -> BM25Stats:
+    stats = BM25Stats()
+    for point in scroll_all(qdrant, collection, batch_size):
+        stats.add(tokenize(point_text(point)))
+    return stats
+
+
+def build_hybrid_copy(qdrant: QdrantClient, source: str, stats: BM25Stats, batch_size: int) -> str:
+    """Copy source into "<source>_hybrid" with an added BM25 sparse vector."""
+    target = f"{source}_hybrid"
+    if qdrant.collection_exists(target):
+        qdrant.delete_collection(target)
+        print(f"  Deleted existing {target}")
+    config = qdrant.get_collection(source).config
+    qdrant.create_collection(
+        collection_name=target,
+        vectors_config=config.params.vectors,
+        sparse_vectors_config={SPARSE_VECTOR_NAME: SparseVectorParams()},
+        quantization_config=config.quantization_config,
+    )
+
+    copied = 0
+    batch = []
+    for point in scroll_all(qdrant, source, batch_size, with_vectors=True):
+        # Named dense vectors keep their names; an unnamed one is the "" vector
+        dense = point.vector if isinstance(point.vector, dict) else {"": point.vector}
+        vector = {**dense, SPARSE_VECTOR_NAME: stats.document_vector(point_text(point))}
+        batch.append(PointStruct(id=point.id, vector=vector, payload=point.payload))
+        if len(batch) >= batch_size:
+            qdrant.upsert(collection_name=target, points=batch)
+            copied += len(batch)
+            batch = []
+            print(f"  {target}: {copied} points", end="\r")
+    if batch:
+        qdrant.upsert(collection_name=target, points=batch)
+        copied += len(batch)
+    print(f"  {target}: {copied} points                    ")
+    return target
+
+
+def create_alias(qdrant: QdrantClient, alias: str, target: str, attempts: int = 3) -> bool:
+    for attempt in range(1, attempts + 1):
+        try:
+            qdrant.update_collection_aliases(change_aliases_operations=[
+                CreateAliasOperation(create_alias=CreateAlias(collection_name=target, alias_name=alias)),
+            ])
+            return True
+        except Exception as e:
+            print(f"  Creating alias {alias} -> {target} failed (attempt {attempt}/{attempts}): {e}")
+            if attempt < attempts:
+                time.sleep(2 ** attempt)
+    return False
+
+
+def swap_in(qdrant: QdrantClient, source: str, target: str):
+    """Replace source with an alias of the same name pointing at target."""
+    source_count = qdrant.count(source, exact=True).count
+    target_count = qdrant.count(target, exact=True).count
+    if source_count != target_count:
+        print(f"ERROR: {target} has {target_count} points, {source} has {source_count}; not swapping")
+        sys.exit(1)
+    qdrant.delete_collection(source)
+    if not create_alias(qdrant, source, target):
+        print(f"ERROR: {source} was deleted but the alias was not created; all points are in {target}.")
+        print("  Re-run with --swap to create the alias.")
+        sys.exit(1)
+    print(f"  {source} is now an alias of {target}")
+
+
+def resume_swap(qdrant: QdrantClient, collection: str) -> bool:
+    """Finish a --swap whose original was deleted before the alias could be created."""
+    target = f"{collection}_hybrid"
+    aliases = {a.alias_name for a in qdrant.get_aliases().aliases}
+    if collection in aliases or qdrant.collection_exists(collection) or not qdrant.collection_exists(target):
+        return False
+    print(f"{collection} is missing but {target} exists; creating the alias...")
+    if not create_alias(qdrant, collection, target):
+        sys.exit(1)
+    print(f"  {collection} is now an alias of {target}")
+    return True
+
+
+def index_missing(qdrant: QdrantClient, collection: str, stats: BM25Stats, batch_size: int, count: bool = True) -> int:
+    """Add sparse vectors to points that have none; with count=True their terms extend stats."""
+    missing = [
+        point for point in scroll_all(qdrant, collection, batch_size, with_vectors=[SPARSE_VECTOR_NAME])
+        if SPARSE_VECTOR_NAME not in (point.vector or {})
+    ]
+    if count:
+        for point in missing:
+            stats.add(tokenize(point_text(point)))
+    for i in range(0, len(missing), batch_size):
+        qdrant.update_vectors(
+            collection_name=collection,
+            points=[
+                PointVectors(id=p.id, vector={SPARSE_VECTOR_NAME: stats.document_vector(point_text(p))})
+                for p in missing[i:i + batch_size]
+            ],
+        )
+    return len(missing)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill BM25 sparse vectors for hybrid search")
+    parser.add_argument("--collection", default="DocumentChunk_text", help="Collection (or alias) to index")
+    parser.add_argument("--swap", action="store_true", help="Replace the collection with its hybrid copy")
+    parser.add_argument("--rebuild-stats", action="store_true", help="Recount IDF statistics from all points")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--stats-path", default=default_stats_path())
+    args = parser.parse_args()
+
+    qdrant = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+    if args.swap:
+        resume_swap(qdrant, args.collection)
+
+    if has_sparse_vector(qdrant, args.collection):
+        stats = None if args.rebuild_stats else BM25Stats.load(args.stats_path)
+        recount = stats is None
+        if recount:
+            print(f"Counting BM25 statistics over {args.collection}...")
+            stats = count_stats(qdrant, args.collection, args.batch_size)
+        print(f"Indexing points without sparse vectors in {args.collection}...")
+        # After a full recount the new points are already in the statistics
+        indexed = index_missing(qdrant, args.collection, stats, args.batch_size, count=not recount)
+        print(f"  {indexed} points indexed")
+    else:
+        print(f"Counting BM25 statistics over {args.collection}...")
+        stats = count_stats(qdrant, args.collection, args.batch_size)
+        print(f"Building hybrid copy of {args.collection}...")
+        target = build_hybrid_copy(qdrant, args.collection, stats, args.batch_size)
+        if args.swap:
+            swap_in(qdrant, args.collection, target)
+        else:
+            print(f"  Re-run with --swap to serve {target} as {args.collection}")
+
+    stats.save(args.stats_path)
+    print(f"\nBM25 statistics: {stats.n_docs} documents, {len(stats.df)} terms -> {args.stats_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,17 @@ Migrate LanceDB data to Qdrant.
 Reads the cognee 0.4.1 LanceDB export and uploads to Qdrant Cloud
 with the correct schema for cognee 0.5.1 + Qdrant adapter.
 
+Set QDRANT_QUANTIZATION=scalar or binary to create the collections with
+quantized vectors in RAM and the originals on disk (see shared/quantization.py).
+
 Usage:
     cd cognee-pipeline
     uv run python migrate_lancedb_to_qdrant.py
+    QDRANT_QUANTIZATION=scalar uv run python migrate_lancedb_to_qdrant.py
 """
 
 import os
+import sys
 import json
 from dotenv import load_dotenv
 
@@ -18,11 +23,13 @@ load_dotenv()
 import lancedb
 from qdrant_client import QdrantClient
 from qdrant_client.models import (
-    VectorParams,
     Distance,
     PointStruct,
 )
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from shared.quantization import default_quantization, quantization_config, vector_params
+
 # Paths
 LANCEDB_PATH = "../cognee-minihack/cognee-minihack/cognee_export/system_databases/cognee.lancedb"
 
@@ -36,6 +43,8 @@ VECTOR_NAME = "text"  # cognee 0.5.1 uses named vectors
 
 
 def migrate():
+    quantization = default_quantization()
+
     print("Connecting to LanceDB...")
     lance_db = lancedb.connect(LANCEDB_PATH)
 
@@ -76,13 +85,11 @@ def migrate():
         qdrant.create_collection(
             collection_name=table_name,
             vectors_config={
-                VECTOR_NAME: VectorParams(
-                    size=VECTOR_DIM,
-                    distance=Distance.COSINE,
-                )
+                VECTOR_NAME: vector_params(VECTOR_DIM, Distance.COSINE, quantization),
             },
+            quantization_config=quantization_config(quantization),
         )
-        print(f"  Created collection with named vector '{VECTOR_NAME}'")
+        print(f"  Created collection with named vector '{VECTOR_NAME}' (quantization: {quantization})")
 
         # Prepare points
         points = []
@@ -0,0 +1,117 @@
+"""
+Write Matryoshka-truncated copies of the Qdrant collections.
+
+nomic-embed-text v1.5 is trained so that the leading components of its
+embedding work on their own. This script reads every point of each collection,
+truncates its vector to EMBED_DIM (layer-norm, cut, L2-normalize, the same
+transform shared/embeddings.py applies to queries) and upserts it with the
+original payload into "<collection>_<dim>". The full-dimension collections are
+left untouched, so you can compare both and switch back by unsetting EMBED_DIM.
+
+Usage:
+    cd cognee-pipeline
+    uv run python migrate_matryoshka.py --dim 256
+    uv run python migrate_matryoshka.py --dim 512 --collections DocumentChunk_text
+"""
+
+import os
+import sys
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    Distance,
+    PointStruct,
+)
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from shared.embeddings import truncate_embedding
+from shared.quantization import default_quantization, quantization_config, vector_params
+
+QDRANT_URL = os.getenv("QDRANT_URL")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+
+COLLECTIONS = [
+    "DocumentChunk_text",
+    "Entity_name",
+    "EntityType_name",
+    "EdgeType_relationship_name",
+    "TextDocument_name",
+    "TextSummary_text",
+]
+
+
+def truncate_vector(vector, dim: int):
+    """Truncate a plain or named-vector point vector."""
+    if isinstance(vector, dict):
+        return {name: truncate_embedding(v, dim) for name, v in vector.items()}
+    return truncate_embedding(vector, dim)
+
+
+def migrate_collection(qdrant: QdrantClient, source: str, dim: int, batch_size: int = 256):
+    target = f"{source}_{dim}"
+    vectors_config = qdrant.get_collection(source).config.params.vectors
+    quantization = default_quantization()
+
+    # Mirror the source layout: one unnamed vector, or the same named vectors
+    if isinstance(vectors_config, dict):
+        new_config = {
+            name: vector_params(dim, params.distance, quantization)
+            for name, params in vectors_config.items()
+        }
+    else:
+        new_config = vector_params(dim, Distance.COSINE, quantization)
+
+    if qdrant.collection_exists(target):
+        qdrant.delete_collection(target)
+        print(f"  Deleted existing {target}")
+    qdrant.create_collection(
+        collection_name=target, vectors_config=new_config, quantization_config=quantization_config(quantization),
+    )
+
+    copied = 0
+    offset = None
+    while True:
+        points, offset = qdrant.scroll(
+            collection_name=source, limit=batch_size, offset=offset,
+            with_payload=True, with_vectors=True,
+        )
+        if not points:
+            break
+        qdrant.upsert(
+            collection_name=target,
+            points=[
+                PointStruct(id=p.id, vector=truncate_vector(p.vector, dim), payload=p.payload)
+                for p in points
+            ],
+        )
+        copied += len(points)
+        print(f"  {target}: {copied} points", end="\r")
+        if offset is None:
+            break
+    print(f"  {target}: {copied} points                    ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create Matryoshka-truncated copies of Qdrant collections")
+    parser.add_argument("--dim", type=int, default=int(os.getenv("EMBED_DIM", "256")), help="Target dimension")
+    parser.add_argument("--collections", default=",".join(COLLECTIONS), help="Comma-separated source collections")
+    args = parser.parse_args()
+
+    if not 0 < args.dim < 768:
+        print("ERROR: --dim must be between 1 and 767")
+        sys.exit(1)
+
+    qdrant = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+    for name in args.collections.split(","):
+        print(f"\nTruncating {name} to {args.dim} dims...")
+        migrate_collection(qdrant, name, args.dim)
+
+    print(f"\nDone. Set EMBED_DIM={args.dim} for the apps to search the truncated collections.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Normalize stringified record payloads into typed payload fields.
+
+Records in DocumentChunk_text keep their data as a Python-repr string in
+payload["text"], which every reader used to re-parse. This parses each point
+once (shared/records.py) and writes the fields as typed top-level payload
+(invoice_number, vendor_id, total, date, items, ...) with batched
+set_payload operations, then creates keyword, integer, float and datetime
+indexes on them. "text" is left as it is, so embeddings and full-text search
+are unaffected.
+
+Incremental: only points without the current payload_version are processed,
+so re-running after new ingestion (or after an interruption) touches only the
+new points. --all reprocesses everything.
+
+Usage:
+    cd cognee-pipeline
+    uv run python normalize_payloads.py
+    uv run python normalize_payloads.py --dry-run
+    uv run python normalize_payloads.py --collection DocumentChunk_text --all
+"""
+
+import os
+import sys
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    FieldCondition,
+    Filter,
+    MatchValue,
+    SetPayload,
+    SetPayloadOperation,
+)
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from shared.records import PAYLOAD_VERSION, RECORD_INDEXES, normalized_payload
+
+QDRANT_URL = os.getenv("QDRANT_URL")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+
+
+def create_indexes(qdrant: QdrantClient, collection: str):
+    for field, schema in RECORD_INDEXES.items():
+        try:
+            qdrant.create_payload_index(collection_name=collection, field_name=field, field_schema=schema)
+            print(f"  Index {field} ({schema.value})")
+        except Exception as e:
+            print(f"  Index {field}: {e}")
+
+
+def normalize_collection(qdrant: QdrantClient, collection: str, batch_size: int, process_all: bool, dry_run: bool):
+    pending = None if process_all else Filter(
+        must_not=[FieldCondition(key="payload_version", match=MatchValue(value=PAYLOAD_VERSION))]
+    )
+    scanned = records = 0
+    offset = None
+    while True:
+        points, offset = qdrant.scroll(
+            collection_name=collection, scroll_filter=pending, limit=batch_size, offset=offset,
+            with_payload=True, with_vectors=False,
+        )
+        if not points:
+            break
+        operations = []
+        for p in points:
+            payload = normalized_payload(p.payload or {})
+            records += "record_type" in payload
+            operations.append(SetPayloadOperation(set_payload=SetPayload(payload=payload, points=[p.id])))
+        if not dry_run:
+            # One request per batch, each point with its own fields
+            qdrant.batch_update_points(collection_name=collection, update_operations=operations)
+        scanned += len(points)
+        print(f"  {collection}: {scanned} points, {records} records", end="\r")
+        if offset is None:
+            break
+    print(f"  {collection}: {scanned} points, {records} records normalized{' (dry run)' if dry_run else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write typed payload fields for stringified records")
+    parser.add_argument("--collection", default="DocumentChunk_text")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--all", action="store_true", help="Reprocess points that are already normalized")
+    parser.add_argument("--dry-run", action="store_true", help="Parse and count without writing")
+    args = parser.parse_args()
+
+    qdrant = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+
+    if not args.dry_run:
+        print(f"Creating payload indexes on {args.collection}...")
+        create_indexes(qdrant, args.collection)
+    print(f"Normalizing {args.collection}...")
+    normalize_collection(qdrant, args.collection, args.batch_size, args.all, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
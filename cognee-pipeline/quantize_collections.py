@@ -0,0 +1,125 @@
+"""
+Quantize existing Qdrant collections.
+
+In place (default): updates each collection's quantization config and moves
+its float32 vectors to disk; Qdrant builds the quantized vectors in the
+background, and searches keep working meanwhile. --mode none reverts.
+
+With --copy, writes "<collection>_<mode>" copies instead and leaves the
+originals untouched, e.g. to compare configurations with
+benchmarks/quantization.py before switching.
+
+Usage:
+    cd cognee-pipeline
+    uv run python quantize_collections.py --mode scalar
+    uv run python quantize_collections.py --mode binary --collections DocumentChunk_text
+    uv run python quantize_collections.py --mode scalar --copy
+    uv run python quantize_collections.py --mode none
+"""
+
+import os
+import sys
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    Disabled,
+    PointStruct,
+    VectorParamsDiff,
+)
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from shared.quantization import QUANTIZATION_MODES, quantization_config, vector_params
+
+QDRANT_URL = os.getenv("QDRANT_URL")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+
+COLLECTIONS = [
+    "DocumentChunk_text",
+    "Entity_name",
+    "EntityType_name",
+    "EdgeType_relationship_name",
+    "TextDocument_name",
+    "TextSummary_text",
+]
+
+
+def quantize_in_place(qdrant: QdrantClient, collection: str, mode: str):
+    vectors_config = qdrant.get_collection(collection).config.params.vectors
+    names = list(vectors_config) if isinstance(vectors_config, dict) else [""]
+    qdrant.update_collection(
+        collection_name=collection,
+        vectors_config={name: VectorParamsDiff(on_disk=mode != "none") for name in names},
+        quantization_config=quantization_config(mode) or Disabled.DISABLED,
+    )
+    print(f"  {collection}: quantization {mode}, originals {'on disk' if mode != 'none' else 'in RAM'}")
+
+
+def quantized_copy(qdrant: QdrantClient, source: str, mode: str, batch_size: int = 256):
+    target = f"{source}_{mode}"
+    config = qdrant.get_collection(source).config
+    vectors_config = config.params.vectors
+    if isinstance(vectors_config, dict):
+        new_config = {
+            name: vector_params(params.size, params.distance, mode) for name, params in vectors_config.items()
+        }
+    else:
+        new_config = vector_params(vectors_config.size, vectors_config.distance, mode)
+
+    if qdrant.collection_exists(target):
+        qdrant.delete_collection(target)
+        print(f"  Deleted existing {target}")
+    qdrant.create_collection(
+        collection_name=target,
+        vectors_config=new_config,
+        sparse_vectors_config=config.params.sparse_vectors,
+        quantization_config=quantization_config(mode),
+    )
+
+    copied = 0
+    offset = None
+    while True:
+        points, offset = qdrant.scroll(
+            collection_name=source, limit=batch_size, offset=offset,
+            with_payload=True, with_vectors=True,
+        )
+        if not points:
+            break
+        qdrant.upsert(
+            collection_name=target,
+            points=[PointStruct(id=p.id, vector=p.vector, payload=p.payload) for p in points],
+        )
+        copied += len(points)
+        print(f"  {target}: {copied} points", end="\r")
+        if offset is None:
+            break
+    print(f"  {target}: {copied} points                    ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize existing Qdrant collections")
+    parser.add_argument("--mode", choices=QUANTIZATION_MODES, required=True)
+    parser.add_argument("--collections", default=",".join(COLLECTIONS), help="Comma-separated collections")
+    parser.add_argument("--copy", action="store_true", help="Write <collection>_<mode> copies instead")
+    args = parser.parse_args()
+
+    if args.copy and args.mode == "none":
+        print("ERROR: --copy needs --mode scalar or binary")
+        sys.exit(1)
+
+    qdrant = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+    for name in args.collections.split(","):
+        print(f"\n{'Copying' if args.copy else 'Updating'} {name} ({args.mode})...")
+        if args.copy:
+            quantized_copy(qdrant, name, args.mode)
+        else:
+            quantize_in_place(qdrant, name, args.mode)
+
+    print("\nDone. Searches accept quantization=ignore|rescore and oversampling.")
+
+
+if __name__ == "__main__":
+    main()
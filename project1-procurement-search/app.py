@@ -2,23 +2,31 @@
 Project 1: Procurement Semantic Search
 FastAPI app with local nomic-embed-text embeddings + Qdrant advanced features:
 - Prefetch + Fusion (RRF) — multi-stage retrieval pipeline
+- Hybrid dense + BM25 sparse retrieval (after cognee-pipeline/backfill_sparse.py)
+- Exact invoice/transaction/vendor identifier lookups without embedding
+- Full-text operators ("phrase", +term, -term) as indexed MatchText filters
+- Amount/date range and vendor/product facet filters on typed payload fields
+- Per-request quantization control (ignore / rescore with oversampling)
+- Latency-budgeted HNSW ef (budget_ms / precision=fast|balanced|exact)
 - Discovery API — context-aware search with positive/negative examples
 - Recommend API — positive/negative point-based recommendations
 - Group API — faceted results by type
 - Payload-indexed filtering
 """
 
+import asyncio
 import os
 import sys
 import json
 import time
 from contextlib import asynccontextmanager
+from datetime import date
 
 import numpy as np
 from dotenv import load_dotenv
-from fastapi import FastAPI, Query
-from fastapi.responses import HTMLResponse
-from qdrant_client import QdrantClient
+from fastapi import FastAPI, Query, Request, Response
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from qdrant_client.models import (
     FieldCondition,
     Filter,
@@ -27,20 +35,50 @@ from qdrant_client.models import (
     Prefetch,
     Fusion,
     FusionQuery,
+    QueryRequest,
     DiscoverQuery,
     DiscoverInput,
     ContextPair,
     RecommendQuery,
     RecommendInput,
     RecommendStrategy,
+    SearchParams,
 )
 
 load_dotenv()
 
 # Add shared module to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
-from shared.llm import init_llm, get_llm_response, get_model_name, is_available as llm_available
-from shared.embeddings import init_embeddings, get_embedding
+from shared.llm import (
+    init_llm,
+    aget_llm_response,
+    astream_llm_response,
+    sse_event,
+    get_model_name,
+    get_llm_stats,
+    invalidate_llm_cache,
+    is_available as llm_available,
+)
+from shared.embeddings import (
+    init_embeddings,
+    aget_embedding,
+    aget_embeddings,
+    embed_collection,
+    get_embedding_stats,
+    normalize_query,
+)
+from shared.context import context_budget, context_fetch_limit, pack_context, join_context
+from shared.http_client import aclose_clients
+from shared.qdrant import get_qdrant, close_qdrant
+from shared.result_cache import create_result_cache
+from shared.singleflight import get_flight, get_singleflight_stats
+from shared.sparse import SPARSE_VECTOR_NAME, default_stats_path, get_bm25_stats, hybrid_search_enabled, is_hybrid
+from shared.identifiers import analyze_query, create_identifier_indexes, lookup_identifiers, merge_exact, scope_filter
+from shared.text_query import combine_filter, parse_text_query
+from shared.records import create_record_indexes, record_conditions
+from shared.quantization import search_params
+from shared.ef_controller import get_ef_controller, get_ef_stats, merge_search_params
+from shared.inference import InferenceUnavailable, cancel_on_disconnect, get_inference_stats
 
 EMBED_MODEL_PATH = os.path.join(
     os.path.dirname(__file__),
@@ -50,10 +88,8 @@ EMBED_MODEL_PATH = os.path.join(
     "nomic-embed-text-v1.5.f16.gguf",
 )
 
-qdrant = QdrantClient(
-    url=os.environ["QDRANT_URL"],
-    api_key=os.environ["QDRANT_API_KEY"],
-)
+qdrant = get_qdrant()
+search_cache = create_result_cache()
 
 LLM_MODEL_PATH = os.path.join(
     os.path.dirname(__file__), "..", "models", "cognee-distillabs-model-gguf-quantized", "model-quantized.gguf"
@@ -81,25 +117,28 @@ COLLECTIONS = [
 ]
 
 
-def setup_payload_indexes():
+async def setup_payload_indexes():
     """Create payload indexes for fast filtering on key fields."""
     for collection in COLLECTIONS:
         try:
-            qdrant.create_payload_index(
-                collection_name=collection,
+            await qdrant.create_payload_index(
+                collection_name=embed_collection(collection),
                 field_name="type",
                 field_schema=PayloadSchemaType.KEYWORD,
             )
         except Exception:
             pass
         try:
-            qdrant.create_payload_index(
-                collection_name=collection,
+            await qdrant.create_payload_index(
+                collection_name=embed_collection(collection),
                 field_name="text",
                 field_schema=PayloadSchemaType.TEXT,
             )
         except Exception:
             pass
+        await create_identifier_indexes(qdrant, embed_collection(collection))
+    # Range/facet fields exist on the record chunks (cognee-pipeline/normalize_payloads.py)
+    await create_record_indexes(qdrant, embed_collection("DocumentChunk_text"))
 
 
 @asynccontextmanager
@@ -107,12 +146,28 @@ async def lifespan(app: FastAPI):
     init_embeddings(EMBED_MODEL_PATH)
     init_llm([(LLM_MODEL_PATH, "Distil Labs"), (LLM_FALLBACK_PATH, "Qwen3-4B")])
 
+    any_hybrid = False
     for c in COLLECTIONS:
-        info = qdrant.get_collection(c)
-        print(f"  {c}: {info.points_count} points")
+        info = await qdrant.get_collection(embed_collection(c))
+        hybrid = await is_hybrid(qdrant, embed_collection(c))
+        any_hybrid = any_hybrid or hybrid
+        print(f"  {c}: {info.points_count} points{' (hybrid)' if hybrid else ''}")
+    if any_hybrid and hybrid_search_enabled() and get_bm25_stats() is None:
+        print(
+            f"WARNING: hybrid collections found but no BM25 statistics at {default_stats_path()}; "
+            "/search uses dense-only fusion until backfill_sparse.py has written them there"
+        )
 
     print("Setting up payload indexes...")
-    setup_payload_indexes()
+    await setup_payload_indexes()
+
+    watcher = None
+    if search_cache is not None:
+        watcher = asyncio.create_task(search_cache.watch_point_counts(
+            qdrant,
+            [embed_collection(c) for c in COLLECTIONS],
+            float(os.getenv("SEARCH_CACHE_CHECK_INTERVAL", "30")),
+        ))
 
     if cognee_available:
         try:
@@ -125,11 +180,21 @@ async def lifespan(app: FastAPI):
 
     print("Ready.")
     yield
+    if watcher is not None:
+        watcher.cancel()
+    await aclose_clients()
+    await close_qdrant()
 
 
 app = FastAPI(title="Procurement Semantic Search", lifespan=lifespan)
 
 
+@app.exception_handler(InferenceUnavailable)
+async def inference_unavailable(request: Request, exc: InferenceUnavailable):
+    """Local model queue full (503) or timed out (504)."""
+    return JSONResponse({"error": str(exc)}, status_code=exc.status_code, headers={"Retry-After": "1"})
+
+
 @app.get("/", response_class=HTMLResponse)
 async def index():
     return """
@@ -274,7 +339,7 @@ async def index():
                 <span class="score">${r.score.toFixed(4)}</span>
                 <span class="type">${r.type || ''}</span>
             </div>
-            ${formatRecord(r.text)}
+            ${formatRecord(r.payload?.payload_version ? r.payload : r.text)}
             <div class="actions">
                 <button onclick="discover('${r.id}', true)">More like this</button>
                 <button onclick="discover('${r.id}', false)">Less like this</button>
@@ -306,10 +371,26 @@ async def index():
         if (!q) return;
         const c = document.getElementById('collection').value;
         document.getElementById('results').innerHTML = '<p style="color:#888">Retrieving context via Qdrant Prefetch+Fusion, then asking LLM...</p>';
-        const res = await fetch(`/ask?q=${encodeURIComponent(q)}&collection=${c}`);
-        const data = await res.json();
-        document.getElementById('stats').textContent = `RAG: ${data.sources} sources | Retrieval: ${data.retrieval_ms}ms | LLM: ${data.llm_ms}ms | Model: ${data.model}`;
-        document.getElementById('results').innerHTML = `<div class="result" style="border-color:#22c55e"><div style="color:#22c55e;font-weight:bold;margin-bottom:0.5rem">Answer</div><div class="text" style="white-space:pre-wrap">${data.answer}</div></div>`;
+        const source = new EventSource(`/ask/stream?q=${encodeURIComponent(q)}&collection=${c}`);
+        let meta = {}, answer = '';
+        source.addEventListener('meta', e => {
+            meta = JSON.parse(e.data);
+            document.getElementById('stats').textContent = `RAG: ${meta.sources} sources | Retrieval: ${meta.retrieval_ms}ms | Model: ${meta.model}`;
+            document.getElementById('results').innerHTML = `<div class="result" style="border-color:#22c55e"><div style="color:#22c55e;font-weight:bold;margin-bottom:0.5rem">Answer</div><div id="answer" class="text" style="white-space:pre-wrap"></div></div>`;
+        });
+        source.addEventListener('token', e => {
+            answer += JSON.parse(e.data).text;
+            document.getElementById('answer').textContent = answer;
+        });
+        source.addEventListener('error', e => {
+            if (e.data) document.getElementById('answer').textContent = answer + ` [${JSON.parse(e.data).error}]`;
+            else source.close();  // connection dropped: don't let EventSource re-ask
+        });
+        source.addEventListener('done', e => {
+            const d = JSON.parse(e.data);
+            document.getElementById('stats').textContent = `RAG: ${meta.sources} sources | Retrieval: ${meta.retrieval_ms}ms | First token: ${d.ttft_ms}ms | LLM: ${d.llm_ms}ms | Model: ${meta.model}`;
+            source.close();
+        });
     }
 
     document.getElementById('q').addEventListener('keydown', e => { if (e.key === 'Enter') doSearch(); });
@@ -317,107 +398,353 @@ async def index():
     """
 
 
+def cached_response(key: tuple, q: str, t0: float):
+    """Cached result for key as a JSON response with X-Cache: HIT, or None."""
+    if search_cache is None:
+        return None
+    cached = search_cache.get(key)
+    if cached is None:
+        return None
+    return JSONResponse(
+        {**cached, "query": q, "time_ms": round((time.time() - t0) * 1000, 3), "cache": "hit"},
+        headers={"X-Cache": "HIT"},
+    )
+
+
 @app.get("/search")
 async def search(
+    response: Response,
     q: str = Query(...),
     collection: str = Query("DocumentChunk_text"),
     limit: int = Query(20, ge=1, le=100),
     use_fusion: bool = Query(True),
+    min_total: float | None = Query(None, description="Min invoice total / transaction amount"),
+    max_total: float | None = Query(None, description="Max invoice total / transaction amount"),
+    date_from: date | None = Query(None, description="Earliest record date (inclusive)"),
+    date_to: date | None = Query(None, description="Latest record date (inclusive)"),
+    vendor_id: str | None = Query(None, description="Comma-separated vendor ids"),
+    product: str | None = Query(None, description="Comma-separated product names"),
+    quantization: str | None = Query(None, pattern="^(ignore|rescore)$", description="Quantized search: ignore or rescore"),
+    oversampling: float | None = Query(None, ge=1.0, le=16.0, description="Rescore limit * oversampling candidates"),
+    budget_ms: float | None = Query(None, gt=0, le=10000, description="Search latency budget; picks hnsw_ef to fit"),
+    precision: str | None = Query(None, pattern="^(fast|balanced|exact)$", description="HNSW precision preset"),
 ):
     """
     Qdrant Prefetch + RRF Fusion: fetch a broad candidate set, then fuse rankings.
-    Two prefetch branches with different limits create a multi-stage pipeline.
+    When the collection has BM25 sparse vectors, a dense and a sparse (keyword)
+    prefetch are fused; otherwise two dense prefetches with different limits.
+    Invoice, transaction and vendor identifiers are looked up exactly via
+    payload indexes: identifier-only queries skip embedding, mixed queries
+    search only the records holding the identifiers. "phrase", +term and -term are full-text filters
+    (see shared/text_query.py); amount, date, vendor and product parameters
+    are range/facet filters on the typed record fields. quantization and
+    oversampling control how quantized collections are searched; budget_ms
+    or precision pick hnsw_ef (or exact search) via shared/ef_controller.py.
+    Repeated queries are served from the search result cache (X-Cache header);
+    identical concurrent queries share one computation.
     """
     t0 = time.time()
-    query_vector = get_embedding(q)
-    embed_ms = round((time.time() - t0) * 1000, 1)
-
-    t1 = time.time()
-    if use_fusion:
-        # Multi-stage: two prefetches with different candidate pool sizes, fused with RRF
-        results = qdrant.query_points(
-            collection_name=collection,
-            prefetch=[
-                Prefetch(query=query_vector, limit=100),  # broad recall
-                Prefetch(query=query_vector, limit=50),   # tighter precision
-            ],
-            query=FusionQuery(fusion=Fusion.RRF),
-            limit=limit,
-            with_payload=True,
-        )
-    else:
-        results = qdrant.query_points(
-            collection_name=collection,
-            query=query_vector,
-            limit=limit,
-            with_payload=True,
-        )
-    search_ms = round((time.time() - t1) * 1000, 1)
-
-    items = []
-    for point in results.points:
+    bm25 = get_bm25_stats() if use_fusion and await is_hybrid(qdrant, embed_collection(collection)) else None
+    # Statistics reloads change sparse query weights, so they are part of the key
+    filters = (min_total, max_total, date_from, date_to, vendor_id, product)
+    cache_key = (
+        "search", embed_collection(collection), normalize_query(q), limit, use_fusion,
+        bm25.loaded_mtime if bm25 else None, filters, quantization, oversampling, budget_ms, precision,
+    )
+    params = search_params(quantization, oversampling)
+    if search_cache is not None:
+        cache_key = search_cache.make_key(*cache_key)
+        hit = cached_response(cache_key, q, t0)
+        if hit is not None:
+            return hit
+
+    def to_item(point, score):
         payload = point.payload or {}
-        items.append({
+        return {
             "id": str(point.id),
-            "score": point.score,
+            "score": score,
             "text": payload.get("text", ""),
             "type": payload.get("type", ""),
             "payload": payload,
-        })
+        }
 
-    return {
-        "query": q,
-        "results": items,
-        "total": len(items),
-        "time_ms": round((time.time() - t0) * 1000, 1),
-        "embed_ms": embed_ms,
-        "search_ms": search_ms,
-        "method": "prefetch_rrf_fusion" if use_fusion else "basic_query",
-    }
+    async def run():
+        text, must, must_not = parse_text_query(q)
+        text_filter = combine_filter(None, must + record_conditions(*filters), must_not)
+        if not text:
+            # Only -terms: embedding them would pull results toward what was
+            # excluded, so list the records the filters allow instead
+            t1 = time.time()
+            results = await qdrant.query_points(
+                collection_name=embed_collection(collection),
+                query_filter=text_filter,
+                limit=limit,
+                with_payload=True,
+            )
+            items = [to_item(point, point.score) for point in results.points]
+            result = {
+                "query": q,
+                "results": items,
+                "total": len(items),
+                "time_ms": round((time.time() - t0) * 1000, 1),
+                "embed_ms": 0,
+                "search_ms": round((time.time() - t1) * 1000, 1),
+                "method": "filter_only",
+            }
+            if search_cache is not None:
+                search_cache.put(cache_key, result)
+            return result
+        identifiers, remainder = analyze_query(text)
+        exact = []
+        if identifiers:
+            t1 = time.time()
+            points = await lookup_identifiers(qdrant, embed_collection(collection), identifiers, limit, text_filter)
+            exact = [to_item(p, 1.0) for p in points]
+            if exact and not remainder:
+                result = {
+                    "query": q,
+                    "results": exact,
+                    "total": len(exact),
+                    "time_ms": round((time.time() - t0) * 1000, 1),
+                    "embed_ms": 0,
+                    "search_ms": round((time.time() - t1) * 1000, 1),
+                    "method": "exact_identifier",
+                }
+                if search_cache is not None:
+                    search_cache.put(cache_key, result)
+                return result
+            if exact:
+                # Scoped to the identifiers: only the rest of the query ranks
+                text_filter = scope_filter(text_filter, identifiers)
+
+        t_embed = time.time()
+        query_vector = await aget_embedding(remainder if exact else text)
+        embed_ms = round((time.time() - t_embed) * 1000, 1)
+
+        # Each search shape has its own ef -> latency curve
+        ef_controller = get_ef_controller(
+            "search/hybrid" if bm25 is not None else "search/fusion" if use_fusion else "search/basic"
+        )
+        ef_params, hnsw = ef_controller.choose(budget_ms, precision)
+        dense_params = merge_search_params(params, ef_params)
+
+        t1 = time.time()
+        with ef_controller.track(hnsw):
+            if bm25 is not None:
+                # Hybrid: semantic and keyword candidates, fused with RRF
+                results = await qdrant.query_points(
+                    collection_name=embed_collection(collection),
+                    prefetch=[
+                        Prefetch(query=query_vector, filter=text_filter, params=dense_params, limit=100),
+                        Prefetch(query=bm25.query_vector(text), using=SPARSE_VECTOR_NAME, filter=text_filter, limit=100),
+                    ],
+                    query=FusionQuery(fusion=Fusion.RRF),
+                    query_filter=text_filter,
+                    limit=limit,
+                    with_payload=True,
+                )
+                method = "hybrid_rrf_fusion"
+            elif use_fusion:
+                # Multi-stage: two prefetches with different candidate pool sizes, fused with RRF
+                results = await qdrant.query_points(
+                    collection_name=embed_collection(collection),
+                    prefetch=[
+                        Prefetch(query=query_vector, filter=text_filter, params=dense_params, limit=100),  # broad recall
+                        Prefetch(query=query_vector, filter=text_filter, params=dense_params, limit=50),   # tighter precision
+                    ],
+                    query=FusionQuery(fusion=Fusion.RRF),
+                    query_filter=text_filter,
+                    limit=limit,
+                    with_payload=True,
+                )
+                method = "prefetch_rrf_fusion"
+            else:
+                results = await qdrant.query_points(
+                    collection_name=embed_collection(collection),
+                    query=query_vector,
+                    query_filter=text_filter,
+                    search_params=dense_params,
+                    limit=limit,
+                    with_payload=True,
+                )
+                method = "basic_query"
+        search_ms = round((time.time() - t1) * 1000, 1)
+
+        items = [to_item(point, point.score) for point in results.points]
+        if exact:
+            items = merge_exact(exact, items, identifiers, limit)
+            method = f"exact_identifier+{method}"
+
+        result = {
+            "query": q,
+            "results": items,
+            "total": len(items),
+            "time_ms": round((time.time() - t0) * 1000, 1),
+            "embed_ms": embed_ms,
+            "search_ms": search_ms,
+            "method": method,
+            "hnsw": hnsw,
+        }
+        if search_cache is not None:
+            search_cache.put(cache_key, result)
+        return result
+
+    result = await get_flight("search").do(cache_key, run)
+    if search_cache is not None:
+        response.headers["X-Cache"] = "MISS"
+    # Coalesced callers share the result; echo each caller's own query
+    return {**result, "query": q}
 
 
 @app.get("/search/grouped")
 async def search_grouped(
+    response: Response,
     q: str = Query(...),
     collection: str = Query("DocumentChunk_text"),
     limit: int = Query(20),
 ):
     """Search with results grouped by payload 'type' field using Qdrant's group API."""
     t0 = time.time()
-    query_vector = get_embedding(q)
-    embed_ms = round((time.time() - t0) * 1000, 1)
+    cache_key = ("search/grouped", embed_collection(collection), normalize_query(q), limit)
+    if search_cache is not None:
+        cache_key = search_cache.make_key(*cache_key)
+        hit = cached_response(cache_key, q, t0)
+        if hit is not None:
+            return hit
+
+    async def run():
+        query_vector = await aget_embedding(q)
+        embed_ms = round((time.time() - t0) * 1000, 1)
+
+        t1 = time.time()
+        groups = await qdrant.query_points_groups(
+            collection_name=embed_collection(collection),
+            query=query_vector,
+            group_by="type",
+            limit=limit,
+            group_size=5,
+            with_payload=True,
+        )
+        search_ms = round((time.time() - t1) * 1000, 1)
+
+        result_groups = {}
+        total = 0
+        for group in groups.groups:
+            key = str(group.id)
+            result_groups[key] = []
+            for hit in group.hits:
+                payload = hit.payload or {}
+                result_groups[key].append({
+                    "id": str(hit.id),
+                    "score": hit.score,
+                    "text": payload.get("text", ""),
+                    "type": payload.get("type", ""),
+                    "payload": payload,
+                })
+                total += 1
+
+        result = {
+            "query": q,
+            "groups": result_groups,
+            "total": total,
+            "time_ms": round((time.time() - t0) * 1000, 1),
+            "embed_ms": embed_ms,
+            "search_ms": search_ms,
+        }
+        if search_cache is not None:
+            search_cache.put(cache_key, result)
+        return result
+
+    result = await get_flight("search/grouped").do(cache_key, run)
+    if search_cache is not None:
+        response.headers["X-Cache"] = "MISS"
+    # Coalesced callers share the result; echo each caller's own query
+    return {**result, "query": q}
+
+
+RRF_K = 60
 
-    t1 = time.time()
-    groups = qdrant.query_points_groups(
-        collection_name=collection,
-        query=query_vector,
-        group_by="type",
-        limit=limit,
-        group_size=5,
-        with_payload=True,
-    )
-    search_ms = round((time.time() - t1) * 1000, 1)
 
-    result_groups = {}
-    total = 0
-    for group in groups.groups:
-        key = str(group.id)
-        result_groups[key] = []
-        for hit in group.hits:
-            payload = hit.payload or {}
-            result_groups[key].append({
-                "id": str(hit.id),
-                "score": hit.score,
+def fuse_ranked_lists(ranked: dict[str, list], fusion: str, limit: int) -> list[dict]:
+    """
+    Merge per-collection hit lists into one ranking. "rrf" scores each hit by
+    1 / (RRF_K + rank); "normalized" min-max scales scores within each collection.
+    """
+    merged = []
+    for collection, points in ranked.items():
+        scores = [p.score for p in points]
+        lo, hi = (min(scores), max(scores)) if scores else (0.0, 0.0)
+        for rank, point in enumerate(points):
+            if fusion == "rrf":
+                fused = 1.0 / (RRF_K + rank + 1)
+            else:
+                fused = (point.score - lo) / (hi - lo) if hi > lo else 1.0
+            payload = point.payload or {}
+            merged.append({
+                "id": str(point.id),
+                "collection": collection,
+                "score": fused,
+                "raw_score": point.score,
                 "text": payload.get("text", ""),
                 "type": payload.get("type", ""),
                 "payload": payload,
             })
-            total += 1
+    # Equal fused scores (same rank in different collections): higher raw similarity first
+    merged.sort(key=lambda item: (-item["score"], -(item["raw_score"] or 0)))
+    return merged[:limit]
+
 
+@app.get("/search/all")
+async def search_all(
+    q: str = Query(...),
+    collections: str = Query(None, description="Comma-separated collections (default: all)"),
+    limit: int = Query(20, ge=1, le=100),
+    per_collection: int = Query(20, ge=1, le=100, description="Candidates taken from each collection"),
+    fusion: str = Query("rrf", pattern="^(rrf|normalized)$"),
+):
+    """
+    Federated search: embed the query once, search every selected collection
+    concurrently and merge the ranked lists with RRF or per-collection
+    normalized scores. Each hit keeps the collection it came from.
+    """
+    t0 = time.time()
+    requested = [c.strip() for c in collections.split(",") if c.strip()] if collections else COLLECTIONS
+    selected = [c for c in requested if c in COLLECTIONS]
+    query_vector = await aget_embedding(q)
+    embed_ms = round((time.time() - t0) * 1000, 1)
+
+    async def search_one(collection: str):
+        t = time.time()
+        result = await qdrant.query_points(
+            collection_name=embed_collection(collection),
+            query=query_vector,
+            limit=per_collection,
+            with_payload=True,
+        )
+        return result.points, round((time.time() - t) * 1000, 1)
+
+    t1 = time.time()
+    outcomes = await asyncio.gather(*(search_one(c) for c in selected), return_exceptions=True)
+    search_ms = round((time.time() - t1) * 1000, 1)
+
+    ranked = {}
+    per_collection_stats = {c: {"error": "unknown collection"} for c in requested if c not in COLLECTIONS}
+    for collection, outcome in zip(selected, outcomes):
+        if isinstance(outcome, Exception):
+            # One missing or failing collection should not sink the whole search
+            per_collection_stats[collection] = {"error": str(outcome)}
+            continue
+        points, ms = outcome
+        ranked[collection] = points
+        per_collection_stats[collection] = {"hits": len(points), "search_ms": ms}
+
+    items = fuse_ranked_lists(ranked, fusion, limit)
     return {
         "query": q,
-        "groups": result_groups,
-        "total": total,
+        "results": items,
+        "total": len(items),
+        "fusion": fusion,
+        "collections": per_collection_stats,
         "time_ms": round((time.time() - t0) * 1000, 1),
         "embed_ms": embed_ms,
         "search_ms": search_ms,
@@ -431,6 +758,8 @@ async def discover(
     positive_id: str = Query(None, description="Point ID to use as positive context"),
     negative_id: str = Query(None, description="Point ID to use as negative context"),
     limit: int = Query(20),
+    quantization: str | None = Query(None, pattern="^(ignore|rescore)$", description="Quantized search: ignore or rescore"),
+    oversampling: float | None = Query(None, ge=1.0, le=16.0, description="Rescore limit * oversampling candidates"),
 ):
     """
     Qdrant Discovery API: search with a target vector constrained by context pairs.
@@ -438,40 +767,43 @@ async def discover(
     the positive example and away from the negative example.
     """
     t0 = time.time()
-    query_vector = get_embedding(q)
+    params = search_params(quantization, oversampling)
+    query_vector = await aget_embedding(q)
     embed_ms = round((time.time() - t0) * 1000, 1)
 
     t1 = time.time()
     if positive_id and negative_id:
         # Full Discovery: target vector + context pair
-        results = qdrant.query_points(
-            collection_name=collection,
+        results = await qdrant.query_points(
+            collection_name=embed_collection(collection),
             query=DiscoverQuery(
                 discover=DiscoverInput(
                     target=query_vector,
                     context=[ContextPair(positive=positive_id, negative=negative_id)],
                 )
             ),
+            search_params=params,
             limit=limit,
             with_payload=True,
         )
     elif positive_id:
         # Recommend with positive only
-        results = qdrant.query_points(
-            collection_name=collection,
+        results = await qdrant.query_points(
+            collection_name=embed_collection(collection),
             query=RecommendQuery(
                 recommend=RecommendInput(
                     positive=[positive_id],
                     strategy=RecommendStrategy.AVERAGE_VECTOR,
                 )
             ),
+            search_params=params,
             limit=limit,
             with_payload=True,
         )
     elif negative_id:
         # Recommend with negative — find things unlike this point but matching query
-        results = qdrant.query_points(
-            collection_name=collection,
+        results = await qdrant.query_points(
+            collection_name=embed_collection(collection),
             query=RecommendQuery(
                 recommend=RecommendInput(
                     positive=[query_vector],
@@ -479,12 +811,14 @@ async def discover(
                     strategy=RecommendStrategy.BEST_SCORE,
                 )
             ),
+            search_params=params,
             limit=limit,
             with_payload=True,
         )
     else:
-        results = qdrant.query_points(
-            collection_name=collection, query=query_vector, limit=limit, with_payload=True,
+        results = await qdrant.query_points(
+            collection_name=embed_collection(collection), query=query_vector, search_params=params,
+            limit=limit, with_payload=True,
         )
     search_ms = round((time.time() - t1) * 1000, 1)
 
@@ -528,7 +862,7 @@ async def recommend(
     neg = [pid.strip() for pid in negative_ids.split(",") if pid.strip()]
     strat = RecommendStrategy.BEST_SCORE if strategy == "best_score" else RecommendStrategy.AVERAGE_VECTOR
 
-    results = qdrant.query_points(
+    results = await qdrant.query_points(
         collection_name=collection,
         query=RecommendQuery(
             recommend=RecommendInput(
@@ -562,19 +896,33 @@ async def filtered_search(
     collection: str = Query("DocumentChunk_text"),
     type_filter: str = Query(None, description="Filter by type field"),
     limit: int = Query(20),
+    min_total: float | None = Query(None, description="Min invoice total / transaction amount"),
+    max_total: float | None = Query(None, description="Max invoice total / transaction amount"),
+    date_from: date | None = Query(None, description="Earliest record date (inclusive)"),
+    date_to: date | None = Query(None, description="Latest record date (inclusive)"),
+    vendor_id: str | None = Query(None, description="Comma-separated vendor ids"),
+    product: str | None = Query(None, description="Comma-separated product names"),
 ):
-    """Semantic search with payload filter using indexed fields."""
+    """
+    Semantic search with payload filter using indexed fields: the type keyword
+    index, the full-text index for "phrase", +term and -term in q, and the
+    range/facet indexes on amount, date, vendor and product.
+    """
     t0 = time.time()
-    query_vector = get_embedding(q)
+    text, must, must_not = parse_text_query(q)
+    # Only -terms: no vector, just the filter (never embed excluded words)
+    query_vector = await aget_embedding(text) if text else None
 
     query_filter = None
     if type_filter:
         query_filter = Filter(
             must=[FieldCondition(key="type", match=MatchValue(value=type_filter))]
         )
+    conditions = record_conditions(min_total, max_total, date_from, date_to, vendor_id, product)
+    query_filter = combine_filter(query_filter, must + conditions, must_not)
 
-    results = qdrant.query_points(
-        collection_name=collection,
+    results = await qdrant.query_points(
+        collection_name=embed_collection(collection),
         query=query_vector,
         query_filter=query_filter,
         limit=limit,
@@ -593,66 +941,236 @@ async def filtered_search(
     return {"results": items, "time_ms": round((time.time() - t0) * 1000, 1)}
 
 
-@app.get("/ask")
-async def ask(q: str = Query(...), collection: str = Query("DocumentChunk_text"), limit: int = Query(5)):
+class BatchQuery(BaseModel):
+    q: str
+    limit: int = Field(10, ge=1, le=100)
+    type_filter: str | None = Field(None, description="Filter by type field")
+    min_total: float | None = Field(None, description="Min invoice total / transaction amount")
+    max_total: float | None = Field(None, description="Max invoice total / transaction amount")
+    date_from: date | None = Field(None, description="Earliest record date (inclusive)")
+    date_to: date | None = Field(None, description="Latest record date (inclusive)")
+    vendor_id: str | None = Field(None, description="Comma-separated vendor ids")
+    product: str | None = Field(None, description="Comma-separated product names")
+
+
+class BatchSearchRequest(BaseModel):
+    queries: list[BatchQuery] = Field(..., min_length=1, max_length=int(os.getenv("SEARCH_BATCH_MAX", "500")))
+    collection: str = "DocumentChunk_text"
+
+
+@app.post("/search/batch")
+async def search_batch(body: BatchSearchRequest):
     """
-    RAG Q&A: retrieve relevant docs via Qdrant Prefetch+Fusion, then reason with LLM.
-    Uses OpenRouter (free Qwen3-4B), Groq, or any OpenAI-compatible endpoint.
+    Batch semantic search: embed every query in one batched call, then run all
+    searches in a single query_batch_points request. Each query takes the same
+    filters as /filter: type, "phrase"/+term/-term in q, and the amount, date,
+    vendor and product fields. Results come back in request order, with
+    timings per stage.
     """
     t0 = time.time()
-    query_vector = get_embedding(q)
+    parsed = [parse_text_query(item.q) for item in body.queries]
+    texts = [text for text, _, _ in parsed if text]
+    embedded = iter(await aget_embeddings(texts) if texts else [])
+    # Queries of only -terms run as filter-only requests (no vector)
+    vectors = [next(embedded) if text else None for text, _, _ in parsed]
+    embed_ms = round((time.time() - t0) * 1000, 1)
 
-    # Retrieve context via Prefetch + RRF Fusion
-    results = qdrant.query_points(
-        collection_name=collection,
+    requests = []
+    for item, (_, must, must_not), vector in zip(body.queries, parsed, vectors):
+        query_filter = None
+        if item.type_filter:
+            query_filter = Filter(must=[FieldCondition(key="type", match=MatchValue(value=item.type_filter))])
+        conditions = record_conditions(
+            item.min_total, item.max_total, item.date_from, item.date_to, item.vendor_id, item.product,
+        )
+        query_filter = combine_filter(query_filter, must + conditions, must_not)
+        requests.append(QueryRequest(query=vector, filter=query_filter, limit=item.limit, with_payload=True))
+
+    t1 = time.time()
+    responses = await qdrant.query_batch_points(
+        collection_name=embed_collection(body.collection),
+        requests=requests,
+    )
+    search_ms = round((time.time() - t1) * 1000, 1)
+
+    results = []
+    for item, response in zip(body.queries, responses):
+        hits = []
+        for point in response.points:
+            payload = point.payload or {}
+            hits.append({
+                "id": str(point.id),
+                "score": point.score,
+                "text": payload.get("text", ""),
+                "type": payload.get("type", ""),
+            })
+        results.append({"query": item.q, "results": hits, "total": len(hits)})
+
+    return {
+        "results": results,
+        "queries": len(results),
+        "time_ms": round((time.time() - t0) * 1000, 1),
+        "embed_ms": embed_ms,
+        "search_ms": search_ms,
+    }
+
+
+ASK_SYSTEM_PROMPT = (
+    "You are a procurement analyst. Answer questions using the provided context from invoices, "
+    "transactions, and vendor data. Be specific with numbers and dates."
+)
+
+
+async def retrieve_context(
+    q: str, collection: str, limit: int, params: SearchParams | None = None,
+) -> tuple[str, list, dict, float]:
+    """
+    Retrieve RAG context via Prefetch + RRF Fusion and pack it into the model's
+    token budget. Enough chunks are fetched to fill the budget (at least limit),
+    so packing decides what goes into the prompt. Returns (context, packed
+    point_ids, packing stats, retrieval_ms).
+    """
+    t0 = time.time()
+    budget = context_budget(ASK_SYSTEM_PROMPT, q)
+    fetch = context_fetch_limit(budget, limit)
+    query_vector = await aget_embedding(q)
+
+    results = await qdrant.query_points(
+        collection_name=embed_collection(collection),
         prefetch=[
-            Prefetch(query=query_vector, limit=50),
-            Prefetch(query=query_vector, limit=20),
+            Prefetch(query=query_vector, params=params, limit=max(50, fetch * 2)),
+            Prefetch(query=query_vector, params=params, limit=max(20, fetch)),
         ],
         query=FusionQuery(fusion=Fusion.RRF),
-        limit=limit,
+        limit=fetch,
         with_payload=True,
     )
 
-    context_docs = []
-    for p in results.points:
-        text = (p.payload or {}).get("text", "")
-        context_docs.append(text[:500])
+    chunks = [{"id": p.id, "score": p.score, "text": (p.payload or {}).get("text", "")} for p in results.points]
+    packed, packing = pack_context(chunks, budget)
+    point_ids = [c["id"] for c in packed]
+    return join_context(packed), point_ids, packing, round((time.time() - t0) * 1000, 1)
 
-    context = "\n---\n".join(context_docs)
-    retrieval_ms = round((time.time() - t0) * 1000, 1)
 
-    # LLM reasoning via local Distil Labs model or cloud fallback
-    t1 = time.time()
-    try:
-        answer = get_llm_response(
-            "You are a procurement analyst. Answer questions using the provided context from invoices, transactions, and vendor data. Be specific with numbers and dates.",
-            f"Context:\n{context}\n\nQuestion: {q}",
+@app.get("/ask")
+async def ask(
+    request: Request,
+    q: str = Query(...),
+    collection: str = Query("DocumentChunk_text"),
+    limit: int = Query(5, ge=1, description="Min chunks to retrieve; more are fetched to fill the token budget"),
+    quantization: str | None = Query(None, pattern="^(ignore|rescore)$", description="Quantized search: ignore or rescore"),
+    oversampling: float | None = Query(None, ge=1.0, le=16.0, description="Rescore limit * oversampling candidates"),
+):
+    """
+    RAG Q&A: retrieve relevant docs via Qdrant Prefetch+Fusion, then reason with LLM.
+    Uses OpenRouter (free Qwen3-4B), Groq, or any OpenAI-compatible endpoint.
+    Identical concurrent questions share one retrieval and LLM call.
+    """
+    async def run():
+        context, point_ids, packing, retrieval_ms = await retrieve_context(
+            q, collection, limit, search_params(quantization, oversampling),
         )
-    except Exception as e:
-        answer = f"LLM error: {e}"
-    llm_ms = round((time.time() - t1) * 1000, 1)
 
-    model_name = get_model_name()
-    return {
-        "question": q,
-        "answer": answer,
-        "sources": len(context_docs),
-        "retrieval_ms": retrieval_ms,
-        "llm_ms": llm_ms,
-        "model": model_name,
-    }
+        # LLM reasoning via local Distil Labs model or cloud fallback
+        t1 = time.time()
+        try:
+            answer = await aget_llm_response(
+                ASK_SYSTEM_PROMPT,
+                f"Context:\n{context}\n\nQuestion: {q}",
+                question=q,
+                context_ids=point_ids,
+            )
+        except InferenceUnavailable:
+            raise
+        except Exception as e:
+            answer = f"LLM error: {e}"
+        llm_ms = round((time.time() - t1) * 1000, 1)
+
+        model_name = get_model_name()
+        return {
+            "question": q,
+            "answer": answer,
+            "sources": len(point_ids),
+            "context": packing,
+            "retrieval_ms": retrieval_ms,
+            "llm_ms": llm_ms,
+            "model": model_name,
+        }
+
+    key = ("ask", embed_collection(collection), q, limit, quantization, oversampling)
+    # The shared call is only cancelled once every coalesced client has disconnected
+    return await cancel_on_disconnect(request, get_flight("ask").do(key, run))
+
+
+@app.get("/ask/stream")
+async def ask_stream(
+    q: str = Query(...),
+    collection: str = Query("DocumentChunk_text"),
+    limit: int = Query(5, ge=1, description="Min chunks to retrieve; more are fetched to fill the token budget"),
+    quantization: str | None = Query(None, pattern="^(ignore|rescore)$", description="Quantized search: ignore or rescore"),
+    oversampling: float | None = Query(None, ge=1.0, le=16.0, description="Rescore limit * oversampling candidates"),
+):
+    """
+    Streaming RAG Q&A (text/event-stream): a "meta" event with retrieval stats,
+    then "token" events as the LLM generates, then "done" with timings.
+    """
+    context, point_ids, packing, retrieval_ms = await retrieve_context(
+        q, collection, limit, search_params(quantization, oversampling),
+    )
+
+    async def events():
+        yield sse_event("meta", {
+            "question": q,
+            "sources": len(point_ids),
+            "context": packing,
+            "retrieval_ms": retrieval_ms,
+            "model": get_model_name(),
+        })
+        t1 = time.time()
+        ttft_ms = None
+        try:
+            async for delta in astream_llm_response(
+                ASK_SYSTEM_PROMPT,
+                f"Context:\n{context}\n\nQuestion: {q}",
+                question=q,
+                context_ids=point_ids,
+            ):
+                if ttft_ms is None:
+                    ttft_ms = round((time.time() - t1) * 1000, 1)
+                yield sse_event("token", {"text": delta})
+        except InferenceUnavailable as e:
+            yield sse_event("error", {"error": str(e), "status": e.status_code})
+        except Exception as e:
+            yield sse_event("error", {"error": f"LLM error: {e}"})
+        yield sse_event("done", {"ttft_ms": ttft_ms, "llm_ms": round((time.time() - t1) * 1000, 1)})
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/collections")
 async def list_collections():
     result = {}
     for c in COLLECTIONS:
-        info = qdrant.get_collection(c)
+        info = await qdrant.get_collection(embed_collection(c))
         result[c] = {"points": info.points_count, "vectors_size": info.config.params.vectors.size}
     return result
 
 
+@app.get("/stats")
+async def stats():
+    """Runtime metrics: embedding batching/caches, inference queues, LLM/search caches, coalescing."""
+    return {
+        "embeddings": get_embedding_stats(),
+        "inference": get_inference_stats(),
+        "llm": get_llm_stats(),
+        "search_cache": search_cache.stats() if search_cache is not None else None,
+        "singleflight": get_singleflight_stats(),
+        "hnsw_ef": get_ef_stats(),
+    }
+
+
 # --- cognee integration: graph-aware search + knowledge ingestion ---
 
 
@@ -701,6 +1219,11 @@ async def add_knowledge(text: str = Query(..., description="Text to ingest into
     except Exception as e:
         return {"error": f"cognee ingestion failed: {e}", "time_ms": round((time.time() - t0) * 1000, 1)}
 
+    # New knowledge can change the retrieved context (and so the answer) for any question
+    invalidate_llm_cache()
+    if search_cache is not None:
+        search_cache.bump()
+
     return {
         "status": "ok",
         "message": "Knowledge ingested and graph updated.",
@@ -7,17 +7,18 @@ Local nomic-embed-text embeddings + Qdrant advanced features:
 - Payload-indexed filtering for fast vendor/date lookups
 """
 
+import hashlib
 import os
 import sys
 import json
 import time
 from collections import defaultdict
 from contextlib import asynccontextmanager
+from datetime import date
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, Query
-from fastapi.responses import HTMLResponse
-from qdrant_client import QdrantClient
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from qdrant_client.models import (
     PayloadSchemaType,
     Filter,
@@ -31,14 +32,35 @@ from qdrant_client.models import (
 load_dotenv()
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
-from shared.llm import init_llm, get_llm_response, get_model_name, is_available as llm_available
-from shared.embeddings import init_embeddings, get_embedding
+from shared.llm import (
+    init_llm,
+    aget_llm_response,
+    astream_llm_response,
+    sse_event,
+    get_model_name,
+    get_llm_stats,
+    is_available as llm_available,
+)
+from shared.embeddings import (
+    init_embeddings,
+    aget_embedding,
+    embed_collection,
+    get_embedding_stats,
+    normalize_query,
+)
+from shared.http_client import aclose_clients
+from shared.qdrant import get_qdrant, close_qdrant
+from shared.records import create_record_indexes, record_conditions, record_from_payload
+from shared.identifiers import analyze_query, create_identifier_indexes, lookup_identifiers, merge_exact, scope_filter
+from shared.singleflight import get_flight, get_singleflight_stats
+from shared.ef_controller import get_ef_controller, get_ef_stats
+from shared.inference import InferenceUnavailable, cancel_on_disconnect, get_inference_stats
 
 EMBED_MODEL_PATH = os.path.join(
     os.path.dirname(__file__), "..", "models", "nomic-embed-text", "nomic-embed-text-v1.5.f16.gguf"
 )
 
-qdrant = QdrantClient(url=os.environ["QDRANT_URL"], api_key=os.environ["QDRANT_API_KEY"])
+qdrant = get_qdrant()
 
 LLM_MODEL_PATH = os.path.join(
     os.path.dirname(__file__), "..", "models", "cognee-distillabs-model-gguf-quantized", "model-quantized.gguf"
@@ -49,33 +71,18 @@ LLM_FALLBACK_PATH = os.path.join(
 analytics_cache = {}
 
 
-def parse_text_payload(payload):
-    text = payload.get("text", "")
-    if isinstance(text, dict):
-        return text
-    if isinstance(text, str):
-        try:
-            return json.loads(text.replace("'", '"'))
-        except Exception:
-            try:
-                return eval(text)
-            except Exception:
-                return None
-    return None
-
-
-def load_all_records(collection: str):
+async def load_all_records(collection: str):
     records = []
     offset = None
     while True:
-        points, offset = qdrant.scroll(
+        points, offset = await qdrant.scroll(
             collection_name=collection, limit=250, offset=offset,
             with_payload=True, with_vectors=False,
         )
         if not points:
             break
         for p in points:
-            data = parse_text_payload(p.payload)
+            data = record_from_payload(p.payload or {})
             if data:
                 records.append(data)
         if offset is None:
@@ -99,17 +106,8 @@ def compute_analytics(invoices, transactions):
         if date:
             monthly_spend[date[:7]] += total
 
-        items_str = inv.get("items", "[]")
-        items = items_str if isinstance(items_str, list) else []
-        if isinstance(items_str, str):
-            try:
-                items = json.loads(items_str.replace("'", '"'))
-            except Exception:
-                try:
-                    items = eval(items_str)
-                except Exception:
-                    items = []
-        for item in items:
+        # Typed records: items is already a list (shared/records.py)
+        for item in inv.get("items", []):
             name = item.get("product", "Unknown")
             product_qty[name] += int(item.get("qty", 0))
             product_revenue[name] += float(item.get("total", 0))
@@ -143,23 +141,33 @@ async def lifespan(app: FastAPI):
     for collection in ["DocumentChunk_text", "TextDocument_name"]:
         for field, schema in [("type", PayloadSchemaType.KEYWORD), ("text", PayloadSchemaType.TEXT)]:
             try:
-                qdrant.create_payload_index(collection_name=collection, field_name=field, field_schema=schema)
+                await qdrant.create_payload_index(collection_name=embed_collection(collection), field_name=field, field_schema=schema)
             except Exception:
                 pass
+    await create_identifier_indexes(qdrant, embed_collection("DocumentChunk_text"))
+    await create_record_indexes(qdrant, embed_collection("DocumentChunk_text"))
 
     print("Loading data from Qdrant...")
-    all_records = load_all_records("DocumentChunk_text")
+    all_records = await load_all_records("DocumentChunk_text")
     # Split into invoices (have invoice_number) and transactions (have transaction_id)
     invoices = [r for r in all_records if "invoice_number" in r]
     transactions = [r for r in all_records if "transaction_id" in r]
     print(f"Loaded {len(invoices)} invoices, {len(transactions)} transactions from DocumentChunk_text")
     analytics_cache["data"] = compute_analytics(invoices, transactions)
     yield
+    await aclose_clients()
+    await close_qdrant()
 
 
 app = FastAPI(title="Spend Analytics Dashboard", lifespan=lifespan)
 
 
+@app.exception_handler(InferenceUnavailable)
+async def inference_unavailable(request: Request, exc: InferenceUnavailable):
+    """Local model queue full (503) or timed out (504)."""
+    return JSONResponse({"error": str(exc)}, status_code=exc.status_code, headers={"Retry-After": "1"})
+
+
 @app.get("/", response_class=HTMLResponse)
 async def dashboard():
     return """
@@ -254,7 +262,7 @@ async def dashboard():
         const data = await res.json();
         document.getElementById('search-results').innerHTML =
             `<p style="color:#888">${data.results.length} results in ${data.time_ms}ms (embed: ${data.embed_ms}ms)</p>` +
-            data.results.map(r => `<div class="search-result"><span class="score">${r.score.toFixed(4)}</span>${formatRecord(r.text)}</div>`).join('');
+            data.results.map(r => `<div class="search-result"><span class="score">${r.score.toFixed(4)}</span>${formatRecord(r.payload?.payload_version ? r.payload : r.text)}</div>`).join('');
     }
     document.getElementById('q').addEventListener('keydown', e => { if (e.key === 'Enter') semanticSearch(); });
 
@@ -295,57 +303,132 @@ async def get_analytics():
     return analytics_cache.get("data", {})
 
 
+@app.get("/api/stats")
+async def stats():
+    """Runtime metrics: embedding batching/caches, inference queues, LLM caches, coalescing."""
+    return {
+        "embeddings": get_embedding_stats(),
+        "inference": get_inference_stats(),
+        "llm": get_llm_stats(),
+        "singleflight": get_singleflight_stats(),
+        "hnsw_ef": get_ef_stats(),
+    }
+
+
 @app.get("/api/search")
-async def semantic_search(q: str = Query(...), limit: int = Query(20)):
-    t0 = time.time()
-    vec = get_embedding(q)
-    embed_ms = round((time.time() - t0) * 1000, 1)
-
-    t1 = time.time()
-    # Prefetch + RRF Fusion: two-stage retrieval pipeline
-    results = qdrant.query_points(
-        collection_name="DocumentChunk_text",
-        prefetch=[
-            Prefetch(query=vec, limit=100),
-            Prefetch(query=vec, limit=50),
-        ],
-        query=FusionQuery(fusion=Fusion.RRF),
-        limit=limit,
-        with_payload=True,
-    )
-    search_ms = round((time.time() - t1) * 1000, 1)
+async def semantic_search(
+    q: str = Query(...),
+    limit: int = Query(20),
+    min_total: float | None = Query(None, description="Min invoice total / transaction amount"),
+    max_total: float | None = Query(None, description="Max invoice total / transaction amount"),
+    date_from: date | None = Query(None, description="Earliest record date (inclusive)"),
+    date_to: date | None = Query(None, description="Latest record date (inclusive)"),
+    vendor_id: str | None = Query(None, description="Comma-separated vendor ids"),
+    product: str | None = Query(None, description="Comma-separated product names"),
+    budget_ms: float | None = Query(None, gt=0, le=10000, description="Search latency budget; picks hnsw_ef to fit"),
+    precision: str | None = Query(None, pattern="^(fast|balanced|exact)$", description="HNSW precision preset"),
+):
+    """
+    Identifier-only queries (INV-/TXN-/V001) are answered from payload indexes
+    without embedding; mixed queries search only the records holding them.
+    Amount, date, vendor and product parameters filter on the typed record
+    fields. budget_ms or precision pick hnsw_ef (or exact search) via
+    shared/ef_controller.py. Identical concurrent queries share one embed +
+    search.
+    """
+    filters = (min_total, max_total, date_from, date_to, vendor_id, product)
+    conditions = record_conditions(*filters)
+    query_filter = Filter(must=conditions) if conditions else None
 
-    items = []
-    for p in results.points:
+    def to_item(p, score):
         payload = p.payload or {}
-        items.append({"id": str(p.id), "score": p.score, "text": payload.get("text", ""), "payload": payload})
+        return {"id": str(p.id), "score": score, "text": payload.get("text", ""), "payload": payload}
+
+    async def run():
+        t0 = time.time()
+        identifiers, remainder = analyze_query(q)
+        exact = []
+        search_filter = query_filter
+        if identifiers:
+            points = await lookup_identifiers(
+                qdrant, embed_collection("DocumentChunk_text"), identifiers, limit, query_filter,
+            )
+            exact = [to_item(p, 1.0) for p in points]
+            if exact and not remainder:
+                ms = round((time.time() - t0) * 1000, 1)
+                return {"results": exact, "time_ms": ms, "embed_ms": 0, "search_ms": ms, "method": "exact_identifier"}
+            if exact:
+                # Scoped to the identifiers: only the rest of the query ranks
+                search_filter = scope_filter(query_filter, identifiers)
+
+        t_embed = time.time()
+        vec = await aget_embedding(remainder if exact else q)
+        embed_ms = round((time.time() - t_embed) * 1000, 1)
+
+        ef_controller = get_ef_controller("api/search")
+        params, hnsw = ef_controller.choose(budget_ms, precision)
+
+        t1 = time.time()
+        # Prefetch + RRF Fusion: two-stage retrieval pipeline
+        with ef_controller.track(hnsw):
+            results = await qdrant.query_points(
+                collection_name=embed_collection("DocumentChunk_text"),
+                prefetch=[
+                    Prefetch(query=vec, filter=search_filter, params=params, limit=100),
+                    Prefetch(query=vec, filter=search_filter, params=params, limit=50),
+                ],
+                query=FusionQuery(fusion=Fusion.RRF),
+                query_filter=search_filter,
+                limit=limit,
+                with_payload=True,
+            )
+        search_ms = round((time.time() - t1) * 1000, 1)
+
+        items = [to_item(p, p.score) for p in results.points]
+        if exact:
+            items = merge_exact(exact, items, identifiers, limit)
+
+        return {
+            "results": items,
+            "time_ms": round((time.time() - t0) * 1000, 1),
+            "embed_ms": embed_ms,
+            "search_ms": search_ms,
+            "method": "exact_identifier+prefetch_rrf_fusion" if exact else "prefetch_rrf_fusion",
+            "hnsw": hnsw,
+        }
 
-    return {"results": items, "time_ms": round((time.time() - t0) * 1000, 1), "embed_ms": embed_ms, "search_ms": search_ms}
+    return await get_flight("search").do(("search", normalize_query(q), limit, filters, budget_ms, precision), run)
 
 
 @app.get("/api/search/grouped")
 async def grouped_vendor_search(q: str = Query(...), limit: int = Query(20)):
     """Group search results by vendor using Qdrant's group API."""
-    vec = get_embedding(q)
-    groups = qdrant.query_points_groups(
-        collection_name="DocumentChunk_text",
-        query=vec,
-        group_by="type",
-        limit=limit,
-        group_size=5,
-        with_payload=True,
-    )
-    result = {}
-    for g in groups.groups:
-        result[str(g.id)] = [{"id": str(h.id), "score": h.score, "payload": h.payload} for h in g.hits]
-    return {"groups": result}
+    async def run():
+        vec = await aget_embedding(q)
+        groups = await qdrant.query_points_groups(
+            collection_name=embed_collection("DocumentChunk_text"),
+            query=vec,
+            group_by="type",
+            limit=limit,
+            group_size=5,
+            with_payload=True,
+        )
+        result = {}
+        for g in groups.groups:
+            result[str(g.id)] = [{"id": str(h.id), "score": h.score, "payload": h.payload} for h in g.hits]
+        return {"groups": result}
 
+    return await get_flight("search/grouped").do(("search/grouped", normalize_query(q), limit), run)
 
-@app.get("/api/insights")
-async def generate_insights(q: str = Query("Summarize spending patterns and flag concerns")):
-    """
-    LLM-powered spend insights: feed analytics summary to LLM for natural language analysis.
-    """
+
+INSIGHTS_SYSTEM_PROMPT = (
+    "You are a spend analytics expert. Analyze the procurement data and provide actionable insights. "
+    "Be specific with numbers."
+)
+
+
+def insights_summary() -> tuple[str, str]:
+    """Compact analytics summary fed to the LLM, and its id for the LLM answer cache."""
     data = analytics_cache.get("data", {})
     summary = json.dumps({
         "total_spend": data.get("total_spend"),
@@ -355,16 +438,65 @@ async def generate_insights(q: str = Query("Summarize spending patterns and flag
         "top_products_revenue": dict(list(data.get("top_products_revenue", {}).items())[:10]),
         "monthly_spend": data.get("monthly_spend", {}),
     }, indent=2, default=str)
+    return summary, hashlib.sha256(summary.encode("utf-8")).hexdigest()
 
-    try:
-        insights = get_llm_response(
-            "You are a spend analytics expert. Analyze the procurement data and provide actionable insights. Be specific with numbers.",
-            f"Procurement data:\n{summary}\n\nAnalysis request: {q}",
-        )
-    except Exception as e:
-        insights = f"LLM error: {e}"
 
-    return {"question": q, "insights": insights, "model": get_model_name()}
+@app.get("/api/insights")
+async def generate_insights(request: Request, q: str = Query("Summarize spending patterns and flag concerns")):
+    """
+    LLM-powered spend insights: feed analytics summary to LLM for natural language analysis.
+    """
+    summary, summary_id = insights_summary()
+
+    async def run():
+        try:
+            insights = await aget_llm_response(
+                INSIGHTS_SYSTEM_PROMPT,
+                f"Procurement data:\n{summary}\n\nAnalysis request: {q}",
+                question=q,
+                context_ids=[summary_id],
+            )
+        except InferenceUnavailable:
+            raise
+        except Exception as e:
+            insights = f"LLM error: {e}"
+        return {"question": q, "insights": insights, "model": get_model_name()}
+
+    # Identical concurrent requests share one LLM call, cancelled once all clients are gone
+    return await cancel_on_disconnect(request, get_flight("insights").do(("insights", q, summary_id), run))
+
+
+@app.get("/api/insights/stream")
+async def stream_insights(q: str = Query("Summarize spending patterns and flag concerns")):
+    """
+    Streaming spend insights (text/event-stream): a "meta" event, then "token"
+    events as the LLM generates, then "done" with timings.
+    """
+    summary, summary_id = insights_summary()
+
+    async def events():
+        yield sse_event("meta", {"question": q, "model": get_model_name()})
+        t0 = time.time()
+        ttft_ms = None
+        try:
+            async for delta in astream_llm_response(
+                INSIGHTS_SYSTEM_PROMPT,
+                f"Procurement data:\n{summary}\n\nAnalysis request: {q}",
+                question=q,
+                context_ids=[summary_id],
+            ):
+                if ttft_ms is None:
+                    ttft_ms = round((time.time() - t0) * 1000, 1)
+                yield sse_event("token", {"text": delta})
+        except InferenceUnavailable as e:
+            yield sse_event("error", {"error": str(e), "status": e.status_code})
+        except Exception as e:
+            yield sse_event("error", {"error": f"LLM error: {e}"})
+        yield sse_event("done", {"ttft_ms": ttft_ms, "llm_ms": round((time.time() - t0) * 1000, 1)})
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 if __name__ == "__main__":
@@ -8,6 +8,7 @@ Local nomic-embed-text + Qdrant advanced features:
 - Scroll API for bulk data loading
 """
 
+import asyncio
 import os
 import sys
 import json
@@ -15,14 +16,15 @@ import time
 import statistics
 from collections import defaultdict
 from contextlib import asynccontextmanager
+from datetime import date
 
 import numpy as np
 from dotenv import load_dotenv
-from fastapi import FastAPI, Query
-from fastapi.responses import HTMLResponse
-from qdrant_client import QdrantClient
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import HTMLResponse, JSONResponse
 from qdrant_client.models import (
     PayloadSchemaType,
+    Filter,
     Prefetch,
     Fusion,
     FusionQuery,
@@ -34,14 +36,27 @@ from qdrant_client.models import (
 load_dotenv()
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
-from shared.llm import init_llm, get_llm_response, get_model_name, is_available as llm_available
-from shared.embeddings import init_embeddings, get_embedding
+from shared.llm import init_llm, aget_llm_response, get_model_name, get_llm_stats, is_available as llm_available
+from shared.embeddings import (
+    init_embeddings,
+    aget_embedding,
+    embed_collection,
+    get_embedding_stats,
+    normalize_query,
+)
+from shared.http_client import aclose_clients
+from shared.qdrant import get_qdrant, close_qdrant
+from shared.records import create_record_indexes, record_conditions, record_from_payload
+from shared.identifiers import analyze_query, create_identifier_indexes, lookup_identifiers, merge_exact, scope_filter
+from shared.singleflight import get_flight, get_singleflight_stats
+from shared.ef_controller import get_ef_controller, get_ef_stats
+from shared.inference import InferenceUnavailable, cancel_on_disconnect, get_inference_stats
 
 EMBED_MODEL_PATH = os.path.join(
     os.path.dirname(__file__), "..", "models", "nomic-embed-text", "nomic-embed-text-v1.5.f16.gguf"
 )
 
-qdrant = QdrantClient(url=os.environ["QDRANT_URL"], api_key=os.environ["QDRANT_API_KEY"])
+qdrant = get_qdrant()
 
 LLM_MODEL_PATH = os.path.join(
     os.path.dirname(__file__), "..", "models", "cognee-distillabs-model-gguf-quantized", "model-quantized.gguf"
@@ -52,33 +67,18 @@ LLM_FALLBACK_PATH = os.path.join(
 anomaly_cache = {}
 
 
-def parse_record(payload):
-    text = payload.get("text", "")
-    if isinstance(text, dict):
-        return text
-    if isinstance(text, str):
-        try:
-            return json.loads(text.replace("'", '"'))
-        except Exception:
-            try:
-                return eval(text)
-            except Exception:
-                return None
-    return None
-
-
-def load_vectors_and_data(collection: str):
+async def load_vectors_and_data(collection: str):
     records = []
     offset = None
     while True:
-        points, offset = qdrant.scroll(
+        points, offset = await qdrant.scroll(
             collection_name=collection, limit=100, offset=offset,
             with_payload=True, with_vectors=True,
         )
         if not points:
             break
         for p in points:
-            data = parse_record(p.payload)
+            data = record_from_payload(p.payload or {})
             if data:
                 records.append({
                     "id": str(p.id), "vector": np.array(p.vector),
@@ -128,7 +128,7 @@ def detect_vector_outliers(records, z_threshold=2.0):
     ], key=lambda x: -float(x["detail"].split("z=")[1].split(")")[0]))
 
 
-def detect_duplicates_via_recommend(records):
+async def detect_duplicates_via_recommend(records):
     """Use Qdrant Batch Query API to find near-duplicate vectors efficiently."""
     from qdrant_client.models import QueryRequest
 
@@ -137,7 +137,7 @@ def detect_duplicates_via_recommend(records):
     batch_size = 50
     scan_records = records[:200]
 
-    for batch_start in range(0, len(scan_records), batch_size):
+    async def query_batch(batch_start):
         batch = scan_records[batch_start : batch_start + batch_size]
         requests = [
             QueryRequest(
@@ -149,17 +149,20 @@ def detect_duplicates_via_recommend(records):
             for r in batch
         ]
         try:
-            responses = qdrant.query_batch_points(
+            responses = await qdrant.query_batch_points(
                 collection_name="DocumentChunk_text",
                 requests=requests,
                 timeout=30,
             )
         except Exception as e:
             print(f"  Batch query error at {batch_start}: {e}")
-            continue
-
+            return batch, []
         print(f"  Duplicate scan: {batch_start + len(batch)}/{len(scan_records)}")
+        return batch, responses
 
+    # Batches are independent: run them concurrently
+    results = await asyncio.gather(*(query_batch(i) for i in range(0, len(scan_records), batch_size)))
+    for batch, responses in results:
         for r, response in zip(batch, responses):
             for match in response.points:
                 if str(match.id) != r["id"]:
@@ -201,12 +204,14 @@ async def lifespan(app: FastAPI):
     # Payload indexes
     for field, schema in [("type", PayloadSchemaType.KEYWORD), ("text", PayloadSchemaType.TEXT)]:
         try:
-            qdrant.create_payload_index(collection_name="DocumentChunk_text", field_name=field, field_schema=schema)
+            await qdrant.create_payload_index(collection_name=embed_collection("DocumentChunk_text"), field_name=field, field_schema=schema)
         except Exception:
             pass
+    await create_identifier_indexes(qdrant, embed_collection("DocumentChunk_text"))
+    await create_record_indexes(qdrant, embed_collection("DocumentChunk_text"))
 
     print("Loading vectors from Qdrant...")
-    invoices = load_vectors_and_data("DocumentChunk_text")
+    invoices = await load_vectors_and_data("DocumentChunk_text")
     print(f"Loaded {len(invoices)} records with vectors")
 
     all_anomalies = []
@@ -215,7 +220,7 @@ async def lifespan(app: FastAPI):
     print("Detecting embedding outliers...")
     all_anomalies.extend(detect_vector_outliers(invoices))
     print("Detecting duplicates via Qdrant Recommend API...")
-    all_anomalies.extend(detect_duplicates_via_recommend(invoices))
+    all_anomalies.extend(await detect_duplicates_via_recommend(invoices))
     print("Detecting vendor anomalies...")
     all_anomalies.extend(detect_vendor_anomalies(invoices))
 
@@ -232,11 +237,19 @@ async def lifespan(app: FastAPI):
     anomaly_cache["summary"] = summary
     print(f"Found {len(all_anomalies)} anomalies")
     yield
+    await aclose_clients()
+    await close_qdrant()
 
 
 app = FastAPI(title="Anomaly Detective", lifespan=lifespan)
 
 
+@app.exception_handler(InferenceUnavailable)
+async def inference_unavailable(request: Request, exc: InferenceUnavailable):
+    """Local model queue full (503) or timed out (504)."""
+    return JSONResponse({"error": str(exc)}, status_code=exc.status_code, headers={"Retry-After": "1"})
+
+
 @app.get("/", response_class=HTMLResponse)
 async def index():
     return """
@@ -365,7 +378,7 @@ async def index():
         el.innerHTML = `<h3 style="color:#ef4444;margin-bottom:0.5rem">Investigation: ${pointId}</h3>
             <p style="color:#888;margin-bottom:0.5rem">${data.similar.length} similar records found in ${data.time_ms}ms</p>` +
             data.similar.map(s => `<div style="padding:0.5rem;border-bottom:1px solid #222">
-                <span style="color:#ef4444">${s.score.toFixed(4)}</span> ${formatAnomalyData(parseText(s.payload?.text) || s.payload)}
+                <span style="color:#ef4444">${s.score.toFixed(4)}</span> ${formatAnomalyData(s.payload?.payload_version ? s.payload : (parseText(s.payload?.text) || s.payload))}
             </div>`).join('');
     }
 
@@ -395,25 +408,86 @@ async def get_anomalies(severity: str = Query(None), anomaly_type: str = Query(N
     return {"anomalies": anomalies, "summary": anomaly_cache.get("summary", {})}
 
 
+@app.get("/api/stats")
+async def stats():
+    """Runtime metrics: embedding batching/caches, inference queues, LLM caches, coalescing."""
+    return {
+        "embeddings": get_embedding_stats(),
+        "inference": get_inference_stats(),
+        "llm": get_llm_stats(),
+        "singleflight": get_singleflight_stats(),
+        "hnsw_ef": get_ef_stats(),
+    }
+
+
 @app.get("/api/search")
-async def semantic_search(q: str = Query(...), limit: int = Query(20)):
-    t0 = time.time()
-    vec = get_embedding(q)
-    embed_ms = round((time.time() - t0) * 1000, 1)
+async def semantic_search(
+    q: str = Query(...),
+    limit: int = Query(20),
+    min_total: float | None = Query(None, description="Min invoice total / transaction amount"),
+    max_total: float | None = Query(None, description="Max invoice total / transaction amount"),
+    date_from: date | None = Query(None, description="Earliest record date (inclusive)"),
+    date_to: date | None = Query(None, description="Latest record date (inclusive)"),
+    vendor_id: str | None = Query(None, description="Comma-separated vendor ids"),
+    product: str | None = Query(None, description="Comma-separated product names"),
+    budget_ms: float | None = Query(None, gt=0, le=10000, description="Search latency budget; picks hnsw_ef to fit"),
+    precision: str | None = Query(None, pattern="^(fast|balanced|exact)$", description="HNSW precision preset"),
+):
+    """
+    Identifier-only queries (INV-/TXN-/V001) are answered from payload indexes
+    without embedding; mixed queries search only the records holding them.
+    Amount, date, vendor and product parameters filter on the typed record
+    fields. budget_ms or precision pick hnsw_ef (or exact search) via
+    shared/ef_controller.py. Identical concurrent queries share one embed +
+    search.
+    """
+    filters = (min_total, max_total, date_from, date_to, vendor_id, product)
+    conditions = record_conditions(*filters)
+    query_filter = Filter(must=conditions) if conditions else None
+
+    async def run():
+        t0 = time.time()
+        identifiers, remainder = analyze_query(q)
+        exact = []
+        search_filter = query_filter
+        if identifiers:
+            points = await lookup_identifiers(
+                qdrant, embed_collection("DocumentChunk_text"), identifiers, limit, query_filter,
+            )
+            exact = [{"id": str(p.id), "score": 1.0, "text": (p.payload or {}).get("text", "")} for p in points]
+            if exact and not remainder:
+                return {"results": exact, "time_ms": round((time.time() - t0) * 1000, 1), "embed_ms": 0, "method": "exact_identifier"}
+            if exact:
+                # Scoped to the identifiers: only the rest of the query ranks
+                search_filter = scope_filter(query_filter, identifiers)
+
+        t_embed = time.time()
+        vec = await aget_embedding(remainder if exact else q)
+        embed_ms = round((time.time() - t_embed) * 1000, 1)
+
+        ef_controller = get_ef_controller("api/search")
+        params, hnsw = ef_controller.choose(budget_ms, precision)
+
+        # Prefetch + RRF Fusion for better ranking
+        with ef_controller.track(hnsw):
+            results = await qdrant.query_points(
+                collection_name=embed_collection("DocumentChunk_text"),
+                prefetch=[
+                    Prefetch(query=vec, filter=search_filter, params=params, limit=100),
+                    Prefetch(query=vec, filter=search_filter, params=params, limit=50),
+                ],
+                query=FusionQuery(fusion=Fusion.RRF),
+                query_filter=search_filter,
+                limit=limit,
+                with_payload=True,
+            )
+        items = [{"id": str(p.id), "score": p.score, "text": (p.payload or {}).get("text", "")} for p in results.points]
+        if exact:
+            items = merge_exact(exact, items, identifiers, limit)
+        method = "exact_identifier+prefetch_rrf_fusion" if exact else "prefetch_rrf_fusion"
+        return {"results": items, "time_ms": round((time.time() - t0) * 1000, 1), "embed_ms": embed_ms, "method": method, "hnsw": hnsw}
 
-    # Prefetch + RRF Fusion for better ranking
-    results = qdrant.query_points(
-        collection_name="DocumentChunk_text",
-        prefetch=[
-            Prefetch(query=vec, limit=100),
-            Prefetch(query=vec, limit=50),
-        ],
-        query=FusionQuery(fusion=Fusion.RRF),
-        limit=limit,
-        with_payload=True,
-    )
-    items = [{"id": str(p.id), "score": p.score, "text": (p.payload or {}).get("text", "")} for p in results.points]
-    return {"results": items, "time_ms": round((time.time() - t0) * 1000, 1), "embed_ms": embed_ms}
+    return await get_flight("search").do(("search", normalize_query(q), limit, filters, budget_ms, precision), run)
 
 
 @app.get("/api/investigate/{point_id}")
@@ -423,7 +497,7 @@ async def investigate(point_id: str):
     Uses RecommendQuery with BEST_SCORE strategy for nuanced similarity.
     """
     t0 = time.time()
-    results = qdrant.query_points(
+    results = await qdrant.query_points(
         collection_name="DocumentChunk_text",
         query=RecommendQuery(
             recommend=RecommendInput(
@@ -444,55 +518,62 @@ async def investigate(point_id: str):
 
 
 @app.get("/api/explain/{point_id}")
-async def explain_anomaly(point_id: str):
+async def explain_anomaly(request: Request, point_id: str):
     """
     LLM-powered anomaly explanation: retrieve the anomaly + similar records, ask LLM to explain.
     Uses Qdrant Recommend API + OpenRouter/Groq/Ollama LLM.
+    Identical concurrent requests share one LLM call.
     """
-    t0 = time.time()
+    async def run():
+        t0 = time.time()
 
-    # Find the anomaly data
-    anomaly = None
-    for a in anomaly_cache.get("anomalies", []):
-        if a["id"] == point_id:
-            anomaly = a
-            break
+        # Find the anomaly data
+        anomaly = None
+        for a in anomaly_cache.get("anomalies", []):
+            if a["id"] == point_id:
+                anomaly = a
+                break
 
-    # Find similar records via Recommend API
-    try:
-        similar = qdrant.query_points(
-            collection_name="DocumentChunk_text",
-            query=RecommendQuery(
-                recommend=RecommendInput(
-                    positive=[point_id],
-                    strategy=RecommendStrategy.BEST_SCORE,
-                )
-            ),
-            limit=5,
-            with_payload=True,
-        )
-        similar_texts = [str((p.payload or {}).get("text", ""))[:300] for p in similar.points]
-    except Exception:
-        similar_texts = []
+        # Find similar records via Recommend API
+        try:
+            similar = await qdrant.query_points(
+                collection_name="DocumentChunk_text",
+                query=RecommendQuery(
+                    recommend=RecommendInput(
+                        positive=[point_id],
+                        strategy=RecommendStrategy.BEST_SCORE,
+                    )
+                ),
+                limit=5,
+                with_payload=True,
+            )
+            similar_texts = [str((p.payload or {}).get("text", ""))[:300] for p in similar.points]
+        except Exception:
+            similar_texts = []
 
-    context = f"Anomaly: {json.dumps(anomaly, default=str)}\n\nSimilar records:\n" + "\n---\n".join(similar_texts)
+        context = f"Anomaly: {json.dumps(anomaly, default=str)}\n\nSimilar records:\n" + "\n---\n".join(similar_texts)
 
-    try:
-        explanation = get_llm_response(
-            "You are a procurement auditor. Explain why this record was flagged as anomalous and what action should be taken. Be specific and concise.",
-            context,
-            max_tokens=300,
-        )
-    except Exception as e:
-        explanation = f"LLM error: {e}"
+        try:
+            explanation = await aget_llm_response(
+                "You are a procurement auditor. Explain why this record was flagged as anomalous and what action should be taken. Be specific and concise.",
+                context,
+                max_tokens=300,
+            )
+        except InferenceUnavailable:
+            raise
+        except Exception as e:
+            explanation = f"LLM error: {e}"
+
+        return {
+            "point_id": point_id,
+            "anomaly": anomaly,
+            "explanation": explanation,
+            "time_ms": round((time.time() - t0) * 1000, 1),
+            "model": get_model_name(),
+        }
 
-    return {
-        "point_id": point_id,
-        "anomaly": anomaly,
-        "explanation": explanation,
-        "time_ms": round((time.time() - t0) * 1000, 1),
-        "model": get_model_name(),
-    }
+    # The shared call is only cancelled once every coalesced client has disconnected
+    return await cancel_on_disconnect(request, get_flight("explain").do(("explain", point_id), run))
 
 
 if __name__ == "__main__":
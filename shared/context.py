@@ -0,0 +1,109 @@
+"""
+Token-budgeted context packing for RAG prompts.
+
+Retrieved chunks are deduplicated (near-identical texts, compared by word
+shingles) and packed greedily in score order until the token budget is full.
+Tokens are counted with the active LLM's tokenizer, so the prompt fits the
+model's context window instead of relying on a fixed character cut.
+
+Environment variables:
+    CONTEXT_TOKEN_BUDGET     - Max context tokens (default: whatever fits in the model's
+                               context window after the prompt and the answer)
+    CONTEXT_DEDUPE_THRESHOLD - Shingle Jaccard similarity at which a chunk counts as a
+                               duplicate of a higher-scored one (default: 0.9)
+    CONTEXT_MIN_CHUNK_TOKENS - A chunk that overflows the remaining budget is truncated
+                               if at least this many tokens are left (default: 64)
+    CONTEXT_CHUNK_TOKENS     - Expected tokens per chunk, used to fetch enough chunks to
+                               fill the budget (default: 100)
+    CONTEXT_MAX_CHUNKS       - Upper bound on chunks fetched for one prompt (default: 100)
+"""
+
+import os
+import re
+
+from shared.llm import context_window, count_tokens, truncate_to_tokens
+
+SEPARATOR = "\n---\n"
+
+# Room for the chat template's special tokens and the "Context:/Question:" framing
+_PROMPT_OVERHEAD = 64
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _shingles(text: str, n: int = 3) -> set:
+    words = _WORD_RE.findall(text.casefold())
+    if len(words) < n:
+        return {tuple(words)}
+    return {tuple(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def context_budget(system_prompt: str, question: str, max_tokens: int = 512) -> int:
+    """Tokens left for context once the prompt and the answer are accounted for."""
+    available = (
+        context_window() - max_tokens - count_tokens(system_prompt) - count_tokens(question) - _PROMPT_OVERHEAD
+    )
+    if os.getenv("CONTEXT_TOKEN_BUDGET"):
+        available = min(available, int(os.environ["CONTEXT_TOKEN_BUDGET"]))
+    return max(0, available)
+
+
+def context_fetch_limit(budget: int, minimum: int) -> int:
+    """Chunks to retrieve so that packing, not the retrieval limit, fills the budget."""
+    per_chunk = max(1, int(os.getenv("CONTEXT_CHUNK_TOKENS", "100")))
+    cap = int(os.getenv("CONTEXT_MAX_CHUNKS", "100"))
+    # Over-fetch by half: duplicates and truncation leave some candidates unused
+    wanted = -(-budget * 3 // (per_chunk * 2))
+    return max(minimum, min(cap, wanted))
+
+
+def pack_context(chunks: list[dict], budget: int) -> tuple[list[dict], dict]:
+    """
+    Pack chunks ({"id", "score", "text"}) into at most `budget` tokens.
+    Returns (packed chunks in score order, packing stats).
+    """
+    threshold = float(os.getenv("CONTEXT_DEDUPE_THRESHOLD", "0.9"))
+    min_chunk = int(os.getenv("CONTEXT_MIN_CHUNK_TOKENS", "64"))
+    separator_tokens = count_tokens(SEPARATOR)
+
+    packed, kept_shingles = [], []
+    used = dropped_tokens = duplicates = truncated = 0
+    for chunk in sorted(chunks, key=lambda c: c.get("score") or 0, reverse=True):
+        text = (chunk.get("text") or "").strip()
+        if not text:
+            continue
+        shingles = _shingles(text)
+        if any(len(shingles & other) / len(shingles | other) >= threshold for other in kept_shingles):
+            duplicates += 1
+            continue
+
+        tokens = count_tokens(text)
+        cost = tokens + (separator_tokens if packed else 0)
+        remaining = budget - used
+        if cost > remaining:
+            room = remaining - (separator_tokens if packed else 0)
+            if room < min_chunk:
+                dropped_tokens += tokens
+                continue
+            text = truncate_to_tokens(text, room)
+            dropped_tokens += tokens - room
+            tokens, cost = room, remaining
+            truncated += 1
+
+        packed.append({**chunk, "text": text, "tokens": tokens})
+        kept_shingles.append(shingles)
+        used += cost
+
+    return packed, {
+        "budget_tokens": budget,
+        "packed_tokens": used,
+        "dropped_tokens": dropped_tokens,
+        "chunks_packed": len(packed),
+        "chunks_dropped": len(chunks) - len(packed),
+        "duplicates": duplicates,
+        "truncated": truncated,
+    }
+
+
+def join_context(packed: list[dict]) -> str:
+    return SEPARATOR.join(chunk["text"] for chunk in packed)
@@ -0,0 +1,152 @@
+"""
+Latency-budgeted HNSW ef for search endpoints.
+
+A search can ask for precision=fast|balanced|exact or for a budget_ms. The
+controller turns that into SearchParams:
+
+    exact     - exact=True (brute force, for audits); never backed off
+    fast      - HNSW_EF_FAST
+    balanced  - HNSW_EF_BALANCED, stepped down one level under load
+    budget_ms - the largest ef whose predicted latency fits the budget
+
+Predictions come from an ef -> latency curve learned per kind of search
+(an exponentially weighted average of observed search_ms per ef level).
+Levels not measured yet are extrapolated linearly in ef from the nearest
+measured level below, so the controller explores upwards only while the
+budget allows. Under load the predictions are scaled by the number of
+searches in flight relative to HNSW_EF_CONCURRENCY, which steps ef down
+before queueing pushes latency over the budget. Without either parameter
+the collection's default ef is used, as before.
+
+Environment variables:
+    HNSW_EF_LEVELS      - ef values the controller chooses from (default: 16,32,64,128,256,512)
+    HNSW_EF_FAST        - ef for precision=fast (default: 32)
+    HNSW_EF_BALANCED    - ef for precision=balanced (default: 128)
+    HNSW_EF_CONCURRENCY - In-flight searches per process before backing off (default: 8)
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+from qdrant_client.models import SearchParams
+
+# Weight of the newest observation in the latency averages
+_ALPHA = 0.2
+
+_controllers = {}
+
+
+def _levels() -> list[int]:
+    return sorted(int(v) for v in os.getenv("HNSW_EF_LEVELS", "16,32,64,128,256,512").split(","))
+
+
+class EfController:
+    def __init__(self, name: str):
+        self.name = name
+        self.levels = _levels()
+        self.fast = int(os.getenv("HNSW_EF_FAST", "32"))
+        self.balanced = int(os.getenv("HNSW_EF_BALANCED", "128"))
+        self.concurrency = int(os.getenv("HNSW_EF_CONCURRENCY", "8"))
+        self.in_flight = 0
+        self.backoffs = 0
+        self._latency = {}
+        self._samples = {}
+
+    @property
+    def pressure(self) -> float:
+        """>1 when more searches are in flight than HNSW_EF_CONCURRENCY."""
+        return max(1.0, self.in_flight / self.concurrency)
+
+    def predict(self, ef: int) -> float | None:
+        """Expected search_ms at ef without load, or None before any observation."""
+        if ef in self._latency:
+            return self._latency[ef]
+        measured = sorted(self._latency)
+        if not measured:
+            return None
+        below = [m for m in measured if m < ef]
+        if below:
+            return self._latency[below[-1]] * ef / below[-1]
+        return self._latency[measured[0]]
+
+    def _step_down(self, ef: int) -> int:
+        lower = [level for level in self.levels if level < ef]
+        return lower[-1] if lower else ef
+
+    def choose(self, budget_ms: float | None = None, precision: str | None = None) -> tuple[SearchParams | None, dict | None]:
+        """SearchParams for a request plus a description of the decision (None, None = collection default)."""
+        if precision == "exact":
+            return SearchParams(exact=True), {"exact": True}
+        if budget_ms is not None:
+            ef = self.levels[0]
+            for level in self.levels:
+                predicted = self.predict(level)
+                if predicted is None:
+                    # Nothing learned yet: start at the fast setting
+                    ef = min(self.fast, self.levels[-1])
+                    break
+                if predicted * self.pressure <= budget_ms:
+                    ef = level
+            if self.pressure > 1:
+                self.backoffs += 1
+            predicted = self.predict(ef)
+            return SearchParams(hnsw_ef=ef), {
+                "hnsw_ef": ef,
+                "budget_ms": budget_ms,
+                "predicted_ms": round(predicted * self.pressure, 1) if predicted is not None else None,
+            }
+        if precision in ("fast", "balanced"):
+            ef = self.fast if precision == "fast" else self.balanced
+            if precision == "balanced" and self.pressure > 1:
+                ef = self._step_down(ef)
+                self.backoffs += 1
+            return SearchParams(hnsw_ef=ef), {"hnsw_ef": ef, "precision": precision}
+        return None, None
+
+    def record(self, ef: int, search_ms: float):
+        """Fold an observed search latency into the curve (normalized by the load it ran under)."""
+        previous = self._latency.get(ef)
+        self._latency[ef] = search_ms if previous is None else (1 - _ALPHA) * previous + _ALPHA * search_ms
+        self._samples[ef] = self._samples.get(ef, 0) + 1
+
+    @contextmanager
+    def track(self, decision: dict | None):
+        """Count the search as in flight and, for HNSW searches, learn from its latency."""
+        self.in_flight += 1
+        pressure = self.pressure
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+        if decision and decision.get("hnsw_ef"):
+            self.record(decision["hnsw_ef"], (time.perf_counter() - t0) * 1000 / pressure)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "backoffs": self.backoffs,
+            "curve_ms": {ef: round(ms, 2) for ef, ms in sorted(self._latency.items())},
+            "samples": dict(sorted(self._samples.items())),
+        }
+
+
+def get_ef_controller(name: str) -> EfController:
+    """Process-wide controller for one kind of search, created on first use."""
+    controller = _controllers.get(name)
+    if controller is None:
+        controller = EfController(name)
+        _controllers[name] = controller
+    return controller
+
+
+def get_ef_stats() -> dict:
+    return {name: controller.stats() for name, controller in _controllers.items()}
+
+
+def merge_search_params(base: SearchParams | None, extra: SearchParams | None) -> SearchParams | None:
+    """Combine two SearchParams (e.g. quantization options and the chosen ef)."""
+    if base is None or extra is None:
+        return base or extra
+    return base.model_copy(update=extra.model_dump(exclude_unset=True))
@@ -0,0 +1,156 @@
+"""
+Persistent embedding store shared across processes (SQLite, WAL mode).
+
+Second tier behind the in-process cache in shared/embeddings.py: every app and
+uvicorn worker pointing EMBED_STORE_PATH at the same file reads and writes the
+same store, and it survives restarts. WAL mode lets readers run while one
+writer commits; concurrent writers wait on SQLite's lock (busy timeout) and a
+write that still fails is dropped, since the store is only a cache.
+
+Environment variables:
+    EMBED_STORE_PATH        - SQLite file path; unset disables the store
+    EMBED_STORE_MAX_ENTRIES - Size cap; least-recently-used rows are evicted (default: 100000)
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# Only refresh last_used on reads when it is older than this, to keep reads read-only
+_TOUCH_INTERVAL = 300
+# Check the size cap once per this many writes
+_EVICT_EVERY = 200
+
+
+class EmbeddingStore:
+    def __init__(self, path: str, max_entries: int = 100_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.write_errors = 0
+        self._writes = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, dim INTEGER NOT NULL, vector BLOB NOT NULL,"
+            " created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread: async callers reach the store via worker threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level="DEFERRED")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(parts: tuple[str, ...]) -> str:
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: list[str]) -> dict[str, np.ndarray]:
+        """Stored vectors for the keys that are present."""
+        if not keys:
+            return {}
+        try:
+            conn = self._conn()
+            marks = ",".join("?" * len(keys))
+            rows = conn.execute(
+                f"SELECT key, vector, last_used FROM embeddings WHERE key IN ({marks})", keys
+            ).fetchall()
+        except sqlite3.Error:
+            rows = []
+
+        found = {key: np.frombuffer(blob, dtype=np.float32) for key, blob, _ in rows}
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+
+        now = time.time()
+        stale = [key for key, _, last_used in rows if now - last_used > _TOUCH_INTERVAL]
+        if stale:
+            self._write(lambda c: c.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in stale]
+            ))
+        return found
+
+    def put_many(self, items: list[tuple[str, list[float]]]):
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, vector in items:
+            array = np.asarray(vector, dtype=np.float32)
+            rows.append((key, len(array), array.tobytes(), now, now))
+        self._write(lambda c: c.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, dim, vector, created, last_used) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        ))
+
+        with self._lock:
+            self._writes += len(rows)
+            evict = self._writes >= _EVICT_EVERY
+            if evict:
+                self._writes = 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """Trim the store to max_entries by dropping the least recently used rows."""
+        self._write(lambda c: c.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            " SELECT key FROM embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ))
+
+    def _write(self, fn):
+        try:
+            conn = self._conn()
+            with conn:
+                fn(conn)
+        except sqlite3.Error:
+            with self._lock:
+                self.write_errors += 1
+
+    def stats(self) -> dict:
+        try:
+            entries = self._conn().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+            "write_errors": self.write_errors,
+        }
+
+
+_store = None
+
+
+def get_store() -> EmbeddingStore | None:
+    """Process-wide store, or None when EMBED_STORE_PATH is unset."""
+    global _store
+    path = os.getenv("EMBED_STORE_PATH")
+    if not path:
+        return None
+    if _store is None or _store.path != path:
+        _store = EmbeddingStore(path, int(os.getenv("EMBED_STORE_MAX_ENTRIES", "100000")))
+    return _store
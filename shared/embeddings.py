@@ -9,23 +9,120 @@ Environment variables:
     EMBED_API_URL    - API base URL for remote mode
     EMBED_API_KEY    - API key for remote mode
     EMBED_MODEL_NAME - Model name for remote mode (default: nomic-embed-text)
+    EMBED_DIM        - Matryoshka truncation for nomic-embed-text v1.5, e.g. 256 or 512.
+                       Unset or 768 keeps full vectors. Searches then go to the
+                       "<collection>_<dim>" collections (see embed_collection)
+    EMBED_BATCH_SIZE   - Max texts per backend call in get_embeddings (default: 32)
+    EMBED_BATCH_TOKENS - Approximate token budget per backend call (default: EMBED_N_BATCH)
+    EMBED_MICROBATCH   - "true" to coalesce concurrent aget_embedding calls into one
+                         backend call (default: true)
+    EMBED_BATCH_WAIT_MS - Max time a query waits for others to join its batch (default: 2)
+    EMBED_CACHE           - "true" to cache query embeddings in process (default: true)
+    EMBED_CACHE_SIZE      - Max cached embeddings (default: 10000)
+    EMBED_CACHE_MAX_BYTES - Memory cap for cached vectors and keys (default: 67108864)
+    EMBED_CACHE_TTL       - Seconds before a cached embedding expires, 0 = never (default: 0)
+    EMBED_INSTANCES       - Local model instances in the embedding pool (default: 1)
+    EMBED_N_THREADS       - CPU threads per local instance (default: cores / instances)
+    EMBED_N_BATCH         - Local model batch size (default: 512)
+    EMBED_MAX_QUEUE       - Local embed batches allowed to wait per instance before new
+                            calls get 503 (default: 64)
+    EMBED_TIMEOUT         - Seconds before a local embed call is abandoned with 504 (default: 30)
+    EMBED_STORE_PATH      - Optional SQLite file for a persistent, cross-process embedding
+                            store behind the in-process cache (see shared/embedding_store.py)
 """
 
+import asyncio
 import os
-import requests
+import sys
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+from shared.embedding_store import get_store
+from shared.http_client import get_async_client, get_session, timeout
+from shared.inference import InferenceBusy, get_executor
 
 _local_model = None
+_local_models = []
 _mode = None
+_batcher = None
+_cache = None
+_model_name = None
+
+QUERY_PREFIX = "search_query: "
+FULL_DIM = 768
 
 
 def _get_mode():
     return os.getenv("EMBED_MODE", "local")
 
 
+def _batch_size() -> int:
+    return max(1, int(os.getenv("EMBED_BATCH_SIZE", "32")))
+
+
+def _n_batch() -> int:
+    return int(os.getenv("EMBED_N_BATCH", "512"))
+
+
+def _batch_tokens() -> int:
+    return max(1, int(os.getenv("EMBED_BATCH_TOKENS", str(_n_batch()))))
+
+
+def _microbatch_enabled() -> bool:
+    return os.getenv("EMBED_MICROBATCH", "true").lower() == "true"
+
+
+def embed_dim() -> int | None:
+    """Truncated dimension from EMBED_DIM, or None when using full vectors."""
+    dim = int(os.getenv("EMBED_DIM", "0") or 0)
+    return dim if 0 < dim < FULL_DIM else None
+
+
+def embed_collection(name: str) -> str:
+    """Qdrant collection holding vectors at the configured EMBED_DIM."""
+    dim = embed_dim()
+    return f"{name}_{dim}" if dim else name
+
+
+def truncate_embedding(vector, dim: int) -> list[float]:
+    """
+    Matryoshka truncation as specified for nomic-embed-text v1.5: layer-norm the
+    full vector, keep the first `dim` components, then L2-normalize.
+    """
+    v = np.asarray(vector, dtype=np.float32)
+    if dim >= len(v):
+        return v.tolist()
+    v = (v - v.mean()) / np.sqrt(v.var() + 1e-5)
+    v = v[:dim]
+    return (v / np.linalg.norm(v)).tolist()
+
+
+def _truncate_all(vectors: list[list[float]]) -> list[list[float]]:
+    dim = embed_dim()
+    if dim is None:
+        return vectors
+    return [truncate_embedding(v, dim) for v in vectors]
+
+
+def _n_threads(instances: int) -> int:
+    if os.getenv("EMBED_N_THREADS"):
+        return int(os.environ["EMBED_N_THREADS"])
+    return max(1, (os.cpu_count() or 1) // instances)
+
+
 def init_embeddings(model_path: str | None = None):
-    """Initialize the embedding backend."""
-    global _local_model, _mode
+    """
+    Initialize the embedding backend.
+    In local mode, loads EMBED_INSTANCES copies of the model. The GGUF file is
+    mmapped, so the instances share weight pages and each adds only its context.
+    """
+    global _local_model, _local_models, _mode, _model_name
     _mode = _get_mode()
+    _model_name = _current_model_name(model_path)
 
     if _mode == "remote":
         print(f"Embedding mode: remote ({os.getenv('EMBED_API_URL', 'not set')})")
@@ -33,14 +130,22 @@ def init_embeddings(model_path: str | None = None):
 
     from llama_cpp import Llama
     if model_path and os.path.exists(model_path):
-        print("Loading nomic-embed-text model...")
-        _local_model = Llama(
-            model_path=model_path,
-            embedding=True,
-            n_ctx=2048,
-            n_batch=512,
-            verbose=False,
-        )
+        instances = max(1, int(os.getenv("EMBED_INSTANCES", "1")))
+        n_threads = _n_threads(instances)
+        print(f"Loading nomic-embed-text model ({instances} x {n_threads} threads)...")
+        _local_models = [
+            Llama(
+                model_path=model_path,
+                embedding=True,
+                n_ctx=2048,
+                n_batch=_n_batch(),
+                n_threads=n_threads,
+                use_mmap=True,
+                verbose=False,
+            )
+            for _ in range(instances)
+        ]
+        _local_model = _local_models[0]
         print("Embedding model loaded.")
     else:
         print(f"WARNING: Embedding model not found at {model_path}")
@@ -48,20 +153,119 @@ def init_embeddings(model_path: str | None = None):
 
 def get_embedding(text: str) -> list[float]:
     """Embed text using either local or remote backend."""
+    return get_embeddings([text])[0]
+
+
+async def aget_embedding(text: str) -> list[float]:
+    """Async get_embedding: remote calls use the pooled async client, local runs off the event loop."""
+    vectors, missing = await _acache_lookup([text])
+    if not missing:
+        return vectors[0]
+
+    if _microbatch_enabled():
+        vector = await _get_batcher().embed(text)
+    else:
+        vector = (await _aembed_batches([text]))[0]
+
+    await _acache_fill([text], missing, [vector], vectors)
+    return vector
+
+
+def get_embeddings(texts: list[str]) -> list[list[float]]:
+    """
+    Embed a list of texts, sending them to the backend in as few calls as possible.
+    Texts are grouped into batches bounded by EMBED_BATCH_SIZE and EMBED_BATCH_TOKENS.
+    Results are returned in input order; cached texts are not re-embedded.
+    """
+    vectors, missing = _cache_lookup(texts)
+    if missing:
+        computed = _embed_batches([texts[i] for i in missing])
+        _cache_fill(texts, missing, computed, vectors)
+    return vectors
+
+
+async def aget_embeddings(texts: list[str]) -> list[list[float]]:
+    """Async get_embeddings, safe to await from FastAPI handlers."""
+    vectors, missing = await _acache_lookup(texts)
+    if missing:
+        computed = await _aembed_batches([texts[i] for i in missing])
+        await _acache_fill(texts, missing, computed, vectors)
+    return vectors
+
+
+def _embed_batches(texts: list[str]) -> list[list[float]]:
     mode = _mode or _get_mode()
+    embed = _remote_embed if mode == "remote" else _local_embed
+
+    vectors = []
+    for batch in _make_batches(texts):
+        vectors.extend(embed(batch))
+    return _truncate_all(vectors)
+
+
+async def _aembed_batches(texts: list[str]) -> list[list[float]]:
+    mode = _mode or _get_mode()
+    batches = _make_batches(texts)
+
     if mode == "remote":
-        return _remote_embed(text)
-    return _local_embed(text)
+        vectors = []
+        for batch in batches:
+            vectors.extend(await _aremote_embed(batch))
+        return _truncate_all(vectors)
+
+    # Local: spread batches over the instance pool and run them concurrently
+    results = await asyncio.gather(*(_alocal_embed(batch) for batch in batches))
+    return _truncate_all([vector for result in results for vector in result])
+
 
+def _pool_executors() -> list:
+    max_queue = int(os.getenv("EMBED_MAX_QUEUE", "64"))
+    timeout = float(os.getenv("EMBED_TIMEOUT", "30"))
+    return [
+        get_executor(f"embeddings-{i}", max_queue=max_queue, timeout=timeout)
+        for i in range(max(1, len(_local_models)))
+    ]
 
-def _local_embed(text: str) -> list[float]:
-    if _local_model is None:
+
+async def _alocal_embed(texts: list[str]) -> list[list[float]]:
+    """Run one batch on the least-loaded instance in the pool."""
+    executors = _pool_executors()
+    i = min(range(len(executors)), key=lambda k: executors[k].pending)
+    model = _local_models[i] if _local_models else None
+    return await executors[i].run(_local_embed, texts, model)
+
+
+def _count_tokens(text: str) -> int:
+    """Token count with the local tokenizer, or a ~4 chars/token estimate for remote."""
+    if _local_model is not None:
+        return len(_local_model.tokenize(f"{QUERY_PREFIX}{text}".encode("utf-8")))
+    return len(QUERY_PREFIX + text) // 4 + 1
+
+
+def _make_batches(texts: list[str]) -> list[list[str]]:
+    max_size, max_tokens = _batch_size(), _batch_tokens()
+    batches, current, current_tokens = [], [], 0
+    for text in texts:
+        n = _count_tokens(text)
+        if current and (len(current) >= max_size or current_tokens + n > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += n
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _local_embed(texts: list[str], model=None) -> list[list[float]]:
+    model = model or _local_model
+    if model is None:
         raise RuntimeError("No local embedding model loaded.")
-    result = _local_model.embed(f"search_query: {text}")
-    return result[0] if isinstance(result[0], list) else result
+    result = model.embed([f"{QUERY_PREFIX}{t}" for t in texts])
+    return [list(v) for v in result]
 
 
-def _remote_embed(text: str) -> list[float]:
+def _remote_request(texts: list[str]) -> tuple[str, dict, dict]:
     api_url = os.getenv("EMBED_API_URL")
     api_key = os.getenv("EMBED_API_KEY", "")
     model_name = os.getenv("EMBED_MODEL_NAME", "nomic-embed-text")
@@ -73,11 +277,316 @@ def _remote_embed(text: str) -> list[float]:
     if api_key:
         headers["Authorization"] = f"Bearer {api_key}"
 
-    r = requests.post(
-        f"{api_url.rstrip('/')}/embeddings",
-        headers=headers,
-        json={"model": model_name, "input": f"search_query: {text}"},
-        timeout=30,
-    )
+    payload = {"model": model_name, "input": [f"{QUERY_PREFIX}{t}" for t in texts]}
+    return f"{api_url.rstrip('/')}/embeddings", headers, payload
+
+
+def _parse_remote(body: dict) -> list[list[float]]:
+    data = sorted(body["data"], key=lambda d: d.get("index", 0))
+    return [d["embedding"] for d in data]
+
+
+def _remote_embed(texts: list[str]) -> list[list[float]]:
+    url, headers, payload = _remote_request(texts)
+    r = get_session().post(url, headers=headers, json=payload, timeout=timeout(30))
+    r.raise_for_status()
+    return _parse_remote(r.json())
+
+
+async def _aremote_embed(texts: list[str]) -> list[list[float]]:
+    url, headers, payload = _remote_request(texts)
+    r = await get_async_client(url).post(url, headers=headers, json=payload, timeout=30)
     r.raise_for_status()
-    return r.json()["data"][0]["embedding"]
+    return _parse_remote(r.json())
+
+
+class EmbeddingBatcher:
+    """
+    Dynamic micro-batching for concurrent aget_embedding calls.
+
+    Queries queue up while every pool instance is busy; when one frees up the worker
+    takes everything queued (waiting at most max_wait_ms for stragglers, up to max_batch)
+    and embeds it in one backend call. An idle server adds at most max_wait_ms.
+    """
+
+    def __init__(self, max_batch: int, max_wait_ms: float):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._pool_slots = None
+        self._task = self.loop.create_task(self._run())
+        self.requests = 0
+        self.batches = 0
+        self.max_batch_seen = 0
+        self.queue_wait_ms_total = 0.0
+        self.queue_wait_ms_max = 0.0
+
+    async def embed(self, text: str) -> list[float]:
+        if self._queue.qsize() >= int(os.getenv("EMBED_MAX_QUEUE", "64")) * self.max_batch:
+            raise InferenceBusy("embedding queue full")
+        future = self.loop.create_future()
+        self._queue.put_nowait((text, future, time.perf_counter()))
+        return await future
+
+    async def _run(self):
+        while True:
+            # Local mode: wait for a free pool instance before collecting, so queries
+            # keep accumulating into the next batch while every instance is busy
+            remote = (_mode or _get_mode()) == "remote"
+            if not remote:
+                await self._slots().acquire()
+            batch = [await self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            task = self.loop.create_task(self._dispatch(batch))
+            if not remote:
+                task.add_done_callback(lambda _: self._slots().release())
+
+    def _slots(self) -> asyncio.Semaphore:
+        if self._pool_slots is None:
+            self._pool_slots = asyncio.Semaphore(max(1, len(_local_models)))
+        return self._pool_slots
+
+    async def _dispatch(self, batch: list):
+        now = time.perf_counter()
+        batch = [(text, future, queued) for text, future, queued in batch if not future.done()]
+        if not batch:
+            return
+
+        self.requests += len(batch)
+        self.batches += 1
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        for _, _, queued in batch:
+            wait_ms = (now - queued) * 1000
+            self.queue_wait_ms_total += wait_ms
+            self.queue_wait_ms_max = max(self.queue_wait_ms_max, wait_ms)
+
+        unique = list(dict.fromkeys(text for text, _, _ in batch))
+        try:
+            vectors = dict(zip(unique, await _aembed_batches(unique)))
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, future, _ in batch:
+            if not future.done():
+                future.set_result(vectors[text])
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0,
+            "max_batch_size": self.max_batch_seen,
+            "avg_queue_wait_ms": round(self.queue_wait_ms_total / self.requests, 3) if self.requests else 0,
+            "max_queue_wait_ms": round(self.queue_wait_ms_max, 3),
+        }
+
+
+def _get_batcher() -> EmbeddingBatcher:
+    global _batcher
+    loop = asyncio.get_running_loop()
+    if _batcher is None or _batcher.loop is not loop:
+        _batcher = EmbeddingBatcher(_batch_size(), float(os.getenv("EMBED_BATCH_WAIT_MS", "2")))
+    return _batcher
+
+
+class EmbeddingCache:
+    """
+    Bounded in-process LRU cache of query embeddings.
+
+    Keys are normalized query text plus model name, embed mode and dimension, so
+    "Laptop  purchases" and "laptop purchases" share an entry. Vectors are
+    stored as float32 arrays. Entries are evicted least-recently-used when
+    either max_entries or max_bytes is exceeded, and expire after ttl seconds
+    when ttl > 0.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float = 0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text: str) -> np.ndarray | None:
+        key = _cache_key(text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[1] > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, text: str, vector: list[float]):
+        key = _cache_key(text)
+        array = np.asarray(vector, dtype=np.float32)
+        size = array.nbytes + sys.getsizeof(key[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (array, time.monotonic(), size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+            "evictions": self.evictions,
+        }
+
+
+def normalize_query(text: str) -> str:
+    """Cache-key form of a query: NFKC, case-folded, whitespace collapsed."""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def _cache_key(text: str) -> tuple[str, str, str, str]:
+    model = _model_name or _current_model_name()
+    return (normalize_query(text), model, _mode or _get_mode(), str(embed_dim() or FULL_DIM))
+
+
+def _current_model_name(model_path: str | None = None) -> str:
+    if (_mode or _get_mode()) == "remote":
+        return os.getenv("EMBED_MODEL_NAME", "nomic-embed-text")
+    return os.path.basename(model_path) if model_path else "local"
+
+
+def _get_cache() -> EmbeddingCache | None:
+    global _cache
+    if os.getenv("EMBED_CACHE", "true").lower() != "true":
+        return None
+    if _cache is None:
+        _cache = EmbeddingCache(
+            max_entries=int(os.getenv("EMBED_CACHE_SIZE", "10000")),
+            max_bytes=int(os.getenv("EMBED_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            ttl=float(os.getenv("EMBED_CACHE_TTL", "0")),
+        )
+    return _cache
+
+
+def _cache_lookup(texts: list[str]) -> tuple[list, list[int]]:
+    """
+    Cached vectors in input order (None for misses) and the indexes of the misses.
+    Checks the in-process cache first, then the persistent store if configured.
+    """
+    vectors, missing = _memory_lookup(texts)
+    store = get_store()
+    if store is not None and missing:
+        missing = _merge_stored(texts, vectors, missing, _store_get(store, texts, missing))
+    return vectors, missing
+
+
+async def _acache_lookup(texts: list[str]) -> tuple[list, list[int]]:
+    """_cache_lookup with the store read (SQLite, up to its busy timeout) off the event loop."""
+    vectors, missing = _memory_lookup(texts)
+    store = get_store()
+    if store is not None and missing:
+        found = await asyncio.to_thread(_store_get, store, texts, missing)
+        missing = _merge_stored(texts, vectors, missing, found)
+    return vectors, missing
+
+
+def _memory_lookup(texts: list[str]) -> tuple[list, list[int]]:
+    cache = _get_cache()
+    vectors = [None] * len(texts)
+    if cache is not None:
+        for i, text in enumerate(texts):
+            vector = cache.get(text)
+            if vector is not None:
+                vectors[i] = vector.tolist()
+    return vectors, [i for i, v in enumerate(vectors) if v is None]
+
+
+def _store_get(store, texts: list[str], missing: list[int]) -> dict[int, np.ndarray]:
+    keys = {i: store.make_key(_cache_key(texts[i])) for i in missing}
+    found = store.get_many(list(set(keys.values())))
+    return {i: found[keys[i]] for i in missing if keys[i] in found}
+
+
+def _merge_stored(texts: list[str], vectors: list, missing: list[int], found: dict[int, np.ndarray]) -> list[int]:
+    """Copy store hits into vectors (and the in-process cache); returns the remaining misses."""
+    cache = _get_cache()
+    for i, vector in found.items():
+        vectors[i] = vector.tolist()
+        if cache is not None:
+            cache.put(texts[i], vector)
+    return [i for i in missing if vectors[i] is None]
+
+
+def _cache_fill(texts: list[str], missing: list[int], computed: list[list[float]], vectors: list):
+    _memory_fill(texts, missing, computed, vectors)
+    store = get_store()
+    if store is not None:
+        _store_put(store, texts, missing, computed)
+
+
+async def _acache_fill(texts: list[str], missing: list[int], computed: list[list[float]], vectors: list):
+    """_cache_fill with the store write off the event loop."""
+    _memory_fill(texts, missing, computed, vectors)
+    store = get_store()
+    if store is not None:
+        await asyncio.to_thread(_store_put, store, texts, missing, computed)
+
+
+def _memory_fill(texts: list[str], missing: list[int], computed: list[list[float]], vectors: list):
+    cache = _get_cache()
+    for i, vector in zip(missing, computed):
+        vectors[i] = vector
+        if cache is not None:
+            cache.put(texts[i], vector)
+
+
+def _store_put(store, texts: list[str], missing: list[int], computed: list[list[float]]):
+    store.put_many([(store.make_key(_cache_key(texts[i])), vector) for i, vector in zip(missing, computed)])
+
+
+def get_embedding_stats() -> dict:
+    """Embedding metrics for the apps' stats endpoints."""
+    return {
+        "mode": _mode or _get_mode(),
+        "instances": len(_local_models),
+        "microbatch": _batcher.stats() if _batcher is not None else None,
+        "cache": _cache.stats() if _cache is not None else None,
+        "store": get_store().stats() if get_store() is not None else None,
+    }
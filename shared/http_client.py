@@ -0,0 +1,87 @@
+"""
+Pooled HTTP clients for the remote embedding and LLM backends.
+
+One keep-alive connection pool is kept per API host, so repeated calls reuse
+TCP/TLS connections instead of opening a new one per request. Sync callers get
+a shared requests.Session; async callers get an httpx.AsyncClient (HTTP/2 when
+the h2 package is installed).
+
+Environment variables:
+    HTTP_MAX_CONNECTIONS  - Max open connections per host (default: 20)
+    HTTP_MAX_KEEPALIVE    - Max idle keep-alive connections per host (default: 10)
+    HTTP_KEEPALIVE_EXPIRY - Seconds an idle connection is kept open (default: 30)
+    HTTP_CONNECT_TIMEOUT  - Connect timeout in seconds (default: 5)
+    HTTP2                 - "true" to negotiate HTTP/2 when available (default: true)
+"""
+
+import importlib.util
+import os
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_session = None
+_async_clients = {}
+
+
+def _max_connections() -> int:
+    return int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+
+
+def _max_keepalive() -> int:
+    return int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+
+
+def _connect_timeout() -> float:
+    return float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+
+
+def _http2_enabled() -> bool:
+    if os.getenv("HTTP2", "true").lower() != "true":
+        return False
+    return importlib.util.find_spec("h2") is not None
+
+
+def get_session() -> requests.Session:
+    """Shared requests.Session with a per-host connection pool."""
+    global _session
+    if _session is None:
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=_max_connections())
+        _session = requests.Session()
+        _session.mount("http://", adapter)
+        _session.mount("https://", adapter)
+    return _session
+
+
+def timeout(read: float) -> tuple[float, float]:
+    """(connect, read) timeout tuple for requests."""
+    return (_connect_timeout(), read)
+
+
+def get_async_client(url: str):
+    """Shared httpx.AsyncClient for the host of `url`, created on first use."""
+    import httpx
+
+    parts = urlsplit(url)
+    host = f"{parts.scheme}://{parts.netloc}"
+    client = _async_clients.get(host)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            http2=_http2_enabled(),
+            limits=httpx.Limits(
+                max_connections=_max_connections(),
+                max_keepalive_connections=_max_keepalive(),
+                keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30")),
+            ),
+            timeout=httpx.Timeout(60, connect=_connect_timeout()),
+        )
+        _async_clients[host] = client
+    return client
+
+
+async def aclose_clients():
+    """Close all pooled async clients. Call from the app's lifespan on shutdown."""
+    for client in list(_async_clients.values()):
+        await client.aclose()
+    _async_clients.clear()
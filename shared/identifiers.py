@@ -0,0 +1,124 @@
+"""
+Exact-identifier lookups that bypass the embedder.
+
+Queries naming an invoice (INV-2026-001), transaction (TXN-2026-0001) or
+vendor (V001) are answered from payload indexes: a keyword index on the typed
+field when the payload has one, otherwise the full-text index on "text"
+(cognee stores records as text). Text matches are verified against the exact
+identifier, so "INV-2026-001" never returns INV-2026-0011.
+
+A query made only of identifiers skips embedding and vector search entirely.
+A mixed query ("laptops from V001") runs the semantic search scoped to the
+records holding the identifiers, so the free text ranks them; named invoices
+and transactions (unique) are pinned first.
+"""
+
+import re
+
+from qdrant_client.models import FieldCondition, Filter, MatchAny, MatchText, PayloadSchemaType
+
+IDENTIFIER_PATTERNS = {
+    "invoice_number": re.compile(r"\bINV-\d{4}-\d{3,}\b", re.IGNORECASE),
+    "transaction_id": re.compile(r"\bTXN-\d{4}-\d{4,}\b", re.IGNORECASE),
+    "vendor_id": re.compile(r"\bV\d{3,}\b", re.IGNORECASE),
+}
+
+# Identifiers naming a single record
+UNIQUE_FIELDS = ("invoice_number", "transaction_id")
+
+# Words that add nothing beside an identifier ("show invoice INV-2026-001")
+_FILLER = frozenset(
+    "a an and or the for of from by with to in on at about all any me my please show list find get lookup look up "
+    "id number no invoice invoices transaction transactions txn vendor vendors supplier record records details".split()
+)
+
+
+def analyze_query(q: str) -> tuple[dict[str, list[str]], str]:
+    """
+    Split a query into identifiers per payload field and the remaining free
+    text ("" when nothing but identifiers and filler words is left).
+    """
+    identifiers = {}
+    remainder = q
+    for field, pattern in IDENTIFIER_PATTERNS.items():
+        found = [m.upper() for m in pattern.findall(q)]
+        if found:
+            identifiers[field] = list(dict.fromkeys(found))
+            remainder = pattern.sub(" ", remainder)
+    words = [w for w in re.findall(r"\w+", remainder.lower()) if w not in _FILLER]
+    return identifiers, " ".join(words)
+
+
+def identifier_filter(identifiers: dict[str, list[str]]) -> Filter:
+    conditions = []
+    for field, values in identifiers.items():
+        conditions.append(FieldCondition(key=field, match=MatchAny(any=values)))
+        conditions.extend(FieldCondition(key="text", match=MatchText(text=v)) for v in values)
+    return Filter(should=conditions)
+
+
+def scope_filter(query_filter: Filter | None, identifiers: dict[str, list[str]]) -> Filter:
+    """query_filter narrowed to points holding one of the identifiers."""
+    scoped = identifier_filter(identifiers)
+    return scoped if query_filter is None else Filter(must=[scoped, query_filter])
+
+
+def matches_identifier(payload: dict, identifiers: dict[str, list[str]]) -> bool:
+    """True if the payload's typed field equals, or its text contains, one of the identifiers."""
+    text = str(payload.get("text", ""))
+    for field, values in identifiers.items():
+        if str(payload.get(field, "")).upper() in values:
+            return True
+        for value in values:
+            if re.search(rf"(?<![\w-]){re.escape(value)}(?![\w-])", text, re.IGNORECASE):
+                return True
+    return False
+
+
+async def lookup_identifiers(
+    qdrant, collection: str, identifiers: dict[str, list[str]], limit: int, query_filter: Filter | None = None,
+) -> list:
+    """Points holding one of the identifiers (and matching query_filter), via payload indexes only."""
+    # Text matches can include near misses (INV-2026-0011 for INV-2026-001); fetch extra and verify
+    points, _ = await qdrant.scroll(
+        collection_name=collection,
+        scroll_filter=scope_filter(query_filter, identifiers),
+        limit=limit * 4,
+        with_payload=True,
+        with_vectors=False,
+    )
+    return [p for p in points if matches_identifier(p.payload or {}, identifiers)][:limit]
+
+
+async def create_identifier_indexes(qdrant, collection: str):
+    """Keyword indexes on the identifier fields (used once payloads carry typed fields)."""
+    for field in IDENTIFIER_PATTERNS:
+        try:
+            await qdrant.create_payload_index(
+                collection_name=collection, field_name=field, field_schema=PayloadSchemaType.KEYWORD,
+            )
+        except Exception:
+            pass
+
+
+def merge_exact(exact: list[dict], semantic: list[dict], identifiers: dict[str, list[str]], limit: int) -> list[dict]:
+    """
+    Results of a mixed query whose semantic search was scoped with
+    scope_filter: exact hits on named invoices/transactions first (in semantic
+    order), then the semantic hits that hold one of the identifiers, by score.
+    Vendor ids match many records, so those are ranked by the free text.
+    """
+    unique = {field: values for field, values in identifiers.items() if field in UNIQUE_FIELDS}
+    rank = {item["id"]: i for i, item in enumerate(semantic)}
+    # Prefer the semantic copy of a pinned hit: it carries the real score
+    pinned = [
+        semantic[rank[item["id"]]] if item["id"] in rank else item
+        for item in exact if unique and matches_identifier(item.get("payload") or item, unique)
+    ]
+    pinned.sort(key=lambda item: rank.get(item["id"], len(rank)))
+    seen = {item["id"] for item in pinned}
+    ranked = [
+        item for item in semantic
+        if item["id"] not in seen and matches_identifier(item.get("payload") or item, identifiers)
+    ]
+    return (pinned + ranked)[:limit]
@@ -0,0 +1,127 @@
+"""
+Bounded executors for local llama-cpp inference.
+
+Each local model gets one dedicated worker thread (a llama context is not safe
+to share between threads) and a bounded queue in front of it. When the queue is
+full new calls fail fast with InferenceBusy (HTTP 503) instead of piling up, and
+calls that run past their timeout fail with InferenceTimeout (HTTP 504).
+
+Cancellation: a call that is cancelled while still queued never runs. A running
+call gets a threading.Event that is set on cancel/timeout; long-running work
+(token generation) checks it between steps and stops early.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_executors = {}
+
+
+class InferenceUnavailable(Exception):
+    status_code = 503
+
+
+class InferenceBusy(InferenceUnavailable):
+    status_code = 503
+
+
+class InferenceTimeout(InferenceUnavailable):
+    status_code = 504
+
+
+class InferenceExecutor:
+    def __init__(self, name: str, max_queue: int, timeout: float | None = None):
+        self.name = name
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{name}-inference")
+        self.pending = 0
+        self.completed = 0
+        self.finished = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.busy_ms_total = 0.0
+
+    async def run(self, fn, *args, timeout: float | None = None, cancellable: bool = False):
+        """
+        Run fn(*args) on this model's worker thread. With cancellable=True, fn is
+        called as fn(*args, cancel=event) so it can stop when the caller goes away.
+        """
+        # pending counts the running call plus everything queued behind it
+        if self.pending >= self.max_queue + 1:
+            self.rejected += 1
+            raise InferenceBusy(f"{self.name} queue full ({self.max_queue} waiting)")
+
+        cancel = threading.Event()
+        call = (lambda: fn(*args, cancel=cancel)) if cancellable else (lambda: fn(*args))
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        t0 = time.perf_counter()
+        future = self._pool.submit(call)
+        # The slot is freed when the worker is done with the call, not when the
+        # caller stops waiting: a timed-out call may still be running
+        future.add_done_callback(lambda f: loop.is_closed() or loop.call_soon_threadsafe(self._finished, f, t0))
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+            self.completed += 1
+            return result
+        except asyncio.TimeoutError:
+            cancel.set()
+            self.timeouts += 1
+            raise InferenceTimeout(f"{self.name} inference timed out")
+        except asyncio.CancelledError:
+            cancel.set()
+            self.cancelled += 1
+            raise
+
+    def _finished(self, future, t0: float):
+        self.pending -= 1
+        if not future.cancelled():
+            self.finished += 1
+            self.busy_ms_total += (time.perf_counter() - t0) * 1000
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+            "avg_ms": round(self.busy_ms_total / self.finished, 1) if self.finished else 0,
+        }
+
+
+def get_executor(name: str, max_queue: int, timeout: float | None = None) -> InferenceExecutor:
+    """Process-wide executor for one local model, created on first use."""
+    executor = _executors.get(name)
+    if executor is None:
+        executor = InferenceExecutor(name, max_queue, timeout)
+        _executors[name] = executor
+    return executor
+
+
+def get_inference_stats() -> dict:
+    return {name: executor.stats() for name, executor in _executors.items()}
+
+
+async def cancel_on_disconnect(request, coro, poll_interval: float = 0.5):
+    """
+    Await coro, cancelling it if the HTTP client disconnects first.
+    Returns None when the client went away (nobody is left to read the response).
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                return None
+    finally:
+        if not task.done():
+            task.cancel()
@@ -9,16 +9,43 @@ Environment variables:
     LLM_API_URL     - API base URL for remote mode (e.g. https://api.distillabs.ai/v1)
     LLM_API_KEY     - API key for remote mode
     LLM_MODEL_NAME  - Model name for remote mode (e.g. "distil-labs-slm")
+    LLM_PROVIDERS   - Several weighted remote providers instead, with hedging and
+                      circuit breakers (see shared/llm_router.py)
+    LLM_N_CTX       - Context window in tokens (default: 4096)
+    LLM_N_THREADS   - CPU threads for local inference (default: llama-cpp's choice)
+    LLM_N_BATCH     - Prompt-processing batch size for local inference (default: 512)
+    LLM_MAX_QUEUE   - Local completions allowed to wait behind the running one before
+                      new calls are rejected with 503 (default: 8)
+    LLM_TIMEOUT     - Seconds before a local completion is abandoned with 504 (default: 120)
+    LLM_CACHE       - Response cache: "off", "exact" or "semantic" (default: exact)
+    LLM_CACHE_SIZE  - Max cached answers (default: 1000)
+    LLM_CACHE_TTL   - Seconds a cached answer stays valid, 0 = forever (default: 3600)
+    LLM_CACHE_THRESHOLD - Min question cosine similarity for a semantic hit (default: 0.95)
+    LLM_PREFIX_CACHE    - Reuse saved llama state for repeated system prompts (default: true)
+    LLM_PREFIX_CACHE_MB - Memory budget for saved prefix states (default: 256)
 """
 
+import asyncio
+import hashlib
 import os
 import json
-import requests
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from shared.inference import get_executor
+from shared.llm_router import get_router, get_router_stats
 
 # Optional: only import llama_cpp in local mode to keep deployed image slim
 _llama_cpp = None
 _local_model = None
 _mode = None
+_response_cache = None
+_prefix_cache = None
+
+# Prefixes of the messages returned instead of an answer; never cached
+_ERROR_PREFIXES = ("Remote LLM error:", "LLM_API_URL not set", "No local LLM loaded")
 
 
 def _get_mode():
@@ -48,7 +75,13 @@ def init_llm(model_paths: list[tuple[str, str]] | None = None):
     for path, name in model_paths:
         if os.path.exists(path):
             print(f"Loading {name} LLM from {path}...")
-            _local_model = Llama(model_path=path, n_ctx=4096, n_batch=512, verbose=False)
+            _local_model = Llama(
+                model_path=path,
+                n_ctx=context_window(),
+                n_batch=int(os.getenv("LLM_N_BATCH", "512")),
+                n_threads=int(os.environ["LLM_N_THREADS"]) if os.getenv("LLM_N_THREADS") else None,
+                verbose=False,
+            )
             print(f"{name} LLM loaded.")
             return
 
@@ -64,63 +97,486 @@ def get_llm_response(system_prompt: str, user_prompt: str, max_tokens: int = 512
     return _local_completion(system_prompt, user_prompt, max_tokens)
 
 
-def _local_completion(system_prompt: str, user_prompt: str, max_tokens: int) -> str:
+async def aget_llm_response(
+    system_prompt: str,
+    user_prompt: str,
+    max_tokens: int = 512,
+    question: str | None = None,
+    context_ids: list | None = None,
+) -> str:
+    """
+    Async get_llm_response: remote calls use the pooled async client, local runs off the event loop.
+    Answers go through the response cache (LLM_CACHE). Pass the bare user `question`
+    and the ids of the retrieved context to allow semantic hits in "semantic" mode.
+    """
+    cache = _get_response_cache()
+    if cache is None:
+        return await _acomplete(system_prompt, user_prompt, max_tokens)
+
+    answer, lookup = await cache.lookup(system_prompt, user_prompt, max_tokens, question, context_ids)
+    if answer is not None:
+        return answer
+    answer = await _acomplete(system_prompt, user_prompt, max_tokens)
+    cache.store(lookup, answer)
+    return answer
+
+
+async def _acomplete(system_prompt: str, user_prompt: str, max_tokens: int) -> str:
+    mode = _mode or _get_mode()
+
+    if mode == "remote":
+        return await _aremote_completion(system_prompt, user_prompt, max_tokens)
+    return await _llm_executor().run(_local_completion, system_prompt, user_prompt, max_tokens, cancellable=True)
+
+
+async def astream_llm_response(
+    system_prompt: str,
+    user_prompt: str,
+    max_tokens: int = 512,
+    question: str | None = None,
+    context_ids: list | None = None,
+):
+    """
+    Async generator of completion text deltas as the model produces them.
+    Remote mode reads the OpenAI-compatible SSE stream; local mode streams from
+    llama-cpp on the LLM executor. Closing the generator early stops generation.
+    A cached answer is yielded as a single delta; complete streams are cached.
+    """
+    cache = _get_response_cache()
+    lookup = None
+    if cache is not None:
+        answer, lookup = await cache.lookup(system_prompt, user_prompt, max_tokens, question, context_ids)
+        if answer is not None:
+            yield answer
+            return
+
+    parts = []
+    async for delta in _astream(system_prompt, user_prompt, max_tokens):
+        parts.append(delta)
+        yield delta
+    if cache is not None:
+        cache.store(lookup, "".join(parts))
+
+
+async def _astream(system_prompt: str, user_prompt: str, max_tokens: int):
+    mode = _mode or _get_mode()
+
+    if mode == "remote":
+        async for delta in _aremote_stream(system_prompt, user_prompt, max_tokens):
+            yield delta
+        return
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    done = object()
+
+    def on_token(text: str):
+        loop.call_soon_threadsafe(queue.put_nowait, text)
+
+    task = asyncio.ensure_future(_llm_executor().run(
+        _local_completion, system_prompt, user_prompt, max_tokens, on_token, cancellable=True,
+    ))
+    task.add_done_callback(lambda _: queue.put_nowait(done))
+    streamed = False
+    try:
+        while (item := await queue.get()) is not done:
+            streamed = True
+            yield item
+        text = task.result()
+        if not streamed and text:
+            # Nothing was generated token by token (e.g. no model loaded): send the message
+            yield text
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+class ResponseCache:
+    """
+    LRU cache of LLM answers with TTL.
+
+    Exact mode keys on a hash of (system prompt, user prompt, model, max_tokens).
+    Semantic mode additionally embeds the caller's question and reuses an answer
+    whose question has cosine similarity >= threshold, but only within the same
+    scope: same system prompt, model, max_tokens and retrieved context ids, so a
+    paraphrase is answered from the same evidence.
+    """
+
+    def __init__(self, mode: str, max_entries: int, ttl: float, threshold: float):
+        self.mode = mode
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def _hash(*parts) -> str:
+        return hashlib.sha256(json.dumps(parts, default=str).encode("utf-8")).hexdigest()
+
+    def _expired(self, entry: dict) -> bool:
+        return bool(self.ttl) and time.monotonic() - entry["created"] > self.ttl
+
+    async def lookup(self, system_prompt, user_prompt, max_tokens, question=None, context_ids=None):
+        """Returns (answer or None, lookup state to pass to store())."""
+        model = get_model_name()
+        ids = sorted(str(i) for i in context_ids) if context_ids is not None else None
+        lookup = {
+            "key": self._hash(system_prompt, user_prompt, model, max_tokens),
+            "scope": self._hash(system_prompt, model, max_tokens, ids),
+            "context_ids": set(ids or []),
+            "vector": None,
+        }
+
+        entry = self._entries.get(lookup["key"])
+        if entry is not None and self._expired(entry):
+            self._remove(lookup["key"])
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(lookup["key"])
+            self.exact_hits += 1
+            return entry["answer"], lookup
+
+        if self.mode == "semantic" and question and ids is not None:
+            from shared.embeddings import aget_embedding
+
+            vector = np.asarray(await aget_embedding(question), dtype=np.float32)
+            vector /= np.linalg.norm(vector) or 1.0
+            lookup["vector"] = vector
+
+            best_key, best_sim = None, self.threshold
+            for key, entry in list(self._entries.items()):
+                if entry["scope"] != lookup["scope"] or entry["vector"] is None:
+                    continue
+                if self._expired(entry):
+                    self._remove(key)
+                    continue
+                sim = float(np.dot(vector, entry["vector"]))
+                if sim >= best_sim:
+                    best_key, best_sim = key, sim
+            if best_key is not None:
+                self._entries.move_to_end(best_key)
+                self.semantic_hits += 1
+                return self._entries[best_key]["answer"], lookup
+
+        self.misses += 1
+        return None, lookup
+
+    def store(self, lookup: dict | None, answer: str):
+        if lookup is None or not answer or answer.startswith(_ERROR_PREFIXES):
+            return
+        self._entries[lookup["key"]] = {
+            "answer": answer,
+            "created": time.monotonic(),
+            "scope": lookup["scope"],
+            "context_ids": lookup["context_ids"],
+            "vector": lookup["vector"],
+        }
+        self._entries.move_to_end(lookup["key"])
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+
+    def invalidate(self, context_ids=None) -> int:
+        """Drop every answer, or only those built from any of `context_ids`."""
+        if context_ids is None:
+            removed = len(self._entries)
+            self._entries.clear()
+        else:
+            ids = {str(i) for i in context_ids}
+            stale = [k for k, e in self._entries.items() if e["context_ids"] & ids]
+            for key in stale:
+                self._remove(key)
+            removed = len(stale)
+        self.invalidations += removed
+        return removed
+
+    def stats(self) -> dict:
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            "mode": self.mode,
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+def _get_response_cache() -> ResponseCache | None:
+    global _response_cache
+    mode = os.getenv("LLM_CACHE", "exact").lower()
+    if mode not in ("exact", "semantic"):
+        return None
+    if _response_cache is None or _response_cache.mode != mode:
+        _response_cache = ResponseCache(
+            mode,
+            max_entries=int(os.getenv("LLM_CACHE_SIZE", "1000")),
+            ttl=float(os.getenv("LLM_CACHE_TTL", "3600")),
+            threshold=float(os.getenv("LLM_CACHE_THRESHOLD", "0.95")),
+        )
+    return _response_cache
+
+
+def invalidate_llm_cache(context_ids: list | None = None) -> int:
+    """Invalidation hook: call after the underlying data changes (e.g. /add-knowledge)."""
+    if _response_cache is None:
+        return 0
+    return _response_cache.invalidate(context_ids)
+
+
+class PrefixStateCache:
+    """
+    Saved llama states for system-prompt prefixes (local mode only).
+
+    Every chat prompt starts with the templated system message. The first call
+    with a given system prompt evaluates just that prefix and saves the model
+    state; later calls restore it, and llama-cpp only evaluates the tokens after
+    the matching prefix. States are kept in an LRU within a byte budget. Runs on
+    the LLM executor thread, which owns the model.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.restores = 0
+        self.restores_skipped = 0
+        self.evictions = 0
+        self.unsupported = 0
+        self.saved_ms_total = 0.0
+        self.last_saved_ms = 0.0
+        self._formatter = None
+        self._states = OrderedDict()
+        self._unsupported = set()
+
+    def _prefix_tokens(self, model, system_prompt: str) -> list[int] | None:
+        """Tokens of the templated system message, or None if the model has no chat template."""
+        template = (getattr(model, "metadata", None) or {}).get("tokenizer.chat_template")
+        if not template:
+            return None
+        if self._formatter is None:
+            from llama_cpp.llama_chat_format import Jinja2ChatFormatter
+
+            self._formatter = Jinja2ChatFormatter(
+                template=template,
+                eos_token=model.detokenize([model.token_eos()], special=True).decode("utf-8", "ignore"),
+                bos_token=model.detokenize([model.token_bos()], special=True).decode("utf-8", "ignore"),
+            )
+        # The prefix is what two renderings with different user messages have in common
+        system = {"role": "system", "content": system_prompt}
+        a = self._formatter(messages=[system, {"role": "user", "content": "a"}]).prompt
+        b = self._formatter(messages=[system, {"role": "user", "content": "b"}]).prompt
+        n = 0
+        while n < min(len(a), len(b)) and a[n] == b[n]:
+            n += 1
+        tokens = model.tokenize(a[:n].encode("utf-8"), add_bos=False, special=True)
+        # The last token may merge differently with the text that follows it
+        return tokens[:-1]
+
+    def prepare(self, model, system_prompt: str):
+        """Make the model's KV cache start with the evaluated system prefix."""
+        key = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+        entry = self._states.get(key)
+        if entry is None:
+            if key in self._unsupported:
+                return
+            try:
+                tokens = self._prefix_tokens(model, system_prompt)
+            except Exception as e:
+                print(f"  Prefix cache unavailable for this system prompt: {e}")
+                tokens = None
+            if not tokens:
+                self._unsupported.add(key)
+                self.unsupported += 1
+                return
+            self.misses += 1
+            t0 = time.perf_counter()
+            model.reset()
+            model.eval(tokens)
+            eval_ms = (time.perf_counter() - t0) * 1000
+            state = model.save_state()
+            entry = {"tokens": tokens, "state": state, "eval_ms": eval_ms, "size": state.llama_state_size}
+            self._states[key] = entry
+            self.bytes += entry["size"]
+            self._evict()
+            return
+
+        self._states.move_to_end(key)
+        self.hits += 1
+        n = len(entry["tokens"])
+        # Still in the KV cache from the previous call: llama-cpp's own prefix
+        # matching reuses it, so the saved state adds nothing
+        if list(model.input_ids[:n]) == entry["tokens"]:
+            self.restores_skipped += 1
+            return
+        t0 = time.perf_counter()
+        model.load_state(entry["state"])
+        self.restores += 1
+        self.last_saved_ms = max(0.0, entry["eval_ms"] - (time.perf_counter() - t0) * 1000)
+        self.saved_ms_total += self.last_saved_ms
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and len(self._states) > 1:
+            _, entry = self._states.popitem(last=False)
+            self.bytes -= entry["size"]
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._states),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "restores": self.restores,
+            "restores_skipped": self.restores_skipped,
+            "evictions": self.evictions,
+            "unsupported": self.unsupported,
+            "prompt_eval_saved_ms_last": round(self.last_saved_ms, 1),
+            "prompt_eval_saved_ms_avg": round(self.saved_ms_total / self.restores, 1) if self.restores else 0,
+            "prompt_eval_saved_ms_total": round(self.saved_ms_total, 1),
+        }
+
+
+def _get_prefix_cache() -> PrefixStateCache | None:
+    global _prefix_cache
+    if os.getenv("LLM_PREFIX_CACHE", "true").lower() != "true":
+        return None
+    if _prefix_cache is None:
+        _prefix_cache = PrefixStateCache(int(float(os.getenv("LLM_PREFIX_CACHE_MB", "256")) * 1024 * 1024))
+    return _prefix_cache
+
+
+def get_llm_stats() -> dict:
+    """LLM metrics for the apps' stats endpoints."""
+    return {
+        "mode": _mode or _get_mode(),
+        "model": get_model_name(),
+        "response_cache": _response_cache.stats() if _response_cache is not None else None,
+        "prefix_cache": _prefix_cache.stats() if _prefix_cache is not None else None,
+        "providers": get_router_stats(),
+    }
+
+
+def sse_event(event: str, data) -> str:
+    """Format one Server-Sent Events message with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _llm_executor():
+    return get_executor(
+        "llm",
+        max_queue=int(os.getenv("LLM_MAX_QUEUE", "8")),
+        timeout=float(os.getenv("LLM_TIMEOUT", "120")),
+    )
+
+
+def _local_completion(system_prompt: str, user_prompt: str, max_tokens: int, on_token=None, cancel=None) -> str:
     if _local_model is None:
         return "No local LLM loaded. Set LLM_MODE=remote or place GGUF files in models/."
-    response = _local_model.create_chat_completion(
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        max_tokens=max_tokens,
-        temperature=0.3,
-    )
-    return response["choices"][0]["message"]["content"]
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+    prefix_cache = _get_prefix_cache()
+    if prefix_cache is not None:
+        try:
+            prefix_cache.prepare(_local_model, system_prompt)
+        except Exception as e:
+            # Only an optimization: fall back to a full prompt evaluation
+            print(f"  Prefix cache skipped: {e}")
+    if cancel is None and on_token is None:
+        response = _local_model.create_chat_completion(messages=messages, max_tokens=max_tokens, temperature=0.3)
+        return response["choices"][0]["message"]["content"]
 
+    # Stream so a cancelled or timed-out call stops generating at the next token
+    parts = []
+    for chunk in _local_model.create_chat_completion(
+        messages=messages, max_tokens=max_tokens, temperature=0.3, stream=True,
+    ):
+        if cancel is not None and cancel.is_set():
+            break
+        delta = chunk["choices"][0]["delta"].get("content") or ""
+        if delta:
+            parts.append(delta)
+            if on_token is not None:
+                on_token(delta)
+    return "".join(parts)
 
-def _remote_completion(system_prompt: str, user_prompt: str, max_tokens: int) -> str:
-    api_url = os.getenv("LLM_API_URL")
-    api_key = os.getenv("LLM_API_KEY", "")
-    model_name = os.getenv("LLM_MODEL_NAME", "distil-labs-slm")
 
-    if not api_url:
+def _remote_completion(system_prompt: str, user_prompt: str, max_tokens: int) -> str:
+    router = get_router()
+    if router is None:
         return "LLM_API_URL not set. Configure a remote LLM endpoint."
+    try:
+        return router.complete(system_prompt, user_prompt, max_tokens)
+    except Exception as e:
+        return f"Remote LLM error: {e}"
 
-    headers = {"Content-Type": "application/json"}
-    if api_key:
-        headers["Authorization"] = f"Bearer {api_key}"
-
-    payload = {
-        "model": model_name,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        "max_tokens": max_tokens,
-        "temperature": 0.3,
-    }
 
+async def _aremote_completion(system_prompt: str, user_prompt: str, max_tokens: int) -> str:
+    router = get_router()
+    if router is None:
+        return "LLM_API_URL not set. Configure a remote LLM endpoint."
     try:
-        r = requests.post(
-            f"{api_url.rstrip('/')}/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=60,
-        )
-        r.raise_for_status()
-        return r.json()["choices"][0]["message"]["content"]
+        return await router.acomplete(system_prompt, user_prompt, max_tokens)
     except Exception as e:
         return f"Remote LLM error: {e}"
 
 
+async def _aremote_stream(system_prompt: str, user_prompt: str, max_tokens: int):
+    router = get_router()
+    if router is None:
+        yield "LLM_API_URL not set. Configure a remote LLM endpoint."
+        return
+    async for delta in router.astream(system_prompt, user_prompt, max_tokens):
+        yield delta
+
+
 def is_available() -> bool:
     """Check if LLM is ready (local model loaded or remote configured)."""
     mode = _mode or _get_mode()
     if mode == "remote":
-        return bool(os.getenv("LLM_API_URL"))
+        return get_router() is not None
     return _local_model is not None
 
 
+def context_window() -> int:
+    """Context window of the active model in tokens."""
+    if _local_model is not None and (_mode or _get_mode()) == "local":
+        return _local_model.n_ctx()
+    return int(os.getenv("LLM_N_CTX", "4096"))
+
+
+def count_tokens(text: str) -> int:
+    """Token count with the local model's tokenizer; ~4 chars/token for remote models."""
+    if _local_model is not None and (_mode or _get_mode()) == "local":
+        return len(_local_model.tokenize(text.encode("utf-8"), add_bos=False))
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most max_tokens tokens."""
+    if _local_model is not None and (_mode or _get_mode()) == "local":
+        tokens = _local_model.tokenize(text.encode("utf-8"), add_bos=False)
+        if len(tokens) <= max_tokens:
+            return text
+        return _local_model.detokenize(tokens[:max_tokens]).decode("utf-8", "ignore")
+    return text[: max_tokens * 4]
+
+
 def get_model_name() -> str:
     mode = _mode or _get_mode()
     if mode == "remote":
@@ -0,0 +1,342 @@
+"""
+Routing across several OpenAI-compatible LLM providers (remote mode).
+
+Each completion goes to a provider picked at random by weight among those
+whose circuit breaker is closed. With hedging on, a second provider is fired
+if the first has not answered within its own p95 latency, and the first
+answer wins. A failed call fails over to the next provider. A provider that
+fails LLM_BREAKER_FAILURES times in a row is taken out of rotation for
+LLM_BREAKER_COOLDOWN seconds, then gets a single trial call (half-open).
+
+Streams use the same routing and fail over only if no token has arrived yet;
+they are not hedged, and their time to first token is tracked separately from
+the completion latencies that hedging uses.
+
+Environment variables:
+    LLM_PROVIDERS         - JSON list of providers, e.g.
+                            [{"name": "groq", "url": "https://api.groq.com/openai/v1",
+                              "api_key": "...", "model": "qwen/qwen3-32b", "weight": 2}, ...]
+                            (default: a single provider from LLM_API_URL/LLM_API_KEY/LLM_MODEL_NAME)
+    LLM_HEDGE             - Fire a hedge request at the primary's p95 (default: false)
+    LLM_HEDGE_MIN_SAMPLES - Latency samples needed before a provider's p95 is trusted (default: 20)
+    LLM_BREAKER_FAILURES  - Consecutive failures that open a provider's breaker (default: 3)
+    LLM_BREAKER_COOLDOWN  - Seconds a provider stays out of rotation (default: 30)
+"""
+
+import asyncio
+import bisect
+import json
+import os
+import random
+import time
+from collections import deque
+
+from shared.http_client import get_async_client, get_session, timeout
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = [100, 250, 500, 1000, 2000, 5000, 10000, 30000]
+
+_router = None
+_router_config = None
+
+
+# Cancel message marking the slower request of a hedged pair
+_HEDGE_LOST = "hedge lost"
+
+
+class NoProviderAvailable(Exception):
+    pass
+
+
+class Provider:
+    def __init__(self, name: str, url: str, api_key: str = "", model: str = "distil-labs-slm", weight: float = 1.0):
+        self.name = name
+        self.url = f"{url.rstrip('/')}/chat/completions"
+        self.api_key = api_key
+        self.model = model
+        self.weight = weight
+        self.requests = 0
+        self.failures = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.latencies = deque(maxlen=500)
+        # Time to first token of streamed answers; kept apart so long streams
+        # do not inflate the completion p95 that times hedges
+        self.stream_ttft = deque(maxlen=500)
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def request(self, system_prompt: str, user_prompt: str, max_tokens: int, stream: bool = False) -> tuple[dict, dict]:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            "max_tokens": max_tokens,
+            "temperature": 0.3,
+        }
+        if stream:
+            payload["stream"] = True
+        return headers, payload
+
+    def available(self, cooldown: float) -> bool:
+        if self.opened_at is None:
+            return True
+        # Half-open: after the cooldown let one trial call through
+        return time.monotonic() - self.opened_at >= cooldown and not self.trial_in_flight
+
+    def percentile(self, q: float, samples: deque | None = None) -> float | None:
+        samples = self.latencies if samples is None else samples
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    def record_success(self, ms: float, ttft: bool = False):
+        if ttft:
+            self.stream_ttft.append(ms)
+        else:
+            self.latencies.append(ms)
+            self.histogram[bisect.bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self, threshold: int):
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.trial_in_flight = False
+        if self.consecutive_failures >= threshold:
+            if self.opened_at is None:
+                print(f"  LLM provider {self.name} circuit opened after {self.consecutive_failures} failures")
+            self.opened_at = time.monotonic()
+
+    def stats(self, cooldown: float) -> dict:
+        if self.opened_at is None:
+            state = "closed"
+        elif time.monotonic() - self.opened_at >= cooldown:
+            state = "half-open"
+        else:
+            state = "open"
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        ttft_p50, ttft_p95 = self.percentile(0.5, self.stream_ttft), self.percentile(0.95, self.stream_ttft)
+        buckets = [f"<={b}ms" for b in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            "model": self.model,
+            "weight": self.weight,
+            "state": state,
+            "requests": self.requests,
+            "failures": self.failures,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "p50_ms": round(p50, 1) if p50 is not None else None,
+            "p95_ms": round(p95, 1) if p95 is not None else None,
+            "stream_ttft_p50_ms": round(ttft_p50, 1) if ttft_p50 is not None else None,
+            "stream_ttft_p95_ms": round(ttft_p95, 1) if ttft_p95 is not None else None,
+            "histogram": dict(zip(buckets, self.histogram)),
+        }
+
+
+def _parse_completion(data: dict) -> str:
+    return data["choices"][0]["message"]["content"]
+
+
+class LLMRouter:
+    def __init__(self, providers: list[Provider]):
+        self.providers = providers
+        self.hedge = os.getenv("LLM_HEDGE", "false").lower() == "true"
+        self.hedge_min_samples = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+        self.breaker_failures = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+        self.breaker_cooldown = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+    def pick(self, exclude=()) -> Provider | None:
+        """Weighted random choice among providers in rotation."""
+        candidates = [
+            p for p in self.providers
+            if p not in exclude and p.weight > 0 and p.available(self.breaker_cooldown)
+        ]
+        if not candidates:
+            return None
+        provider = random.choices(candidates, weights=[p.weight for p in candidates])[0]
+        if provider.opened_at is not None:
+            provider.trial_in_flight = True
+        return provider
+
+    async def _attempt(self, provider: Provider, system_prompt: str, user_prompt: str, max_tokens: int) -> str:
+        headers, payload = provider.request(system_prompt, user_prompt, max_tokens)
+        provider.requests += 1
+        t0 = time.perf_counter()
+        try:
+            r = await get_async_client(provider.url).post(provider.url, headers=headers, json=payload, timeout=60)
+            r.raise_for_status()
+            answer = _parse_completion(r.json())
+        except asyncio.CancelledError as e:
+            # Lost a hedge race: not a failure, but the elapsed time is a lower
+            # bound on its latency and keeps its p95 honest. Other cancellations
+            # (client gone, caller cancelled) say nothing about the provider.
+            if e.args and e.args[0] == _HEDGE_LOST:
+                provider.latencies.append((time.perf_counter() - t0) * 1000)
+            provider.trial_in_flight = False
+            raise
+        except Exception:
+            provider.record_failure(self.breaker_failures)
+            raise
+        provider.record_success((time.perf_counter() - t0) * 1000)
+        return answer
+
+    def _hedge_delay(self, provider: Provider) -> float | None:
+        if not self.hedge or len(provider.latencies) < self.hedge_min_samples:
+            return None
+        return provider.percentile(0.95) / 1000
+
+    async def acomplete(self, system_prompt: str, user_prompt: str, max_tokens: int) -> str:
+        tried = []
+        last_error = None
+        while True:
+            primary = self.pick(exclude=tried)
+            if primary is None:
+                break
+            tried.append(primary)
+            tasks = {asyncio.ensure_future(self._attempt(primary, system_prompt, user_prompt, max_tokens)): primary}
+            try:
+                delay = self._hedge_delay(primary)
+                if delay is not None:
+                    done, _ = await asyncio.wait(tasks, timeout=delay)
+                    hedge = None if done else self.pick(exclude=tried)
+                    if hedge is not None:
+                        tried.append(hedge)
+                        hedge.hedges += 1
+                        tasks[asyncio.ensure_future(self._attempt(hedge, system_prompt, user_prompt, max_tokens))] = hedge
+
+                pending = set(tasks)
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            if tasks[task] is not primary:
+                                tasks[task].hedge_wins += 1
+                            for loser in pending:
+                                loser.cancel(msg=_HEDGE_LOST)
+                            return task.result()
+                        last_error = task.exception()
+            finally:
+                for task in tasks:
+                    if not task.done():
+                        task.cancel()
+        if last_error is None:
+            raise NoProviderAvailable("all LLM providers are out of rotation")
+        raise last_error
+
+    def complete(self, system_prompt: str, user_prompt: str, max_tokens: int) -> str:
+        """Blocking variant: routing and failover, no hedging."""
+        tried = []
+        last_error = None
+        while (provider := self.pick(exclude=tried)) is not None:
+            tried.append(provider)
+            headers, payload = provider.request(system_prompt, user_prompt, max_tokens)
+            provider.requests += 1
+            t0 = time.perf_counter()
+            try:
+                r = get_session().post(provider.url, headers=headers, json=payload, timeout=timeout(60))
+                r.raise_for_status()
+                answer = _parse_completion(r.json())
+            except Exception as e:
+                provider.record_failure(self.breaker_failures)
+                last_error = e
+                continue
+            provider.record_success((time.perf_counter() - t0) * 1000)
+            return answer
+        if last_error is None:
+            raise NoProviderAvailable("all LLM providers are out of rotation")
+        raise last_error
+
+    async def astream(self, system_prompt: str, user_prompt: str, max_tokens: int):
+        """Yield completion deltas; fails over to another provider only before the first token."""
+        tried = []
+        last_error = None
+        while (provider := self.pick(exclude=tried)) is not None:
+            tried.append(provider)
+            headers, payload = provider.request(system_prompt, user_prompt, max_tokens, stream=True)
+            provider.requests += 1
+            t0 = time.perf_counter()
+            ttft_ms = None
+            started = False
+            try:
+                async with get_async_client(provider.url).stream(
+                    "POST", provider.url, headers=headers, json=payload, timeout=60,
+                ) as r:
+                    r.raise_for_status()
+                    async for line in r.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        choices = json.loads(data).get("choices") or []
+                        delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                        if delta:
+                            if not started:
+                                ttft_ms = (time.perf_counter() - t0) * 1000
+                            started = True
+                            yield delta
+            except (asyncio.CancelledError, GeneratorExit):
+                provider.trial_in_flight = False
+                raise
+            except Exception as e:
+                provider.record_failure(self.breaker_failures)
+                if started:
+                    raise
+                last_error = e
+                continue
+            provider.record_success(ttft_ms if ttft_ms is not None else (time.perf_counter() - t0) * 1000, ttft=True)
+            return
+        if last_error is None:
+            raise NoProviderAvailable("all LLM providers are out of rotation")
+        raise last_error
+
+    def stats(self) -> dict:
+        return {p.name: p.stats(self.breaker_cooldown) for p in self.providers}
+
+
+def _load_providers() -> list[Provider]:
+    raw = os.getenv("LLM_PROVIDERS")
+    if raw:
+        return [
+            Provider(
+                name=spec.get("name") or spec["url"],
+                url=spec["url"],
+                api_key=spec.get("api_key", ""),
+                model=spec.get("model", os.getenv("LLM_MODEL_NAME", "distil-labs-slm")),
+                weight=float(spec.get("weight", 1.0)),
+            )
+            for spec in json.loads(raw)
+        ]
+    if os.getenv("LLM_API_URL"):
+        return [Provider(
+            name="default",
+            url=os.environ["LLM_API_URL"],
+            api_key=os.getenv("LLM_API_KEY", ""),
+            model=os.getenv("LLM_MODEL_NAME", "distil-labs-slm"),
+        )]
+    return []
+
+
+def get_router() -> LLMRouter | None:
+    """Process-wide router, or None when no remote provider is configured."""
+    global _router, _router_config
+    config = (os.getenv("LLM_PROVIDERS"), os.getenv("LLM_API_URL"), os.getenv("LLM_API_KEY"), os.getenv("LLM_MODEL_NAME"))
+    if _router is None or config != _router_config:
+        providers = _load_providers()
+        _router = LLMRouter(providers) if providers else None
+        _router_config = config
+    return _router
+
+
+def get_router_stats() -> dict | None:
+    return _router.stats() if _router is not None else None
@@ -0,0 +1,100 @@
+"""
+Shared async Qdrant client for the three apps.
+
+One AsyncQdrantClient per process, so handlers await Qdrant instead of
+blocking the event loop. Over REST the client keeps a pool of keep-alive
+connections; with QDRANT_PREFER_GRPC=true it talks gRPC over one multiplexed
+HTTP/2 channel instead. Transient failures (connection errors, timeouts,
+429/502/503/504) are retried with exponential backoff.
+
+Environment variables:
+    QDRANT_URL           - Cluster URL
+    QDRANT_API_KEY       - API key
+    QDRANT_PREFER_GRPC   - Use gRPC instead of REST (default: false)
+    QDRANT_GRPC_PORT     - gRPC port (default: 6334)
+    QDRANT_TIMEOUT       - Per-request timeout in seconds, may be fractional (default: 10)
+    QDRANT_POOL_SIZE     - Max REST connections (default: 32)
+    QDRANT_RETRIES       - Retries for transient failures (default: 2)
+    QDRANT_RETRY_BACKOFF - Initial backoff in seconds, doubled per retry (default: 0.1)
+"""
+
+import asyncio
+import os
+
+import httpx
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.http.exceptions import ResponseHandlingException, UnexpectedResponse
+
+_client = None
+
+_RETRY_STATUS = {429, 502, 503, 504}
+
+
+def _is_transient(exc: Exception) -> bool:
+    if isinstance(exc, UnexpectedResponse):
+        return exc.status_code in _RETRY_STATUS
+    if isinstance(exc, (ResponseHandlingException, httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    try:
+        import grpc
+
+        if isinstance(exc, grpc.aio.AioRpcError):
+            return exc.code() in (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED)
+    except ImportError:
+        pass
+    return False
+
+
+class RetryingQdrant:
+    """Proxy that retries the wrapped client's coroutine methods on transient errors."""
+
+    def __init__(self, client: AsyncQdrantClient, retries: int, backoff: float):
+        self.client = client
+        self.retries = retries
+        self.backoff = backoff
+        self.retried = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not asyncio.iscoroutinefunction(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            for attempt in range(self.retries + 1):
+                try:
+                    return await attr(*args, **kwargs)
+                except Exception as e:
+                    if attempt == self.retries or not _is_transient(e):
+                        raise
+                    self.retried += 1
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+
+        return call
+
+
+def get_qdrant() -> RetryingQdrant:
+    """Process-wide async Qdrant client, created on first use."""
+    global _client
+    if _client is None:
+        pool_size = int(os.getenv("QDRANT_POOL_SIZE", "32"))
+        client = AsyncQdrantClient(
+            url=os.environ["QDRANT_URL"],
+            api_key=os.environ["QDRANT_API_KEY"],
+            prefer_grpc=os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true",
+            grpc_port=int(os.getenv("QDRANT_GRPC_PORT", "6334")),
+            timeout=float(os.getenv("QDRANT_TIMEOUT", "10")),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+        _client = RetryingQdrant(
+            client,
+            retries=int(os.getenv("QDRANT_RETRIES", "2")),
+            backoff=float(os.getenv("QDRANT_RETRY_BACKOFF", "0.1")),
+        )
+    return _client
+
+
+async def close_qdrant():
+    global _client
+    if _client is not None:
+        await _client.client.close()
+        _client = None
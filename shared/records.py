@@ -0,0 +1,179 @@
+"""
+Typed procurement records from chunk payloads.
+
+cognee stores each record as a Python-repr string in payload["text"], e.g.
+"{'invoice_number': 'INV-2026-001', 'total': 69900.0, 'items': \"[{...}]\"}".
+cognee-pipeline/normalize_payloads.py parses it once and writes the fields
+as typed top-level payload fields (numbers as numbers, items as a list), plus:
+
+    record_type     - "invoice", "transaction" or "record"
+    products        - lowercased product names from items (keyword, for facets)
+    item_count      - number of items
+    record_fields   - the record's field names
+    payload_version - PAYLOAD_VERSION once normalized
+
+record_from_payload() reads those fields directly and only falls back to
+parsing the text for points the migration has not reached yet. Parsing uses
+ast.literal_eval, never eval.
+
+record_conditions() turns the search endpoints' range and facet parameters
+into filter conditions on the indexed fields.
+"""
+
+import ast
+import json
+from datetime import date
+
+from qdrant_client.models import (
+    DatetimeRange,
+    FieldCondition,
+    Filter,
+    MatchAny,
+    PayloadSchemaType,
+    Range,
+)
+
+PAYLOAD_VERSION = 1
+
+# Payload indexes on the normalized fields
+RECORD_INDEXES = {
+    "record_type": PayloadSchemaType.KEYWORD,
+    "invoice_number": PayloadSchemaType.KEYWORD,
+    "transaction_id": PayloadSchemaType.KEYWORD,
+    "vendor_id": PayloadSchemaType.KEYWORD,
+    "products": PayloadSchemaType.KEYWORD,
+    "item_count": PayloadSchemaType.INTEGER,
+    "payload_version": PayloadSchemaType.INTEGER,
+    "total": PayloadSchemaType.FLOAT,
+    "amount": PayloadSchemaType.FLOAT,
+    "discount": PayloadSchemaType.FLOAT,
+    "date": PayloadSchemaType.DATETIME,
+}
+
+_NUMERIC_FIELDS = {"total", "amount", "discount", "subtotal", "tax", "price", "unit_price"}
+_INTEGER_FIELDS = {"qty", "quantity"}
+# cognee's own payload fields; a record field with one of these names is not copied to the top level
+_RESERVED_FIELDS = {"id", "text", "type", "belongs_to_set", "metadata", "chunk_index", "chunk_size", "cut_type"}
+
+
+def parse_record_text(text) -> dict | None:
+    """The record dict from a stringified payload text, or None if it is not one."""
+    if isinstance(text, dict):
+        return text
+    if not isinstance(text, str) or not text.lstrip().startswith("{"):
+        return None
+    try:
+        data = json.loads(text.replace("'", '"'))
+    except ValueError:
+        try:
+            data = ast.literal_eval(text)
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            return None
+    return data if isinstance(data, dict) else None
+
+
+def _typed(key: str, value):
+    if key in _NUMERIC_FIELDS:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return value
+    if key in _INTEGER_FIELDS:
+        try:
+            return int(float(value))
+        except (TypeError, ValueError):
+            return value
+    return value
+
+
+def _parse_items(items) -> list[dict]:
+    if isinstance(items, str):
+        parsed = parse_record_text(f"{{'items': {items}}}") or {}
+        items = parsed.get("items", [])
+    if not isinstance(items, list):
+        return []
+    return [{k: _typed(k, v) for k, v in item.items()} for item in items if isinstance(item, dict)]
+
+
+def normalize_record(data: dict) -> dict:
+    """Typed copy of a parsed record, with the derived fields."""
+    record = {key: _typed(key, value) for key, value in data.items()}
+    if "items" in record:
+        record["items"] = _parse_items(record["items"])
+        record["products"] = sorted({str(i["product"]).lower() for i in record["items"] if i.get("product")})
+        record["item_count"] = len(record["items"])
+    if "date" in record:
+        try:
+            record["date"] = date.fromisoformat(str(record["date"])[:10]).isoformat()
+        except ValueError:
+            pass
+    if "invoice_number" in record:
+        record["record_type"] = "invoice"
+    elif "transaction_id" in record:
+        record["record_type"] = "transaction"
+    else:
+        record["record_type"] = "record"
+    return record
+
+
+def normalized_payload(payload: dict) -> dict:
+    """The fields to set on a point: typed record fields, or only the version marker if unparseable."""
+    data = parse_record_text(payload.get("text", ""))
+    if data is None:
+        return {"payload_version": PAYLOAD_VERSION}
+    record = {k: v for k, v in normalize_record(data).items() if k not in _RESERVED_FIELDS}
+    return {**record, "record_fields": sorted(record), "payload_version": PAYLOAD_VERSION}
+
+
+def record_from_payload(payload: dict) -> dict | None:
+    """The typed record of a point, or None if it holds no record."""
+    if payload.get("payload_version") == PAYLOAD_VERSION:
+        fields = payload.get("record_fields")
+        return {k: payload[k] for k in fields if k in payload} if fields else None
+    data = parse_record_text(payload.get("text", ""))
+    return normalize_record(data) if data is not None else None
+
+
+async def create_record_indexes(qdrant, collection: str):
+    """Payload indexes backing record_conditions() (idempotent)."""
+    for field, schema in RECORD_INDEXES.items():
+        try:
+            await qdrant.create_payload_index(collection_name=collection, field_name=field, field_schema=schema)
+        except Exception:
+            pass
+
+
+def _split(values: str | None) -> list[str]:
+    return [v.strip() for v in (values or "").split(",") if v.strip()]
+
+
+def record_conditions(
+    min_total: float | None = None,
+    max_total: float | None = None,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    vendor_id: str | None = None,
+    product: str | None = None,
+) -> list:
+    """
+    Filter conditions for amount range (invoice total or transaction amount),
+    inclusive date range, and comma-separated vendor ids / product names
+    (case-insensitive).
+    """
+    conditions = []
+    if min_total is not None or max_total is not None:
+        amount = Range(gte=min_total, lte=max_total)
+        conditions.append(Filter(should=[
+            FieldCondition(key="total", range=amount),
+            FieldCondition(key="amount", range=amount),
+        ]))
+    if date_from is not None or date_to is not None:
+        conditions.append(FieldCondition(key="date", range=DatetimeRange(
+            gte=date_from.isoformat() if date_from else None,
+            lte=date_to.isoformat() if date_to else None,
+        )))
+    if _split(vendor_id):
+        conditions.append(FieldCondition(key="vendor_id", match=MatchAny(any=[v.upper() for v in _split(vendor_id)])))
+    if _split(product):
+        conditions.append(FieldCondition(key="products", match=MatchAny(any=[p.lower() for p in _split(product)])))
+    return conditions
@@ -0,0 +1,117 @@
+"""
+Search result cache with per-collection generations.
+
+Cached results are keyed on the request parameters plus the collection's
+current generation. Bumping a collection's generation (after ingestion, or
+when a background check sees its point count change) makes every older entry
+unreachable; those entries age out of the LRU. The cache is bounded by entry
+count and by the JSON size of the cached results.
+
+Environment variables:
+    SEARCH_CACHE                - Enable the search result cache (default: true)
+    SEARCH_CACHE_SIZE           - Max cached results (default: 1000)
+    SEARCH_CACHE_MB             - Max total size of cached results (default: 64)
+    SEARCH_CACHE_TTL            - Seconds a result stays valid, 0 = until invalidated (default: 600)
+    SEARCH_CACHE_CHECK_INTERVAL - Seconds between point-count checks (default: 30)
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._point_counts = {}
+
+    def generation(self, collection: str) -> int:
+        return self._generations.get(collection, 0)
+
+    def bump(self, collection: str | None = None):
+        """Invalidate one collection's results, or (None) every collection's."""
+        name = collection or "*"
+        self._generations[name] = self.generation(name) + 1
+
+    def make_key(self, endpoint: str, collection: str, *params) -> tuple:
+        return (endpoint, collection, self.generation(collection), self.generation("*"), *params)
+
+    def get(self, key: tuple):
+        entry = self._entries.get(key)
+        if entry is not None and self.ttl and time.monotonic() - entry["created"] > self.ttl:
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry["value"]
+
+    def put(self, key: tuple, value: dict):
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = {"value": value, "size": size, "created": time.monotonic()}
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, entry = self._entries.popitem(last=False)
+            self.bytes -= entry["size"]
+            self.evictions += 1
+
+    def _remove(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry["size"]
+
+    async def watch_point_counts(self, qdrant, collections: list[str], interval: float):
+        """Bump a collection's generation whenever its point count changes."""
+        while True:
+            for collection in collections:
+                try:
+                    count = (await qdrant.count(collection_name=collection, exact=True)).count
+                except Exception as e:
+                    print(f"  Search cache: point count check failed for {collection}: {e}")
+                    continue
+                previous = self._point_counts.get(collection)
+                self._point_counts[collection] = count
+                if previous is not None and previous != count:
+                    print(f"  Search cache: {collection} changed ({previous} -> {count} points), invalidating")
+                    self.bump(collection)
+            await asyncio.sleep(interval)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+            "evictions": self.evictions,
+            "generations": dict(self._generations),
+        }
+
+
+def create_result_cache() -> ResultCache | None:
+    """Cache configured from the environment, or None when SEARCH_CACHE=false."""
+    if os.getenv("SEARCH_CACHE", "true").lower() != "true":
+        return None
+    return ResultCache(
+        max_entries=int(os.getenv("SEARCH_CACHE_SIZE", "1000")),
+        max_bytes=int(float(os.getenv("SEARCH_CACHE_MB", "64")) * 1024 * 1024),
+        ttl=float(os.getenv("SEARCH_CACHE_TTL", "600")),
+    )
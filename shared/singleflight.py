@@ -0,0 +1,71 @@
+"""
+Request coalescing ("singleflight") for identical concurrent requests.
+
+The first request for a key starts the computation as its own task; identical
+requests that arrive while it is in flight wait on that task instead of
+repeating the embed/search/LLM work, and all receive its result (or its
+exception). Nothing is kept once the task finishes, so this complements the
+caches: it covers the burst before the first result is cached.
+
+A waiter that goes away (client disconnect) does not cancel the shared work
+while others still wait on it; the last one to leave cancels it.
+"""
+
+import asyncio
+
+_flights = {}
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self.executions = 0
+        self.coalesced = 0
+        self._calls = {}
+
+    async def do(self, key, fn):
+        """Return await fn(), sharing one execution among concurrent callers with the same key."""
+        call = self._calls.get(key)
+        if call is None:
+            call = {"task": asyncio.ensure_future(fn()), "waiters": 0}
+            self._calls[key] = call
+            call["task"].add_done_callback(lambda _: self._forget(key, call))
+            self.executions += 1
+        else:
+            self.coalesced += 1
+
+        call["waiters"] += 1
+        try:
+            return await asyncio.shield(call["task"])
+        except asyncio.CancelledError:
+            if call["waiters"] == 1:
+                call["task"].cancel()
+            raise
+        finally:
+            call["waiters"] -= 1
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        total = self.executions + self.coalesced
+        return {
+            "in_flight": len(self._calls),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "coalesced_rate": round(self.coalesced / total, 4) if total else 0,
+        }
+
+
+def get_flight(name: str) -> SingleFlight:
+    """Process-wide coalescing group for one kind of request, created on first use."""
+    flight = _flights.get(name)
+    if flight is None:
+        flight = SingleFlight(name)
+        _flights[name] = flight
+    return flight
+
+
+def get_singleflight_stats() -> dict:
+    return {name: flight.stats() for name, flight in _flights.items()}
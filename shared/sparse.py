@@ -0,0 +1,173 @@
+"""
+Local BM25 sparse vectors for hybrid (dense + sparse) retrieval.
+
+Documents are stored in Qdrant with a named sparse vector ("bm25") whose
+values are the BM25 term-frequency part, tf * (k1 + 1) / (tf + k1 * norm);
+queries carry the IDF of each term. Their dot product is the BM25 score.
+Because IDF lives only on the query side, refreshing the statistics never
+requires re-indexing documents.
+
+Statistics (document count, total length, document frequencies) are built
+and extended incrementally by cognee-pipeline/backfill_sparse.py and saved
+as JSON; the apps reload the file when it changes, and re-check which
+collections carry sparse vectors (e.g. after backfill_sparse.py --swap) on
+the same interval.
+
+Environment variables:
+    SPARSE_STATS_PATH - BM25 statistics file (default: cache/bm25_stats.json in the repo root)
+    HYBRID_SEARCH     - Fuse a sparse BM25 prefetch into /search when available (default: true)
+"""
+
+import json
+import math
+import os
+import re
+import time
+import unicodedata
+import zlib
+from collections import Counter
+
+from qdrant_client.models import SparseVector
+
+SPARSE_VECTOR_NAME = "bm25"
+K1 = 1.2
+B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with".split()
+)
+# Check the statistics file for changes at most this often (seconds)
+_RELOAD_INTERVAL = 30
+
+_stats = None
+_last_check = 0.0
+# collection -> (has sparse vectors, monotonic time checked)
+_hybrid = {}
+
+
+def default_stats_path() -> str:
+    return os.getenv(
+        "SPARSE_STATS_PATH",
+        os.path.join(os.path.dirname(__file__), "..", "cache", "bm25_stats.json"),
+    )
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercased word tokens without stopwords. Identifiers such as INV-2026-001
+    are kept whole and also split into their parts, so both forms match.
+    """
+    tokens = []
+    for token in _TOKEN_RE.findall(unicodedata.normalize("NFKC", text).casefold()):
+        if token in _STOPWORDS:
+            continue
+        tokens.append(token)
+        parts = re.split(r"[-_./]", token)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p and p not in _STOPWORDS)
+    return tokens
+
+
+def term_index(term: str) -> int:
+    """Stable sparse index for a term (CRC32, identical in every process)."""
+    return zlib.crc32(term.encode("utf-8")) & 0x7FFFFFFF
+
+
+class BM25Stats:
+    def __init__(self, n_docs: int = 0, total_length: int = 0, df: dict | None = None):
+        self.n_docs = n_docs
+        self.total_length = total_length
+        self.df = df or {}
+        self.loaded_mtime = None
+
+    @property
+    def avg_length(self) -> float:
+        return self.total_length / self.n_docs if self.n_docs else 1.0
+
+    def add(self, tokens: list[str]):
+        """Count one more document (incremental refresh)."""
+        self.n_docs += 1
+        self.total_length += len(tokens)
+        for term in set(tokens):
+            self.df[term] = self.df.get(term, 0) + 1
+
+    def idf(self, term: str) -> float:
+        df = self.df.get(term, 0)
+        return math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+
+    def document_vector(self, text: str) -> SparseVector:
+        tokens = tokenize(text)
+        norm = 1 - B + B * len(tokens) / self.avg_length
+        weights = {}
+        for term, tf in Counter(tokens).items():
+            index = term_index(term)
+            weights[index] = weights.get(index, 0.0) + tf * (K1 + 1) / (tf + K1 * norm)
+        return SparseVector(indices=list(weights), values=list(weights.values()))
+
+    def query_vector(self, text: str) -> SparseVector:
+        weights = {}
+        for term in set(tokenize(text)):
+            index = term_index(term)
+            weights[index] = weights.get(index, 0.0) + self.idf(term)
+        return SparseVector(indices=list(weights), values=list(weights.values()))
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"n_docs": self.n_docs, "total_length": self.total_length, "df": self.df}, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Stats | None":
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            mtime = os.path.getmtime(path)
+        except (OSError, ValueError):
+            return None
+        stats = cls(data["n_docs"], data["total_length"], data["df"])
+        stats.loaded_mtime = mtime
+        return stats
+
+
+def hybrid_search_enabled() -> bool:
+    return os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+
+
+def get_bm25_stats() -> BM25Stats | None:
+    """Process-wide statistics, reloaded when the file changes; None until a backfill has run."""
+    global _stats, _last_check
+    if not hybrid_search_enabled():
+        return None
+    now = time.monotonic()
+    if _stats is not None and now - _last_check < _RELOAD_INTERVAL:
+        return _stats
+    _last_check = now
+    path = default_stats_path()
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return _stats
+    if _stats is None or mtime != _stats.loaded_mtime:
+        loaded = BM25Stats.load(path)
+        if loaded is not None:
+            print(f"BM25 statistics loaded: {loaded.n_docs} documents, {len(loaded.df)} terms")
+            _stats = loaded
+    return _stats
+
+
+async def is_hybrid(qdrant, collection: str) -> bool:
+    """Whether collection (or the collection behind an alias) has BM25 sparse vectors."""
+    now = time.monotonic()
+    checked = _hybrid.get(collection)
+    if checked is None or now - checked[1] >= _RELOAD_INTERVAL:
+        try:
+            info = await qdrant.get_collection(collection)
+            hybrid = SPARSE_VECTOR_NAME in (info.config.params.sparse_vectors or {})
+        except Exception:
+            hybrid = False
+        checked = (hybrid, now)
+        _hybrid[collection] = checked
+    return checked[0]
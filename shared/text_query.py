@@ -0,0 +1,57 @@
+"""
+Full-text operators in search queries, served by the TEXT index on "text".
+
+    "standing desk"   the chunk must contain these words
+    +laptop           the chunk must contain "laptop"
+    -refurbished      the chunk must not contain "refurbished" (also -"two words")
+
+Operators become MatchText conditions, so Qdrant narrows the candidates
+through the full-text index during the vector search instead of the app
+filtering results afterwards. Quoted phrases require all of their words
+(MatchText), not their exact order. The words of phrases and +terms stay in
+the text that is embedded; excluded words are removed from it. A query made
+only of exclusions has no text to embed and is answered by the filter alone.
+"""
+
+import re
+
+from qdrant_client.models import FieldCondition, Filter, MatchText
+
+_OPERATOR_RE = re.compile(r'([+-]?)"([^"]*)"|([+-]?)(\S+)')
+
+
+def parse_text_query(q: str) -> tuple[str, list, list]:
+    """Return (text to embed, must conditions, must_not conditions)."""
+    words, must, must_not = [], [], []
+    for quoted_op, phrase, op, word in _OPERATOR_RE.findall(q):
+        if not word:
+            # Quoted phrase; a bare "..." is required like +"..."
+            op, word = quoted_op or "+", phrase.strip()
+            if not word:
+                continue
+        if op == "-":
+            must_not.append(FieldCondition(key="text", match=MatchText(text=word)))
+            continue
+        if op == "+":
+            must.append(FieldCondition(key="text", match=MatchText(text=word)))
+        if word not in ("+", "-"):
+            words.append(word)
+    return " ".join(words), must, must_not
+
+
+def _as_list(conditions) -> list:
+    if conditions is None:
+        return []
+    return conditions if isinstance(conditions, list) else [conditions]
+
+
+def combine_filter(base: Filter | None, must: list, must_not: list) -> Filter | None:
+    """Add text conditions to an existing filter (or None when there is nothing to filter on)."""
+    if base is None and not must and not must_not:
+        return None
+    base = base or Filter()
+    return Filter(
+        must=[*_as_list(base.must), *must] or None,
+        should=base.should,
+        must_not=[*_as_list(base.must_not), *must_not] or None,
+    )